@@ -0,0 +1,119 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+# Per-process cache of tutor answers. Entries are grouped by
+# (document_id, language, retrieved chunk ids), so an answer is only reused
+# when the model would have seen exactly the same document context.
+# Documents are never edited after upload (a changed file is a new document
+# with a new id), so entries only leave by TTL or LRU eviction.
+#
+#   exact tier     normalized message text must match
+#   semantic tier  query embedding within ANSWER_CACHE_SIMILARITY (cosine)
+#                  of a cached query; opt-in with ANSWER_CACHE_SEMANTIC=1
+#
+# ANSWER_CACHE=0 turns the cache off entirely. numpy is imported on first
+# use, like the other heavy modules the app loads (see app.preload()).
+
+_WHITESPACE = re.compile(r'\s+')
+_TRAILING_PUNCTUATION = re.compile(r'[\s?!.।,;:]+$')
+
+
+def normalize_message(message):
+    text = _WHITESPACE.sub(' ', message.strip().lower())
+    return _TRAILING_PUNCTUATION.sub('', text)
+
+
+class AnswerCache:
+
+    def __init__(self, max_groups=2048, max_per_group=32, ttl_seconds=24 * 3600,
+                 semantic=False, similarity_threshold=0.95, enabled=True):
+        self.enabled = enabled
+        self.max_groups = max_groups
+        self.max_per_group = max_per_group
+        self.ttl_seconds = ttl_seconds
+        self.semantic = semantic
+        self.similarity_threshold = similarity_threshold
+        self._groups = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cacheable(self, chat_history, wrong_questions, chunk_ids):
+        # History and wrong-question context change what the tutor should
+        # say, so those requests always go to the model.
+        return self.enabled and not chat_history and not wrong_questions and chunk_ids is not None
+
+    @staticmethod
+    def _group_key(document_id, language, chunk_ids):
+        # Callers pass the parsed integer id (app.parse_document_id)
+        return (document_id, language, tuple(chunk_ids))
+
+    def get(self, document_id, language, chunk_ids, message, query_embedding=None):
+        group_key = self._group_key(document_id, language, chunk_ids)
+        normalized = normalize_message(message)
+        now = time.time()
+
+        with self._lock:
+            group = self._groups.get(group_key)
+            if group is not None:
+                self._groups.move_to_end(group_key)
+                entry = group.get(normalized)
+                if entry is not None and now - entry['stored_at'] <= self.ttl_seconds:
+                    metrics.record_cache('answer_exact', True)
+                    return entry['answer']
+            metrics.record_cache('answer_exact', False)
+
+            if not self.semantic or query_embedding is None or not group:
+                return None
+
+            candidates = [e for e in group.values() if e['embedding'] is not None
+                          and now - e['stored_at'] <= self.ttl_seconds]
+
+        if candidates:
+            import numpy as np
+            query = np.asarray(query_embedding, dtype=float)
+            matrix = np.vstack([e['embedding'] for e in candidates])
+            norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+            norms[norms == 0] = 1e-9
+            similarities = matrix @ query / norms
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.similarity_threshold:
+                metrics.record_cache('answer_semantic', True)
+                return candidates[best]['answer']
+        metrics.record_cache('answer_semantic', False)
+        return None
+
+    def put(self, document_id, language, chunk_ids, message, answer, query_embedding=None):
+        group_key = self._group_key(document_id, language, chunk_ids)
+        import numpy as np
+        normalized = normalize_message(message)
+        entry = {
+            'answer': answer,
+            'embedding': np.asarray(query_embedding, dtype=float) if query_embedding is not None else None,
+            'stored_at': time.time(),
+        }
+        with self._lock:
+            group = self._groups.get(group_key)
+            if group is None:
+                group = self._groups[group_key] = OrderedDict()
+            self._groups.move_to_end(group_key)
+            group[normalized] = entry
+            group.move_to_end(normalized)
+            while len(group) > self.max_per_group:
+                group.popitem(last=False)
+            while len(self._groups) > self.max_groups:
+                self._groups.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._groups.clear()
+
+
+answer_cache = AnswerCache(
+    enabled=os.getenv('ANSWER_CACHE', '1') != '0',
+    semantic=os.getenv('ANSWER_CACHE_SEMANTIC', '0') == '1',
+    similarity_threshold=float(os.getenv('ANSWER_CACHE_SIMILARITY', '0.95')),
+)
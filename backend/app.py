@@ -1,320 +1,558 @@
-from flask import Flask, request, jsonify, Response
+from flask import Flask, Blueprint, request, jsonify, Response, make_response
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import google.generativeai as genai
 import json
 import hashlib
+import threading
 import time
 from document_processor import DocumentProcessor
-from database import Database
+from database import open_database
+import metrics
+from answer_cache import answer_cache
+import http_cache
+import profiling
+import prompt_builder
+from conversations import ConversationMemory
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from embedding_pipeline import EmbeddingPipeline, EmbeddingError
+import question_planner
+import prompt_registry
+import question_parser
+from question_parser import QuestionParseError
+from logger import get_logger, set_request_id, request_id_var
 import os
 from dotenv import load_dotenv
-import numpy as np
-from numpy.linalg import norm
 
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app)
+# Routes live on the `api` blueprint and create_app() assembles the Flask app
+# and the storage and services behind it (db, doc_processor, ...), so
+# importing this module stays cheap: it opens no database, numpy, the LLM SDK
+# and the PDF/DOCX parsers are imported on first use (or by preload() in a
+# preloading server master), and the schema is only migrated when it is
+# behind. `app` is the default instance for `python app.py`, `gunicorn
+# app:app` and asgi.py; it and the services are created on first access.
+
+api = Blueprint('api', __name__)
+
+log = get_logger('app')
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """jsonify() with its time counted as the 'serialization' phase"""
+
+    def dumps(self, obj, **kwargs):
+        with metrics.span('serialization'):
+            return super().dumps(obj, **kwargs)
+
+def start_request_timer():
+    request.environ['study_assistant.started'] = time.perf_counter()
+    set_request_id(request.headers.get('X-Request-ID'))
+    request.environ['study_assistant.phases'] = profiling.slow_requests.start()
+
+def record_request_latency(response):
+    started = request.environ.get('study_assistant.started')
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request(endpoint, request.method, response.status_code, time.perf_counter() - started)
+    response.headers['X-Request-ID'] = request_id_var.get() or ''
+    return response
+
+def capture_slow_request(response):
+    """Hand the request's phase breakdown to the slow-request log; streams are timed until they close"""
+    phases = request.environ.get('study_assistant.phases')
+    if phases is None:
+        return response
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    args = (phases, request.method, request.path, endpoint, response.status_code, request_id_var.get())
+    if response.is_streamed:
+        response.call_on_close(lambda: profiling.slow_requests.finish(*args, streamed=True))
+    else:
+        profiling.slow_requests.finish(*args)
+    return response
+
+def compress_response(response):
+    """gzip/brotli for large JSON bodies; streamed (SSE) and pre-encoded responses are left alone"""
+    if (response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers
+            or response.mimetype not in http_cache.COMPRESSIBLE_TYPES):
+        return response
+    body = response.get_data()
+    if len(body) < http_cache.COMPRESS_MIN_BYTES:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = http_cache.choose_encoding(request.accept_encodings)
+    if encoding:
+        with metrics.span('compression'):
+            response.set_data(http_cache.compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def cached_json(key, tables, compute):
+    """JSON response for a read endpoint with an ETag from the change counters of `tables`.
+
+    `compute` returns the payload, or a ready response (e.g. a 404) that is sent uncached.
+    """
+    if not http_cache.ENABLED:
+        result = compute()
+        return result if isinstance(result, Response) else jsonify(result)
+
+    versions = db.get_table_versions(tables)
+    etag = http_cache.make_etag(key, versions)
+    not_modified = request.if_none_match.contains_weak(etag)
+    metrics.record_cache('http_etag', not_modified)
+    if not_modified:
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+
+    entry = http_cache.response_memo.get(key, versions)
+    metrics.record_cache('response_memo', entry is not None)
+    if entry is None:
+        result = compute()
+        if isinstance(result, Response):
+            return result
+        entry = http_cache.response_memo.put(key, versions, jsonify(result).get_data())
+
+    response = Response(entry['body'], mimetype='application/json')
+    if len(entry['body']) >= http_cache.COMPRESS_MIN_BYTES:
+        response.vary.add('Accept-Encoding')
+        encoding = http_cache.choose_encoding(request.accept_encodings)
+        if encoding:
+            with metrics.span('compression'):
+                response.set_data(http_cache.response_memo.encoded(entry, encoding))
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag, weak=True)
+    # Browsers keep the body and revalidate it with If-None-Match on every fetch
+    response.cache_control.no_cache = True
+    return response
+
+_genai = None
+_generation_model = None
+_llm_lock = threading.Lock()
+
+def get_genai():
+    """The LLM SDK module, imported and configured on first use (it is by far the slowest import)"""
+    global _genai
+    if _genai is None:
+        with _llm_lock:
+            if _genai is None:
+                if os.getenv('LLM_BACKEND') == 'stub':
+                    import stub_llm as genai
+                else:
+                    import google.generativeai as genai
+                genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+                _genai = genai
+    return _genai
+
+def get_generation_model():
+    global _generation_model
+    if _generation_model is None:
+        genai = get_genai()
+        with _llm_lock:
+            if _generation_model is None:
+                _generation_model = genai.GenerativeModel('gemini-2.0-flash-exp')
+    return _generation_model
 
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+document_embeddings_cache = {}
 
-generation_model = genai.GenerativeModel('gemini-2.0-flash-exp') 
+def embed_content(**kwargs):
+    with metrics.span('embedding'):
+        return get_genai().embed_content(**kwargs)
 
-db = Database()
-doc_processor = DocumentProcessor()
+def generate_content(kind, prompt, prompt_version=None):
+    started = time.perf_counter()
+    with metrics.span('llm'):
+        try:
+            response = get_generation_model().generate_content(prompt)
+        except Exception:
+            metrics.record_llm_call(kind, prompt, outcome='error', prompt_version=prompt_version,
+                                    seconds=time.perf_counter() - started)
+            raise
+    metrics.record_llm_call(kind, prompt, response, prompt_version=prompt_version,
+                            seconds=time.perf_counter() - started)
+    return response
+
+def stream_content(kind, prompt, prompt_version=None):
+    """generate_content with stream=True: yields the text of each piece as the model sends it.
+    Only the waits for the model count as 'llm' time, not the caller's work between pieces."""
+    waited = 0.0
+    pieces = None
+    try:
+        while True:
+            started = time.perf_counter()
+            with metrics.span('llm'):
+                if pieces is None:
+                    response = get_generation_model().generate_content(prompt, stream=True)
+                    pieces = iter(response)
+                piece = next(pieces, None)
+            waited += time.perf_counter() - started
+            if piece is None:
+                break
+            yield piece.text
+    except Exception:
+        metrics.record_llm_call(kind, prompt, outcome='error', prompt_version=prompt_version,
+                                seconds=waited + time.perf_counter() - started)
+        raise
+    metrics.record_llm_call(kind, prompt, response, prompt_version=prompt_version, seconds=waited)
 
-document_embeddings_cache = {}
+LEXICAL_CANDIDATES = 50
+FIRST_STAGE_MIN_CHUNKS = 5000
 
-def get_document_chunks(document_text):
-    chunks = document_text.split('\n\n')
-    return [chunk for chunk in chunks if chunk.strip() and len(chunk.split()) > 10]
+CHUNK_WORDS = 200
 
-def get_or_create_document_embeddings(document_id, document_text):
-    if document_id in document_embeddings_cache:
-        return document_embeddings_cache[document_id]
+def get_document_chunks(document_text):
+    chunks = []
+    for chunk in document_text.split('\n\n'):
+        words = chunk.split()
+        if len(words) <= 10:
+            continue
+        if len(words) <= CHUNK_WORDS * 3 // 2:
+            chunks.append(chunk)
+            continue
+        # Extracted text usually has its paragraph breaks collapsed; fall back to word windows
+        for start in range(0, len(words), CHUNK_WORDS):
+            chunks.append(' '.join(words[start:start + CHUNK_WORDS]))
     
-    print(f"Creating new embeddings for document {document_id}...")
+    if not chunks and document_text.strip():
+        chunks = [document_text]
+    return chunks
+
+# A document whose embeddings could not be completed is served lexical-only
+# for this long before its missing batches are retried
+EMBEDDING_RETRY_SECONDS = 60
+embedding_failures = {}
+
+def get_or_create_document_embeddings(document_id, document_text=None):
+    """(chunks, embeddings, embedding model); no embeddings and no model while they can't be made"""
+    cached = document_embeddings_cache.get(document_id)
+    metrics.record_cache('document_embeddings', cached is not None)
+    if cached is not None:
+        return cached
+    
+    if document_text is None:
+        document_text = db.get_document_content(document_id) or ''
     chunks = get_document_chunks(document_text)
+
+    failed_at = embedding_failures.get(document_id)
+    if failed_at is not None and time.monotonic() - failed_at < EMBEDDING_RETRY_SECONDS:
+        return chunks, [], None
     
-    if not chunks:
-        chunks = [document_text]
-        
+    log.info("embeddings_create", document_id=document_id, chunks=len(chunks))
     try:
-        response = genai.embed_content(
-            model='models/text-embedding-004',
-            task_type="retrieval_document",
-            content=chunks
-        )
-        embeddings = response['embedding']
-        document_embeddings_cache[document_id] = (chunks, embeddings)
-        print(f"Embeddings cached for document {document_id}")
-        return chunks, embeddings
-    except Exception as e:
-        print(f"Error creating embeddings: {e}")
+        model, embeddings = embedding_pipeline.embed(document_id, chunks)
+    except EmbeddingError as e:
+        log.error("embeddings_incomplete", document_id=document_id, failed_batches=e.failed,
+                  batches=e.total, error=str(e))
+        embedding_failures[document_id] = time.monotonic()
+        return chunks, [], None
+
+    import numpy as np
+    # One float32 matrix per document: half the memory of float64, and ranking reads it without a copy
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    embedding_failures.pop(document_id, None)
+    document_embeddings_cache[document_id] = (chunks, embeddings, model)
+    log.info("embeddings_cached", document_id=document_id, chunks=len(chunks), model=model)
+    return chunks, embeddings, model
+
+
+# Each document is embedded with one of these models, the first that works
+# for all of its batches (see EmbeddingPipeline); queries and other texts
+# compared with a document are embedded with that document's model
+EMBEDDING_MODELS = ('models/text-embedding-004', 'models/embedding-001')
+
+
+def embed_documents(texts, model):
+    response = embed_content(
+        model=model,
+        task_type="retrieval_document",
+        content=texts
+    )
+    return response['embedding']
+
+
+def embed_query(user_query, model):
+    query_response = embed_content(
+        model=model,
+        task_type="retrieval_query",
+        content=user_query
+    )
+    return query_response['embedding']
+
+
+def rank_by_similarity(query_embedding, doc_embeddings, candidates=None):
+    """Chunk indices by cosine similarity, best first. `doc_embeddings` is the cached float32
+    matrix (used without a copy); with `candidates`, only those rows are read."""
+    import numpy as np
+    from numpy.linalg import norm
+
+    matrix = np.asarray(doc_embeddings, dtype=np.float32)
+    if candidates is None:
+        indices = np.arange(len(matrix))
+    else:
+        indices = np.asarray(candidates, dtype=np.intp)
+        matrix = matrix[indices]
+    query_embedding = np.asarray(query_embedding, dtype=np.float32)
+    
+    dot_products = matrix @ query_embedding
+    norms = norm(matrix, axis=1) * norm(query_embedding)
+    
+    norms[norms == 0] = 1e-9
+    
+    similarities = dot_products / norms
+    
+    return [int(indices[i]) for i in np.argsort(similarities)[::-1]]
+
+
+def retrieve_context(user_query, doc_chunks, doc_embeddings, top_k=3, document_id=None, embedding_model=None):
+    """Hybrid BM25 + vector retrieval fused with reciprocal-rank fusion; `embedding_model` is the
+    one doc_embeddings were made with (lexical only without it).
+    Returns (relevant chunk texts, their chunk ids, query embedding); ids are None on failure"""
+    lexical_ranking = []
+    if document_id is not None:
+        if not doc_chunks:
+            doc_chunks = get_document_chunks(db.get_document_content(document_id) or '')
         try:
-            response = genai.embed_content(
-                model='models/embedding-001',
-                task_type="retrieval_document",
-                content=chunks
-            )
-            embeddings = response['embedding']
-            document_embeddings_cache[document_id] = (chunks, embeddings)
-            print(f"Embeddings cached for document {document_id} using fallback model")
-            return chunks, embeddings
-        except Exception as e2:
-            print(f"Fallback embedding error: {e2}")
-            document_embeddings_cache[document_id] = ([], [])
-            return [], []
+            with metrics.span('lexical'):
+                index = lexical_index.ensure(document_id, doc_chunks)
+                lexical_ranking = [i for i, _ in index.search(user_query, LEXICAL_CANDIDATES)]
+        except Exception as e:
+            log.warning("lexical_retrieval_error", document_id=document_id, error=str(e))
+    
+    if not doc_chunks:
+        return ["(Document context not available)"], None, None
+    
+    query_embedding = None
+    vector_ranking = []
+    if len(doc_embeddings) and embedding_model:
+        try:
+            query_embedding = embed_query(user_query, embedding_model)
+        except Exception as e:
+            log.warning("query_embedding_error", error=str(e))
+    
+    if query_embedding is not None:
+        try:
+            with metrics.span('similarity'):
+                # On very large documents the lexical hits act as a first-stage filter
+                candidates = lexical_ranking if lexical_ranking and len(doc_embeddings) >= FIRST_STAGE_MIN_CHUNKS else None
+                vector_ranking = rank_by_similarity(query_embedding, doc_embeddings, candidates)[:LEXICAL_CANDIDATES]
+        except Exception as e:
+            log.error("retrieval_error", error=str(e))
+            if not lexical_ranking:
+                return [f"(Error retrieving document context: {e})"], None, query_embedding
+    
+    top_indices = reciprocal_rank_fusion(vector_ranking, lexical_ranking)[:top_k]
+    if not top_indices:
+        top_indices = list(range(min(top_k, len(doc_chunks))))
+    
+    return [doc_chunks[i] for i in top_indices], top_indices, query_embedding
 
 
-def find_relevant_chunks(user_query, doc_chunks, doc_embeddings):
-    if not doc_chunks or not doc_embeddings:
-        return ["(Document context not available)"]
+def find_relevant_chunks(user_query, doc_chunks, doc_embeddings, document_id=None, embedding_model=None):
+    return retrieve_context(user_query, doc_chunks, doc_embeddings, document_id=document_id,
+                            embedding_model=embedding_model)[0]
 
-    try:
-        query_response = genai.embed_content(
-            model='models/text-embedding-004',
-            task_type="retrieval_query",
-            content=user_query
-        )
-        query_embedding = query_response['embedding']
-    except Exception:
-        query_response = genai.embed_content(
-            model='models/embedding-001',
-            task_type="retrieval_query",
-            content=user_query
-        )
-        query_embedding = query_response['embedding']
-        
-    try:
-        dot_products = np.dot(doc_embeddings, query_embedding)
-        norms = norm(doc_embeddings, axis=1) * norm(query_embedding)
-        
-        norms[norms == 0] = 1e-9
-        
-        similarities = dot_products / norms
-        
-        top_indices = np.argsort(similarities)[-3:][::-1]
-        
-        return [doc_chunks[i] for i in top_indices]
-    except Exception as e:
-        print(f"Error finding relevant chunks: {e}")
-        return [f"(Error retrieving document context: {e})"]
-
-
-def calculate_question_count(word_count):
-    if word_count < 100:
-        return 5
-    elif word_count < 300:
-        return 10
-    elif word_count < 500:
-        return 15
-    elif word_count < 1000:
-        return 20
-    else:
-        return min(50, (word_count // 100) * 2)
 
-def get_prompt_template(language='en', difficulty='medium'):
-    difficulty_instructions = {
-        'easy': {
-            'en': 'Focus on basic application and straightforward analysis. Questions should test fundamental understanding.',
-            'bn': 'মৌলিক প্রয়োগ এবং সরল বিশ্লেষণে ফোকাস করুন। প্রশ্নগুলি মৌলিক বোঝাপড়া পরীক্ষা করবে।'
-        },
-        'medium': {
-            'en': 'Require synthesis of multiple concepts and deeper evaluation. Balance between application and analysis.',
-            'bn': 'একাধিক ধারণার সংশ্লেষণ এবং গভীর মূল্যায়ন প্রয়োজন। প্রয়োগ এবং বিশ্লেষণের মধ্যে ভারসাম্য।'
-        },
-        'hard': {
-            'en': 'Demand complex evaluation, creation of solutions, and advanced critical thinking. Highly challenging questions.',
-            'bn': 'জটিল মূল্যায়ন, সমাধান সৃষ্টি এবং উন্নত সমালোচনামূলক চিন্তাভাবনা প্রয়োজন। অত্যন্ত চ্যালেঞ্জিং প্রশ্ন।'
-        }
-    }
-    
-    prompts = {
-        'en': f"""
-You are an expert educator specialized in creating INFERENTIAL and CRITICAL THINKING questions.
-
-DIFFICULTY LEVEL: {difficulty.upper()}
-{difficulty_instructions[difficulty]['en']}
-
-DOCUMENT CONTENT:
-{{document_text}}
-
-PREVIOUSLY GENERATED QUESTIONS (DO NOT REPEAT):
-{{previous_questions}}
-
-TASK: Generate 1 UNIQUE Multiple Choice Question (MCQ) that requires:
-- Deep comprehension and analysis (NOT just fact recall)
-- Connecting multiple concepts from the document
-- Drawing logical conclusions
-- Applying knowledge to new scenarios
-- Understanding implicit meanings
-
-COGNITIVE LEVELS TO USE (vary across questions):
-- Apply: How would this concept work in situation X?
-- Analyze: What's the relationship between A and B?
-- Evaluate: Which approach would be most effective and why?
-- Create: How could you combine these ideas to solve Y?
-
-RULES:
-1. NO direct fact-recall questions
-2. Answer should NOT be explicitly stated in text
-3. Require synthesis of multiple document parts
-4. All 4 options must be plausible (no obviously wrong answers)
-5. Question must test analytical/critical thinking
-6. Ensure this question is DIFFERENT from all previous questions
-
-OUTPUT FORMAT (JSON only):
-{{{{
-  "question": "The inferential question text",
-  "options": {{{{
-    "A": "Option 1",
-    "B": "Option 2",
-    "C": "Option 3",
-    "D": "Option 4"
-  }}}},
-  "correct_answer": "A",
-  "explanation": "Detailed explanation with reasoning",
-  "cognitive_level": "Analyze"
-}}}}
-
-CRITICAL: Output ONLY valid JSON. No markdown, no extra text.
-""",
-        'bn': f"""
-আপনি একজন বিশেষজ্ঞ শিক্ষাবিদ যিনি অনুমানমূলক এবং সমালোচনামূলক চিন্তাভাবনা প্রশ্ন তৈরিতে দক্ষ।
-
-কঠিনতার স্তর: {difficulty.upper()}
-{difficulty_instructions[difficulty]['bn']}
-
-নথির বিষয়বস্তু:
-{{document_text}}
-
-পূর্বে তৈরি প্রশ্ন (পুনরাবৃত্তি করবেন না):
-{{previous_questions}}
-
-কাজ: ১টি অনন্য বহুনির্বাচনী প্রশ্ন (MCQ) তৈরি করুন যার জন্য প্রয়োজন:
-- গভীর বোঝাপড়া এবং বিশ্লেষণ (শুধুমাত্র তথ্য মুখস্থ নয়)
-- নথি থেকে একাধিক ধারণা সংযুক্ত করা
-- যৌক্তিক সিদ্ধান্তে উপনীত হওয়া
-- নতুন পরিস্থিতিতে জ্ঞান প্রয়োগ করা
-- অন্তর্নিহিত অর্থ বোঝা
-
-জ্ঞানীয় স্তর ব্যবহার করুন (প্রশ্ন জুড়ে বৈচিত্র্য):
-- প্রয়োগ: এই ধারণাটি X পরিস্থিতিতে কীভাবে কাজ করবে?
-- বিশ্লেষণ: A এবং B এর মধ্যে সম্পর্ক কী?
-- মূল্যায়ন: কোন পদ্ধতি সবচেয়ে কার্যকর হবে এবং কেন?
-- সৃষ্টি: Y সমাধানের জন্য এই ধারণাগুলি কীভাবে একত্রিত করবেন?
-
-নিয়ম:
-1. সরাসরি তথ্য-স্মরণ প্রশ্ন নয়
-2. উত্তর পাঠ্যে স্পষ্টভাবে উল্লেখ করা উচিত নয়
-3. নথির একাধিক অংশের সংশ্লেষণ প্রয়োজন
-4. সব ৪টি বিকল্প যুক্তিসঙ্গত হতে হবে (স্পষ্টতই ভুল উত্তর নয়)
-5. প্রশ্ন বিশ্লেষণাত্মক/সমালোচনামূলক চিন্তাভাবনা পরীক্ষা করবে
-6. এই প্রশ্নটি পূর্বের সব প্রশ্ন থেকে আলাদা হতে হবে
-
-আউটপুট ফর্ম্যাট (শুধুমাত্র JSON):
-{{{{
-  "question": "অনুমানমূলক প্রশ্নের টেক্সট",
-  "options": {{{{
-    "A": "বিকল্প ১",
-    "B": "বিকল্প ২",
-    "C": "বিকল্প ৩",
-    "D": "বিকল্প ৪"
-  }}}},
-  "correct_answer": "A",
-  "explanation": "যুক্তি সহ বিস্তারিত ব্যাখ্যা",
-  "cognitive_level": "বিশ্লেষণ"
-}}}}
-
-গুরুত্বপূর্ণ: শুধুমাত্র বৈধ JSON আউটপুট করুন। কোন মার্কডাউন, অতিরিক্ত টেক্সট নয়।
-"""
-    }
+def plan_generation(document_id, question_count=None):
+    """Per-section question quotas for a document; see question_planner"""
+    chunks, embeddings, embedding_model = get_or_create_document_embeddings(document_id)
+    if not chunks:
+        chunks = get_document_chunks(db.get_document_content(document_id) or '')
+    previous_q_texts = [q['question_text'] for q in db.get_questions_by_document(document_id)]
     
-    return prompts.get(language, prompts['en'])
+    with metrics.span('planning'):
+        sections = question_planner.plan_questions(
+            chunks, embeddings, previous_q_texts, question_count,
+            embed_texts=embed_documents, embedding_model=embedding_model
+        )
+    log.info("generation_planned", document_id=document_id, requested=question_count,
+             **question_planner.plan_summary(sections))
+    return sections
 
-def stream_questions(document_text, question_count, document_id, difficulty='medium', language='en'):
-    previous_questions = db.get_questions_by_document(document_id)
-    previous_q_texts = [q['question_text'] for q in previous_questions]
+def get_prompt_template(language='en', difficulty='medium'):
+    return prompt_registry.question_template(language, difficulty)
+
+MAX_GENERATION_RETRIES = 5
+
+def sse_event(payload):
+    with metrics.span('serialization'):
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def build_question_prompt(prompt_template, document_text, previous_q_texts):
+    recent_previous_q_texts = previous_q_texts[-5:]
+    return prompt_template.render(
+        document_text=document_text,
+        previous_questions='\n'.join(recent_previous_q_texts) if recent_previous_q_texts else 'None'
+    )
+
+def store_generated_question(document_id, question_data):
+    """Persist a generated question; returns its id, or None if it is a duplicate"""
+    question_hash = hashlib.md5(
+        question_data['question'].encode('utf-8')
+    ).hexdigest()
     
-    prompt_template = get_prompt_template(language, difficulty)
+    if db.question_exists(document_id, question_hash):
+        return None
     
-    generated_count = 0
-    max_retries = 5 
-    retries = 0
+    return db.save_question(document_id, question_data, question_hash)
+
+def retries_exhausted_event():
+    return sse_event({
+        'error': f"Failed to generate questions after {MAX_GENERATION_RETRIES} attempts. Please check API key or network.",
+        'status': 'failed'
+    })
+
+def generation_failed_event(generated_count):
+    return sse_event({
+        'error': f"Failed to generate question {generated_count+1}", 
+        'details': "AI response was not valid JSON or generation failed.",
+        'status': 'retrying'
+    })
+
+def planned_event(sections):
+    return sse_event(dict(question_planner.plan_summary(sections), status='planned'))
+
+class QuestionStream:
+    """One generation run over planned sections, shared by stream_questions and
+    the async server's stream. Each attempt is one streamed model call for the
+    next section: next_prompt() builds its prompt, parse() turns each piece of
+    the response into the questions it completed and store() saves them and
+    returns their SSE events, so a question goes out as soon as it parses.
+    outcome() (or failed(), if the call raised) then gives the attempt's
+    closing events and the seconds to pause before the next one."""
+
+    def __init__(self, sections, document_id, difficulty='medium', language='en'):
+        self.sections = sections
+        self.document_id = document_id
+        self.prompt_template = get_prompt_template(language, difficulty)
+        self.order = question_planner.schedule(sections)
+        self.question_count = len(self.order)
+        self.generated_count = 0
+        self.retries = 0
+        self.stopped = False
+        self._parser = None
+        self._section = None
+        self._stored = 0
+
+    @property
+    def finished(self):
+        return self.stopped or self.generated_count >= self.question_count
+
+    @property
+    def prompt_version(self):
+        return self.prompt_template.label
+
+    def next_prompt(self):
+        """Prompt for the next model call; None, and the run stops, once the retries are used up"""
+        if self.retries >= MAX_GENERATION_RETRIES:
+            log.warning("generation_retries_exhausted", document_id=self.document_id, generated=self.generated_count)
+            metrics.generation_retries.inc(reason='exhausted')
+            self.stopped = True
+            return None
+
+        self._parser = question_parser.QuestionStreamParser()
+        self._stored = 0
+        self._section = self.sections[self.order[self.generated_count]]
+        with metrics.span('prompt_build'):
+            return build_question_prompt(self.prompt_template, self._section['text'], self._section['previous'])
+
+    def parse(self, text=None):
+        """Questions completed by this piece of the response; None for the end of it"""
+        return self._parser.feed(text) if text is not None else self._parser.close()
+
+    def store(self, questions):
+        """Save new questions (up to the run's total) and return their SSE events; writes to the database"""
+        events = []
+        for question_data in questions:
+            if self.finished:
+                break
+            db_question_id = store_generated_question(self.document_id, question_data)
+            if not db_question_id:
+                log.sampled("generation_duplicate", document_id=self.document_id)
+                continue
+            self._section['previous'].append(question_data['question'])
+            question_data['id'] = db_question_id
+            self.generated_count += 1
+            self._stored += 1
+            events.append(sse_event(question_data))
+        return events
+
+    def outcome(self):
+        """(events, pause) once the whole response has been parsed and stored"""
+        if self._stored:
+            self.retries = 0
+            return [], 0.5
+        error = self._parser.error()
+        if error is not None:
+            log.warning("generation_invalid", document_id=self.document_id, question_index=self.generated_count,
+                        error=str(error), response_preview=self._parser.preview)
+            metrics.generation_retries.inc(reason='invalid')
+            self.retries += 1
+            return [generation_failed_event(self.generated_count)], 0
+        metrics.generation_retries.inc(reason='duplicate')
+        self.retries += 1
+        return [], 0
+
+    def failed(self, error):
+        """(events, pause) after the model call raised; questions it already streamed are kept"""
+        log.warning("generation_error", document_id=self.document_id, question_index=self.generated_count,
+                    error=str(error))
+        if self._stored:
+            self.retries = 0
+            return [], 0.5
+        metrics.generation_retries.inc(reason='error')
+        self.retries += 1
+        return [generation_failed_event(self.generated_count)], 1
+
+    def done_event(self):
+        log.info("generation_finished", document_id=self.document_id, generated=self.generated_count)
+        return sse_event({'status': 'done'})
+
+def stream_questions(sections, document_id, difficulty='medium', language='en'):
+    run = QuestionStream(sections, document_id, difficulty, language)
+    yield planned_event(sections)
     
-    while generated_count < question_count:
-        
-        if retries >= max_retries:
-            print(f"Max retries reached for doc {document_id}. Stopping generation.")
-            error_message = json.dumps({
-                'error': f"Failed to generate questions after {max_retries} attempts. Please check API key or network.",
-                'status': 'failed'
-            })
-            yield f"data: {error_message}\n\n"
-            break 
-
-        recent_previous_q_texts = previous_q_texts[-5:]
-        
-        prompt = prompt_template.format(
-            document_text=document_text,
-            previous_questions='\n'.join(recent_previous_q_texts) if recent_previous_q_texts else 'None'
-        )
-        
+    while not run.finished:
+        prompt = run.next_prompt()
+        if prompt is None:
+            yield retries_exhausted_event()
+            break
         try:
-            response = generation_model.generate_content(prompt)
-            response_text = response.text.strip()
-            
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}') + 1
-            
-            if json_start == -1 or json_end == 0:
-                raise Exception("No JSON found in response")
-                
-            response_text = response_text[json_start:json_end]
-            
-            question_data = json.loads(response_text)
-            
-            if not all(k in question_data for k in ['question', 'options', 'correct_answer', 'explanation']):
-                 raise Exception("Incomplete JSON response from model")
-            
-            question_hash = hashlib.md5(
-                question_data['question'].encode('utf-8')
-            ).hexdigest()
-            
-            if not db.question_exists(document_id, question_hash):
-                db_question_id = db.save_question(document_id, question_data, question_hash)
-                
-                if db_question_id:
-                    previous_q_texts.append(question_data['question'])
-                    question_data['id'] = db_question_id
-                    generated_count += 1
-                    retries = 0 
-                    yield f"data: {json.dumps(question_data, ensure_ascii=False)}\n\n"
-            else:
-                print("Duplicate question skipped.")
-                retries += 1 
-                continue
-                
+            for text in stream_content('question', prompt, run.prompt_version):
+                yield from run.store(run.parse(text))
+            yield from run.store(run.parse())
         except Exception as e:
-            print(f"Error generating question {generated_count}: {e}")
-            print(f"Problematic response text: {response_text}")
-            retries += 1 
-            error_message = json.dumps({
-                'error': f"Failed to generate question {generated_count+1}", 
-                'details': "AI response was not valid JSON or generation failed.",
-                'status': 'retrying'
-            })
-            yield f"data: {error_message}\n\n"
-            time.sleep(1) 
-            continue
+            events, pause = run.failed(e)
+        else:
+            events, pause = run.outcome()
+        yield from events
+        if pause and not run.finished:
+            time.sleep(pause)
+
+    yield run.done_event()
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',
+    'Connection': 'keep-alive'
+}
+
+def parse_generation_options(document, args):
+    question_count = args.get('count', type=int)
+    difficulty = args.get('difficulty', default='medium')
+    language = args.get('language', default=document.get('language', 'en'))
+    
+    # No count lets the planner decide from the document's uncovered sections
+    if question_count is not None and (question_count < 1 or question_count > 50):
+        question_count = min(50, max(1, question_count))
+    
+    if difficulty not in ['easy', 'medium', 'hard']:
+        difficulty = 'medium'
         
-        time.sleep(0.5)
-
-    print(f"Finished generating {generated_count} questions for doc {document_id}")
-    yield f"data: {json.dumps({'status': 'done'})}\n\n"
+    if language not in ['en', 'bn']:
+        language = 'en'
+    
+    return question_count, difficulty, language
 
-@app.route('/api/upload', methods=['POST'])
+@api.route('/api/upload', methods=['POST'])
 def upload_document():
     try:
         if 'file' not in request.files:
@@ -326,7 +564,8 @@ def upload_document():
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
         
-        text_content = doc_processor.extract_text(file)
+        with metrics.span('extraction'):
+            text_content = doc_processor.extract_text(file)
         
         if not text_content:
             return jsonify({'error': 'Could not extract text from document'}), 400
@@ -343,10 +582,15 @@ def upload_document():
             language=language
         )
         
+        try:
+            lexical_index.build(document_id, get_document_chunks(text_content))
+        except Exception as e:
+            log.warning("lexical_index_failed", document_id=document_id, error=str(e))
+        
         try:
             get_or_create_document_embeddings(document_id, text_content)
         except Exception as e:
-            print(f"Warning: Failed to pre-cache embeddings for doc {document_id}: {e}")
+            log.warning("embeddings_precache_failed", document_id=document_id, error=str(e))
         
         return jsonify({
             'document_id': document_id,
@@ -355,70 +599,57 @@ def upload_document():
         })
         
     except Exception as e:
-        print(f"Error in upload: {e}")
+        log.exception("upload_error", error=str(e))
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/generate-questions/<int:document_id>', methods=['GET'])
+@api.route('/api/generate-questions/<int:document_id>', methods=['GET'])
 def generate_questions(document_id):
     try:
-        document = db.get_document(document_id)
+        document = db.get_document_meta(document_id)
         
         if not document:
             return jsonify({'error': 'Document not found'}), 404
         
-        question_count = request.args.get('count', type=int)
-        difficulty = request.args.get('difficulty', default='medium')
-        language = request.args.get('language', default=document.get('language', 'en'))
-        
-        if not question_count:
-            question_count = 10 
-            
-        if question_count < 1 or question_count > 50:
-            question_count = min(50, max(1, question_count))
-        
-        if difficulty not in ['easy', 'medium', 'hard']:
-            difficulty = 'medium'
-            
-        if language not in ['en', 'bn']:
-            language = 'en'
+        question_count, difficulty, language = parse_generation_options(document, request.args)
+        sections = plan_generation(document_id, question_count)
         
         return Response(
             stream_questions(
-                document['content'], 
-                question_count, 
+                sections, 
                 document_id,
                 difficulty,
                 language
             ),
             mimetype='text/event-stream; charset=utf-8',
-            headers={
-                'Cache-Control': 'no-cache',
-                'X-Accel-Buffering': 'no',
-                'Connection': 'keep-alive'
-            }
+            headers=SSE_HEADERS
         )
         
     except Exception as e:
-        print(f"Error in generate-questions: {e}")
+        log.exception("generate_questions_error", error=str(e))
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/session/start', methods=['POST'])
+@api.route('/api/session/start', methods=['POST'])
 def start_session():
     try:
         data = request.json
         document_id = data.get('document_id')
         total_questions = data.get('total_questions')
+        question_ids = data.get('question_ids') or []
 
-        if not document_id or not total_questions:
+        if not document_id or not (total_questions or question_ids):
             return jsonify({'error': 'Missing document_id or total_questions'}), 400
+        try:
+            question_ids = [int(q_id) for q_id in question_ids]
+        except (TypeError, ValueError):
+            return jsonify({'error': 'question_ids must be a list of question ids'}), 400
 
-        session_id = db.start_session(document_id, total_questions)
+        session_id = db.start_session(document_id, total_questions, question_ids)
         return jsonify({'session_id': session_id})
     except Exception as e:
-        print(f"Error starting session: {e}")
+        log.exception("session_start_error", error=str(e))
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/submit-answers', methods=['POST'])
+@api.route('/api/submit-answers', methods=['POST'])
 def submit_answers():
     try:
         data = request.json
@@ -429,12 +660,19 @@ def submit_answers():
         if not document_id or not user_answers or not session_id:
             return jsonify({'error': 'Missing required data (document_id, session_id, answers)'}), 400
         
-        questions = db.get_questions_by_document(document_id)
+        # Only the quiz's own questions are loaded, so grading cost follows the
+        # quiz size rather than the size of the document's question bank.
+        # Sessions started without question_ids grade just the answered questions.
+        session_question_ids = db.get_session_question_ids(session_id)
+        if not session_question_ids:
+            session_question_ids = [int(q_id) for q_id in user_answers if str(q_id).isdigit()]
+        questions = db.get_questions_by_ids(session_question_ids, document_id)
         
         if not questions:
             return jsonify({'error': 'No questions found'}), 404
         
         question_map = {str(q['id']): q for q in questions}
+        attempts = []
         
         results = {
             'total': len(questions),
@@ -449,7 +687,7 @@ def submit_answers():
                 correct_answer = question['correct_answer']
                 
                 is_correct = (user_answer == correct_answer)
-                db.save_attempt(session_id, question['id'], user_answer, is_correct)
+                attempts.append((question['id'], user_answer, is_correct))
                 
                 if is_correct:
                     results['correct'] += 1
@@ -464,13 +702,13 @@ def submit_answers():
                         'explanation': question['explanation']
                     })
             else:
-                print(f"Warning: Answer submitted for unknown question ID {question_id_str}")
+                log.warning("unknown_question_answered", session_id=session_id, question_id=question_id_str)
 
         answered_question_ids = set(user_answers.keys())
         for q_id_str, question in question_map.items():
             if q_id_str not in answered_question_ids:
                 results['all_correct'] = False
-                db.save_attempt(session_id, question['id'], None, False)
+                attempts.append((question['id'], None, False))
                 results['wrong'].append({
                     'question_id': question['id'],
                     'question': question['question_text'],
@@ -480,172 +718,153 @@ def submit_answers():
                     'explanation': question['explanation']
                 })
 
+        db.save_attempts(session_id, attempts)
         db.end_session(session_id, results['correct'])
         
         return jsonify(results)
         
     except Exception as e:
-        print(f"Error in submit_answers: {e}")
+        log.exception("submit_answers_error", error=str(e))
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/chat', methods=['POST'])
+def build_chat_prompt(user_message, chat_history, wrong_questions, language, relevant_chunks,
+                      query_embedding=None, summary=None, embedding_model=None):
+    template = prompt_registry.tutor_template(language)
+    
+    return prompt_builder.build_chat_prompt(
+        template, user_message, chat_history, wrong_questions, language, relevant_chunks,
+        query_embedding=query_embedding, embed_texts=embed_documents, embedding_model=embedding_model,
+        summary=summary
+    )
+
+def parse_document_id(value):
+    """A document id from a JSON body, given as 1 or "1"; None if it is neither"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return None
+
+def load_chat_context(data, document_id, language):
+    """Return (conversation, chat_history, wrong_questions); conversation is None for stateless
+    clients that still post their own history, and (None, None, None) for an unknown conversation"""
+    conversation_id = data.get('conversation_id')
+    if not conversation_id:
+        if 'history' in data:
+            return None, data.get('history') or [], data.get('wrong_questions', [])
+        conversation_id = conversation_memory.start(document_id, language, data.get('wrong_questions', []))
+    
+    conversation, chat_history = conversation_memory.load(conversation_id)
+    if not conversation or str(conversation['document_id']) != str(document_id):
+        return None, None, None
+    return conversation, chat_history, conversation['wrong_questions']
+
+@api.route('/api/chat', methods=['POST'])
 def chat_with_ai():
     try:
         data = request.json
         document_id = data.get('document_id')
         user_message = data.get('message')
-        chat_history = data.get('history', [])
-        wrong_questions = data.get('wrong_questions', [])
         language = data.get('language', 'en')
         
         if not document_id or not user_message:
             return jsonify({'error': 'Missing required data'}), 400
         
-        document = db.get_document(document_id)
+        # The answer cache and conversations key on the id, so "1" and 1 must agree
+        document_id = parse_document_id(document_id)
+        if document_id is None:
+            return jsonify({'error': 'Invalid document_id'}), 400
         
-        if not document:
+        if not db.get_document_meta(document_id):
             return jsonify({'error': 'Document not found'}), 404
         
-        doc_chunks, doc_embeddings = get_or_create_document_embeddings(
-            document_id, document['content']
-        )
-        
-        relevant_chunks = find_relevant_chunks(
-            user_message, doc_chunks, doc_embeddings
-        )
-        context_from_document = "\n\n---\n\n".join(relevant_chunks)
-
-        tutor_instructions = {
-            'en': """
-You are a helpful tutor. The student has read a document and taken an MCQ test on it.
-Your answers MUST be in English.
-
-RELEVANT DOCUMENT EXCERPTS (Use this context to answer):
-{context_from_document} 
-
-{wrong_section}
-
-CHAT HISTORY (Only last 10 messages):
-{history}
-
-STUDENT'S CURRENT MESSAGE: {message}
-
-INSTRUCTIONS:
-- Be encouraging and supportive
-- Help the student learn from their mistakes
-- Guide them to think deeply and critically
-- Connect concepts back to the relevant document excerpts
-- Explain in clear, simple language
-- Ask thought-provoking follow-up questions when appropriate
-
-Respond naturally and conversationally in English.
-""",
-            'bn': """
-আপনি একজন সহায়ক শিক্ষক। শিক্ষার্থী একটি নথি পড়েছে এবং তার উপর MCQ পরীক্ষা দিয়েছে।
-আপনার উত্তর অবশ্যই বাংলায় দিতে হবে।
-
-প্রাসঙ্গিক নথি থেকে অংশ (উত্তর দিতে এই কনটেক্সট ব্যবহার করুন):
-{context_from_document} 
-
-{wrong_section}
-
-চ্যাট ইতিহাস (শুধুমাত্র শেষ ১০টি বার্তা):
-{history}
-
-শিক্ষার্থীর বর্তমান বার্তা: {message}
-
-নির্দেশনা:
-- উৎসাহজনক এবং সহায়ক হন
-- শিক্ষার্থীকে তাদের ভুল থেকে শিখতে সাহায্য করুন
-- তাদের গভীরভাবে এবং সমালোচনামূলকভাবে চিন্তা করতে গাইড করুন
-- ধারণাগুলি প্রাসঙ্গিক নথির অংশে ফিরিয়ে সংযুক্ত করুন
-- স্পষ্ট, সহজ ভাষায় ব্যাখ্যা করুন
-- উপযুক্ত হলে চিন্তা-উদ্দীপক ফলো-আপ প্রশ্ন জিজ্ঞাসা করুন
-
-স্বাভাবিক এবং কথোপকথনমূলকভাবে বাংলায় প্রতিক্রিয়া জানান।
-"""
-        }
+        conversation, chat_history, wrong_questions = load_chat_context(data, document_id, language)
+        if chat_history is None:
+            return jsonify({'error': 'Conversation not found'}), 404
+        summary = conversation['summary'] if conversation else None
         
-        wrong_section = ""
-        if wrong_questions:
-            wrong_labels = {
-                'en': "Questions the student got wrong:",
-                'bn': "শিক্ষার্থী যে প্রশ্নগুলি ভুল করেছে:"
-            }
-            wrong_section = wrong_labels.get(language, wrong_labels['en']) + "\n"
-            for wq in wrong_questions:
-                wrong_section += f"- {wq['question']}\n"
-                correct_label = {'en': 'Correct answer:', 'bn': 'সঠিক উত্তর:'}
-                explanation_label = {'en': 'Explanation:', 'bn': 'ব্যাখ্যা:'}
-                wrong_section += f"  {correct_label.get(language, 'Correct answer:')} {wq['correct_answer']}\n"
-                wrong_section += f"  {explanation_label.get(language, 'Explanation:')} {wq['explanation']}\n\n"
-        
-        history_text = ""
-        role_labels = {
-            'en': {'user': 'Student', 'assistant': 'Tutor'},
-            'bn': {'user': 'শিক্ষার্থী', 'assistant': 'শিক্ষক'}
-        }
-        labels = role_labels.get(language, role_labels['en'])
+        doc_chunks, doc_embeddings, embedding_model = get_or_create_document_embeddings(document_id)
         
-        recent_history = chat_history[-10:] 
-        for msg in recent_history:
-            role = labels.get(msg['role'], msg['role'])
-            history_text += f"{role}: {msg['content']}\n"
-        
-        template = tutor_instructions.get(language, tutor_instructions['en'])
+        with metrics.span('retrieval'):
+            relevant_chunks, chunk_ids, query_embedding = retrieve_context(
+                user_message, doc_chunks, doc_embeddings, document_id=document_id,
+                embedding_model=embedding_model
+            )
         
-        context = template.format(
-            context_from_document=context_from_document,
-            wrong_section=wrong_section,
-            history=history_text,
-            message=user_message
-        )
+        cacheable = not summary and answer_cache.cacheable(chat_history, wrong_questions, chunk_ids)
+        cached_answer = None
+        if cacheable:
+            cached_answer = answer_cache.get(document_id, language, chunk_ids, user_message, query_embedding)
+        
+        prompt_tokens = 0
+        if cached_answer is not None:
+            ai_response = cached_answer
+        else:
+            with metrics.span('prompt_build'):
+                context, prompt_report = build_chat_prompt(
+                    user_message, chat_history, wrong_questions, language, relevant_chunks,
+                    query_embedding=query_embedding, summary=summary, embedding_model=embedding_model
+                )
+            
+            response = generate_content('chat', context, prompt_report['prompt_version'])
+            ai_response = response.text.strip()
+            prompt_tokens = prompt_report['total']
+            
+            if cacheable:
+                answer_cache.put(document_id, language, chunk_ids, user_message, ai_response, query_embedding)
         
-        response = generation_model.generate_content(context)
-        ai_response = response.text.strip()
+        result = {'response': ai_response, 'prompt_tokens': prompt_tokens}
+        if cached_answer is not None:
+            result['cached'] = True
+        if conversation:
+            conversation_memory.record_turn(conversation, user_message, ai_response)
+            result['conversation_id'] = conversation['id']
         
-        return jsonify({'response': ai_response})
+        return jsonify(result)
         
     except Exception as e:
-        print(f"Error in chat: {e}")
+        log.exception("chat_error", error=str(e))
         return jsonify({'error': 'Failed to generate response'}), 500
 
-@app.route('/api/statistics/<int:document_id>', methods=['GET'])
+@api.route('/api/statistics/<int:document_id>', methods=['GET'])
 def get_statistics(document_id):
     try:
-        stats = db.get_document_statistics(document_id)
-        return jsonify(stats)
+        return cached_json(('statistics', document_id), ('questions', 'user_attempts'),
+                           lambda: db.get_document_statistics(document_id))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/session/history', methods=['GET'])
+@api.route('/api/session/history', methods=['GET'])
 def get_session_history():
     try:
-        history = db.get_session_history()
-        return jsonify(history)
+        return cached_json(('history',), ('sessions', 'documents'), db.get_session_history)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/analytics', methods=['GET'])
+@api.route('/api/analytics', methods=['GET'])
 def get_analytics():
     try:
-        analytics = db.get_overall_analytics()
-        return jsonify(analytics)
+        return cached_json(('analytics',), ('sessions',), db.get_overall_analytics)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
         
-@app.route('/api/session/<int:session_id>', methods=['GET'])
+@api.route('/api/session/<int:session_id>', methods=['GET'])
 def get_session_details_route(session_id):
     try:
-        session_data = db.get_session_details(session_id)
-        if not session_data:
-            return jsonify({'error': 'Session not found'}), 404
-        return jsonify(session_data)
+        def load():
+            session_data = db.get_session_details(session_id)
+            if not session_data:
+                return make_response(jsonify({'error': 'Session not found'}), 404)
+            return session_data
+
+        return cached_json(('session', session_id), ('sessions', 'user_attempts', 'questions'), load)
     except Exception as e:
-        print(f"Error in session details route: {e}")
+        log.exception("session_details_error", session_id=session_id, error=str(e))
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/session/<int:session_id>', methods=['DELETE'])
+@api.route('/api/session/<int:session_id>', methods=['DELETE'])
 def delete_session_route(session_id):
     try:
         success = db.delete_session(session_id)
@@ -653,14 +872,108 @@ def delete_session_route(session_id):
             return jsonify({'error': 'Session not found or already deleted'}), 404
         return jsonify({'message': 'Session deleted successfully'})
     except Exception as e:
-        print(f"Error in session delete route: {e}")
+        log.exception("session_delete_error", session_id=session_id, error=str(e))
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/health', methods=['GET'])
+@api.route('/api/metrics', methods=['GET'])
+def metrics_route():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+def profiling_auth_error():
+    error = profiling.check_token(profiling.supplied_token(
+        request.headers.get('Authorization'), request.headers.get('X-Profile-Token')
+    ))
+    if error:
+        status, message = error
+        return jsonify({'error': message}), status
+    return None
+
+@api.route('/api/debug/profile', methods=['GET'])
+def profile_route():
+    # Blocks this request for the whole profile; asgi.py serves it off the WSGI thread
+    denied = profiling_auth_error()
+    if denied:
+        return denied
+    request.environ['study_assistant.phases'] = None  # a profile is slow on purpose
+    try:
+        seconds, interval, include_idle = profiling.parse_profile_options(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        counts, samples = profiling.profiler.profile(seconds, interval, include_idle)
+    except profiling.ProfilerBusy:
+        return jsonify({'error': 'A profile is already running in this process'}), 409
+    return Response(
+        profiling.SamplingProfiler.collapsed(counts),
+        mimetype='text/plain',
+        headers={
+            'Content-Disposition': f'attachment; filename="{profiling.profile_filename()}"',
+            'X-Profile-Samples': str(samples),
+        }
+    )
+
+@api.route('/api/debug/slow-requests', methods=['GET'])
+def slow_requests_route():
+    denied = profiling_auth_error()
+    if denied:
+        return denied
+    limit = request.args.get('limit', type=int)
+    return jsonify({
+        'threshold_seconds': profiling.slow_requests.threshold,
+        'capacity': profiling.slow_requests.capacity,
+        'requests': profiling.slow_requests.entries(limit),
+    })
+
+@api.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy', 'message': 'AI Study Assistant API is running'})
 
+SERVICES = ('db', 'doc_processor', 'conversation_memory', 'lexical_index', 'embedding_pipeline')
+_app_lock = threading.Lock()
+
+def init_services(database=None):
+    """Open the storage (or use `database`) and build the services the routes share"""
+    global db, doc_processor, conversation_memory, lexical_index, embedding_pipeline
+    db = database if database is not None else open_database()
+    doc_processor = DocumentProcessor()
+    conversation_memory = ConversationMemory(db, generate_content)
+    lexical_index = LexicalIndex(db)
+    embedding_pipeline = EmbeddingPipeline(db, embed_documents, EMBEDDING_MODELS)
+
+def create_app(database=None):
+    """The Flask app; opens the storage on the first call, or switches to `database`"""
+    if database is not None or 'db' not in globals():
+        init_services(database)
+    flask_app = Flask(__name__)
+    flask_app.json = TimedJSONProvider(flask_app)
+    CORS(flask_app)
+    flask_app.before_request(start_request_timer)
+    # after_request hooks run in reverse: latency, then compression, then the slow-request check
+    flask_app.after_request(capture_slow_request)
+    flask_app.after_request(compress_response)
+    flask_app.after_request(record_request_latency)
+    flask_app.register_blueprint(api)
+    return flask_app
+
+def __getattr__(name):
+    # `app` and the services are built on first access (gunicorn app:app, asgi.py, scripts)
+    if name != 'app' and name not in SERVICES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    global app
+    with _app_lock:
+        if 'app' not in globals():
+            app = create_app()
+    return globals()[name]
+
+def preload():
+    """Import the lazily loaded modules up front. Called from the gunicorn master
+    (see gunicorn.conf.py) so forked workers share them instead of each paying on first use."""
+    import numpy  # noqa: F401
+    get_genai()
+    DocumentProcessor.preload()
+
 if __name__ == '__main__':
+    app = create_app()
     print("Starting AI Study Assistant API...")
     print("Server running on http://localhost:5000")
     app.run(debug=True, port=5000, threaded=True)
\ No newline at end of file
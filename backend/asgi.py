@@ -0,0 +1,365 @@
+import asyncio
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from a2wsgi import WSGIMiddleware
+from werkzeug.datastructures import MultiDict
+
+import app as flask_app
+import metrics
+import profiling
+from answer_cache import answer_cache
+from logger import get_logger, set_request_id, request_id_var
+from app import (
+    get_generation_model, get_or_create_document_embeddings, retrieve_context,
+    build_chat_prompt, parse_generation_options, parse_document_id, load_chat_context,
+    plan_generation, QuestionStream, planned_event, retries_exhausted_event, SSE_HEADERS
+)
+
+# Async serving mode: the LLM-bound endpoints (/api/chat and the SSE question
+# stream) are served here as coroutines; every other route is served by the
+# Flask app. Both await the model natively; the question stream reads the
+# model's output as it streams in and shares its prompt building, parsing and
+# storing with the Flask route (app.QuestionStream).
+# Blocking database calls run on the event loop's thread pool and Flask
+# routes on a2wsgi's own pool, so neither holds up the event loop, and a
+# thread is only taken for the database work, never for a model call.
+# /api/debug/profile is served here so a long profile doesn't occupy one of
+# the Flask threads.
+#
+#   ASGI_THREADS   event-loop thread pool: database calls in flight per
+#                  worker process (default 64)
+#   WSGI_THREADS   Flask requests served at once per worker process (default 16)
+#
+#   uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+GENERATE_QUESTIONS_PATH = re.compile(r'^/api/generate-questions/(\d+)$')
+GENERATE_QUESTIONS_ENDPOINT = '/api/generate-questions/<int:document_id>'
+CHAT_PATH = '/api/chat'
+PROFILE_PATH = '/api/debug/profile'
+
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-headers', b'Content-Type'),
+    (b'access-control-allow-methods', b'GET, POST, OPTIONS'),
+]
+
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', '64'))
+WSGI_THREADS = int(os.getenv('WSGI_THREADS', '16'))
+
+wsgi_application = WSGIMiddleware(flask_app.app, workers=WSGI_THREADS)
+
+log = get_logger('asgi')
+
+
+async def generate_content_async(kind, prompt, prompt_version=None):
+    started = time.perf_counter()
+    with metrics.span('llm'):
+        try:
+            response = await get_generation_model().generate_content_async(prompt)
+        except Exception:
+            metrics.record_llm_call(kind, prompt, outcome='error', prompt_version=prompt_version,
+                                    seconds=time.perf_counter() - started)
+            raise
+    metrics.record_llm_call(kind, prompt, response, prompt_version=prompt_version,
+                            seconds=time.perf_counter() - started)
+    return response
+
+
+async def stream_content_async(kind, prompt, prompt_version=None):
+    """app.stream_content for the event loop: yields each piece of text as the model sends it"""
+    waited = 0.0
+    pieces = None
+    try:
+        while True:
+            started = time.perf_counter()
+            with metrics.span('llm'):
+                if pieces is None:
+                    response = await get_generation_model().generate_content_async(prompt, stream=True)
+                    pieces = response.__aiter__()
+                try:
+                    piece = await pieces.__anext__()
+                except StopAsyncIteration:
+                    piece = None
+            waited += time.perf_counter() - started
+            if piece is None:
+                break
+            yield piece.text
+    except Exception:
+        metrics.record_llm_call(kind, prompt, outcome='error', prompt_version=prompt_version,
+                                seconds=waited + time.perf_counter() - started)
+        raise
+    metrics.record_llm_call(kind, prompt, response, prompt_version=prompt_version, seconds=waited)
+
+
+async def store_async(run, questions):
+    # Most pieces complete no question; only a save needs the thread pool
+    return await asyncio.to_thread(run.store, questions) if questions else []
+
+
+async def stream_questions_async(sections, document_id, difficulty='medium', language='en', disconnected=None):
+    run = QuestionStream(sections, document_id, difficulty, language)
+    yield planned_event(sections)
+
+    while not run.finished:
+        if disconnected is not None and disconnected.is_set():
+            log.info("generation_client_disconnected", document_id=document_id, generated=run.generated_count)
+            return
+        prompt = run.next_prompt()
+        if prompt is None:
+            yield retries_exhausted_event()
+            break
+        try:
+            async for text in stream_content_async('question', prompt, run.prompt_version):
+                for event in await store_async(run, run.parse(text)):
+                    yield event
+            for event in await store_async(run, run.parse()):
+                yield event
+        except Exception as e:
+            events, pause = run.failed(e)
+        else:
+            events, pause = run.outcome()
+        for event in events:
+            yield event
+        if pause and not run.finished:
+            await asyncio.sleep(pause)
+
+    yield run.done_event()
+
+
+async def chat_async(data):
+    document_id = data.get('document_id')
+    user_message = data.get('message')
+    language = data.get('language', 'en')
+
+    if not document_id or not user_message:
+        return 400, {'error': 'Missing required data'}
+
+    document_id = parse_document_id(document_id)
+    if document_id is None:
+        return 400, {'error': 'Invalid document_id'}
+
+    if not await asyncio.to_thread(flask_app.db.get_document_meta, document_id):
+        return 404, {'error': 'Document not found'}
+
+    conversation, chat_history, wrong_questions = await asyncio.to_thread(
+        load_chat_context, data, document_id, language
+    )
+    if chat_history is None:
+        return 404, {'error': 'Conversation not found'}
+    summary = conversation['summary'] if conversation else None
+
+    doc_chunks, doc_embeddings, embedding_model = await asyncio.to_thread(
+        get_or_create_document_embeddings, document_id
+    )
+    with metrics.span('retrieval'):
+        relevant_chunks, chunk_ids, query_embedding = await asyncio.to_thread(
+            retrieve_context, user_message, doc_chunks, doc_embeddings, 3, document_id, embedding_model
+        )
+
+    cacheable = not summary and answer_cache.cacheable(chat_history, wrong_questions, chunk_ids)
+    cached_answer = None
+    if cacheable:
+        cached_answer = answer_cache.get(document_id, language, chunk_ids, user_message, query_embedding)
+
+    prompt_tokens = 0
+    if cached_answer is not None:
+        ai_response = cached_answer
+    else:
+        with metrics.span('prompt_build'):
+            context, prompt_report = await asyncio.to_thread(
+                build_chat_prompt, user_message, chat_history, wrong_questions, language, relevant_chunks,
+                query_embedding, summary, embedding_model
+            )
+
+        response = await generate_content_async('chat', context, prompt_report['prompt_version'])
+        ai_response = response.text.strip()
+        prompt_tokens = prompt_report['total']
+
+        if cacheable:
+            answer_cache.put(document_id, language, chunk_ids, user_message, ai_response, query_embedding)
+
+    result = {'response': ai_response, 'prompt_tokens': prompt_tokens}
+    if cached_answer is not None:
+        result['cached'] = True
+    if conversation:
+        await asyncio.to_thread(flask_app.conversation_memory.record_turn, conversation, user_message, ai_response)
+        result['conversation_id'] = conversation['id']
+
+    return 200, result
+
+
+def header_value(scope, name):
+    for key, value in scope.get('headers', []):
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+async def read_body(receive):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+def response_headers(headers):
+    """`headers` plus CORS and X-Request-ID, as the Flask app adds them to its responses"""
+    return headers + CORS_HEADERS + [(b'x-request-id', (request_id_var.get() or '').encode('latin-1'))]
+
+
+async def send_json(send, status, payload):
+    with metrics.span('serialization'):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': response_headers([
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ]),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_preflight(send):
+    await send({'type': 'http.response.start', 'status': 200, 'headers': response_headers([])})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def watch_disconnect(receive, disconnected):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            disconnected.set()
+            return
+
+
+async def handle_chat(scope, receive, send):
+    started = time.perf_counter()
+    phases = profiling.slow_requests.start()
+    try:
+        data = json.loads(await read_body(receive) or b'{}')
+        status, payload = await chat_async(data)
+    except Exception as e:
+        log.exception("chat_error", error=str(e))
+        status, payload = 500, {'error': 'Failed to generate response'}
+    await send_json(send, status, payload)
+    metrics.observe_request(CHAT_PATH, 'POST', status, time.perf_counter() - started)
+    profiling.slow_requests.finish(phases, 'POST', CHAT_PATH, CHAT_PATH, status)
+
+
+async def handle_generate_questions(scope, receive, send, document_id):
+    started = time.perf_counter()
+    phases = profiling.slow_requests.start()
+    try:
+        document = await asyncio.to_thread(flask_app.db.get_document_meta, document_id)
+        if not document:
+            await send_json(send, 404, {'error': 'Document not found'})
+            metrics.observe_request(GENERATE_QUESTIONS_ENDPOINT, 'GET', 404, time.perf_counter() - started)
+            profiling.slow_requests.finish(phases, 'GET', scope['path'], GENERATE_QUESTIONS_ENDPOINT, 404)
+            return
+
+        args = MultiDict(parse_qsl(scope.get('query_string', b'').decode('utf-8')))
+        question_count, difficulty, language = parse_generation_options(document, args)
+        sections = await asyncio.to_thread(plan_generation, document_id, question_count)
+    except Exception as e:
+        log.exception("generate_questions_error", error=str(e))
+        await send_json(send, 500, {'error': str(e)})
+        metrics.observe_request(GENERATE_QUESTIONS_ENDPOINT, 'GET', 500, time.perf_counter() - started)
+        profiling.slow_requests.finish(phases, 'GET', scope['path'], GENERATE_QUESTIONS_ENDPOINT, 500)
+        return
+
+    headers = [(b'content-type', b'text/event-stream; charset=utf-8')]
+    headers += [(k.lower().encode(), v.encode()) for k, v in SSE_HEADERS.items()]
+    await send({'type': 'http.response.start', 'status': 200, 'headers': response_headers(headers)})
+    metrics.observe_request(GENERATE_QUESTIONS_ENDPOINT, 'GET', 200, time.perf_counter() - started)
+
+    disconnected = asyncio.Event()
+    watcher = asyncio.create_task(watch_disconnect(receive, disconnected))
+    try:
+        async for event in stream_questions_async(
+            sections, document_id, difficulty, language, disconnected
+        ):
+            await send({'type': 'http.response.body', 'body': event.encode('utf-8'), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    except OSError:
+        log.info("generation_client_disconnected", document_id=document_id)
+    finally:
+        watcher.cancel()
+        profiling.slow_requests.finish(phases, 'GET', scope['path'], GENERATE_QUESTIONS_ENDPOINT, 200, streamed=True)
+
+
+async def handle_profile(scope, send):
+    # Sampling runs on the event loop's pool rather than holding a Flask thread for the whole profile
+    denied = profiling.check_token(profiling.supplied_token(
+        header_value(scope, b'authorization'), header_value(scope, b'x-profile-token')
+    ))
+    if denied:
+        status, message = denied
+        return await send_json(send, status, {'error': message})
+    args = dict(parse_qsl(scope.get('query_string', b'').decode('utf-8')))
+    try:
+        seconds, interval, include_idle = profiling.parse_profile_options(args)
+    except ValueError as e:
+        return await send_json(send, 400, {'error': str(e)})
+    try:
+        counts, samples = await asyncio.to_thread(profiling.profiler.profile, seconds, interval, include_idle)
+    except profiling.ProfilerBusy:
+        return await send_json(send, 409, {'error': 'A profile is already running in this process'})
+
+    body = profiling.SamplingProfiler.collapsed(counts).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': response_headers([
+            (b'content-type', b'text/plain; charset=utf-8'),
+            (b'content-length', str(len(body)).encode()),
+            (b'content-disposition', f'attachment; filename="{profiling.profile_filename()}"'.encode()),
+            (b'x-profile-samples', str(samples).encode()),
+        ]),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http':
+        path = scope['path']
+        method = scope['method']
+
+        match = GENERATE_QUESTIONS_PATH.match(path)
+        native = (path == CHAT_PATH and method in ('OPTIONS', 'POST')
+                  or match and method in ('OPTIONS', 'GET')
+                  or path == PROFILE_PATH and method == 'GET')
+        if native:
+            set_request_id(header_value(scope, b'x-request-id'))
+            if method == 'OPTIONS':
+                return await send_preflight(send)
+            if path == CHAT_PATH:
+                return await handle_chat(scope, receive, send)
+            if match:
+                return await handle_generate_questions(scope, receive, send, int(match.group(1)))
+            return await handle_profile(scope, send)
+
+    elif scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                asyncio.get_running_loop().set_default_executor(
+                    ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='asgi')
+                )
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    return await wsgi_application(scope, receive, send)
@@ -0,0 +1,111 @@
+import io
+import random
+
+from docx import Document
+
+# Synthetic study material in the formats /api/upload accepts. Generation is
+# seeded so that every run (and every release) benchmarks the same bytes.
+
+VOCABULARY = (
+    "photosynthesis chlorophyll glucose respiration mitochondria enzyme substrate catalyst "
+    "equilibrium entropy energy momentum velocity acceleration force gravity friction "
+    "democracy parliament constitution sovereignty federalism revolution economy inflation "
+    "supply demand market capital labour theorem proof integral derivative function matrix "
+    "vector probability hypothesis experiment observation analysis evidence conclusion "
+    "the of and to in is that for as with by on which are from this be an it"
+).split()
+
+SIZES = {
+    'small': 300,
+    'medium': 3000,
+    'large': 30000,
+}
+
+WORDS_PER_PARAGRAPH = 60
+
+
+def make_paragraphs(word_count, seed=0):
+    rng = random.Random(seed)
+    paragraphs = []
+    remaining = word_count
+    while remaining > 0:
+        n = min(WORDS_PER_PARAGRAPH, remaining)
+        words = [rng.choice(VOCABULARY) for _ in range(n)]
+        words[0] = words[0].capitalize()
+        paragraphs.append(' '.join(words) + '.')
+        remaining -= n
+    return paragraphs
+
+
+def make_txt(word_count, seed=0):
+    return '\n\n'.join(make_paragraphs(word_count, seed)).encode('utf-8')
+
+
+def make_docx(word_count, seed=0):
+    document = Document()
+    for paragraph in make_paragraphs(word_count, seed):
+        document.add_paragraph(paragraph)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def _pdf_escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def make_pdf(word_count, seed=0, words_per_line=12, lines_per_page=50):
+    """Plain single-font PDF with real text operators, readable by PyPDF2"""
+    words = ' '.join(make_paragraphs(word_count, seed)).split()
+    lines = [' '.join(words[i:i + words_per_line]) for i in range(0, len(words), words_per_line)]
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    objects = []
+    page_ids = []
+    font_id = 3
+    next_id = 4
+    for page_lines in pages:
+        text_ops = ' '.join(f"({_pdf_escape(line)}) '" for line in page_lines)
+        stream = f"BT /F1 10 Tf 14 TL 40 800 Td {text_ops} ET".encode('latin-1')
+        content_id, page_id = next_id, next_id + 1
+        next_id += 2
+        objects.append((content_id, b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"))
+        objects.append((page_id, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode()))
+        page_ids.append(page_id)
+
+    kids = ' '.join(f"{pid} 0 R" for pid in page_ids)
+    objects = [
+        (1, b"<< /Type /Catalog /Pages 2 0 R >>"),
+        (2, f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()),
+        (font_id, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"),
+    ] + objects
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id, body in sorted(objects):
+        offsets[obj_id] = out.tell()
+        out.write(f"{obj_id} 0 obj\n".encode() + body + b"\nendobj\n")
+    xref_at = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for obj_id in range(1, len(objects) + 1):
+        out.write(f"{offsets[obj_id]:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n".encode())
+    return out.getvalue(), len(page_ids)
+
+
+def build_corpus(sizes=None, formats=('txt', 'docx', 'pdf')):
+    """Yield (filename, bytes, word_count, pages) for every size/format pair"""
+    sizes = sizes or SIZES
+    for seed, (size_name, word_count) in enumerate(sizes.items()):
+        for fmt in formats:
+            if fmt == 'txt':
+                data, pages = make_txt(word_count, seed), 1
+            elif fmt == 'docx':
+                data, pages = make_docx(word_count, seed), 1
+            else:
+                data, pages = make_pdf(word_count, seed)
+            yield f"{size_name}.{fmt}", data, word_count, pages
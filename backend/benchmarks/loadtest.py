@@ -0,0 +1,173 @@
+"""Concurrent-stream load test: sync gunicorn workers vs the async (ASGI) mode.
+
+Both deployments run against the local stub LLM backend (LLM_BACKEND=stub), so
+the numbers reflect how many in-flight LLM-bound requests a process can hold,
+not Gemini latency.
+
+    cd backend
+    python -m benchmarks.loadtest --streams 200 --questions 3 --chats 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from database import Database  # noqa: E402
+
+SAMPLE_TEXT = "\n\n".join(
+    f"Section {i}: photosynthesis converts light energy into chemical energy stored in glucose, "
+    f"while cellular respiration releases that energy for the work of living cells number {i}."
+    for i in range(20)
+)
+
+DEPLOYMENTS = {
+    'sync': lambda port, workers: [
+        # gunicorn.conf.py selects uvicorn workers for asgi.py; the sync deployment needs gunicorn's own
+        sys.executable, '-m', 'gunicorn', 'app:app', '--worker-class', 'sync',
+        '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--timeout', '300'
+    ],
+    'async': lambda port, workers: [
+        sys.executable, '-m', 'uvicorn', 'asgi:application',
+        '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers),
+        '--log-level', 'warning', '--limit-concurrency', '100000', '--backlog', '4096'
+    ],
+}
+
+
+def seed_database(db_path):
+    db = Database(db_path)
+    content_hash = str(hash(SAMPLE_TEXT))
+    return db.save_document('loadtest.txt', SAMPLE_TEXT, content_hash, len(SAMPLE_TEXT.split()))
+
+
+async def http_request(port, method, path, body=None, timeout=600):
+    """Minimal HTTP/1.1 client; returns (status, elapsed, events, first_byte)."""
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    payload = json.dumps(body).encode() if body is not None else b''
+    request = (
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n"
+    ).encode() + payload
+    writer.write(request)
+    await writer.drain()
+
+    status_line = await asyncio.wait_for(reader.readline(), timeout)
+    first_byte = time.perf_counter() - started
+    status = int(status_line.split()[1]) if status_line else 0
+    raw = await asyncio.wait_for(reader.read(), timeout)
+    writer.close()
+    events = raw.count(b'data: ')
+    return status, time.perf_counter() - started, events, first_byte
+
+
+def wait_for_server(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            status = asyncio.run(http_request(port, 'GET', '/api/health', timeout=2))[0]
+            if status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not come up")
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(results, elapsed):
+    ok = [r for r in results if not isinstance(r, Exception) and r[0] == 200]
+    latencies = [r[1] for r in ok]
+    return {
+        'requests': len(results),
+        'ok': len(ok),
+        'failed': len(results) - len(ok),
+        'wall_seconds': round(elapsed, 3),
+        'p50_seconds': round(percentile(latencies, 50), 3),
+        'p95_seconds': round(percentile(latencies, 95), 3),
+        'max_seconds': round(max(latencies), 3) if latencies else 0.0,
+        'mean_seconds': round(statistics.mean(latencies), 3) if latencies else 0.0,
+        'events': sum(r[2] for r in ok),
+    }
+
+
+async def run_load(port, document_id, streams, questions, chats):
+    async def stream():
+        return await http_request(port, 'GET', f'/api/generate-questions/{document_id}?count={questions}')
+
+    async def chat(i):
+        return await http_request(port, 'POST', '/api/chat', {
+            'document_id': document_id, 'message': f'Explain section {i % 20}', 'history': []
+        })
+
+    report = {}
+    started = time.perf_counter()
+    results = await asyncio.gather(*[stream() for _ in range(streams)], return_exceptions=True)
+    report['generate_questions'] = summarize(results, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*[chat(i) for i in range(chats)], return_exceptions=True)
+    report['chat'] = summarize(results, time.perf_counter() - started)
+    return report
+
+
+def run_deployment(mode, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'loadtest.db')
+        document_id = seed_database(db_path)
+        env = dict(os.environ, LLM_BACKEND='stub', DATABASE_PATH=db_path,
+                   STUB_LLM_LATENCY=str(args.llm_latency))
+        command = DEPLOYMENTS[mode](args.port, args.workers)
+        server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_server(args.port)
+            report = asyncio.run(run_load(args.port, document_id, args.streams, args.questions, args.chats))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    report['command'] = ' '.join(command[1:])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['sync', 'async', 'both'], default='both')
+    parser.add_argument('--streams', type=int, default=100, help='concurrent SSE question streams')
+    parser.add_argument('--questions', type=int, default=3, help='questions per stream')
+    parser.add_argument('--chats', type=int, default=100, help='concurrent chat requests')
+    parser.add_argument('--workers', type=int, default=1, help='server processes per deployment')
+    parser.add_argument('--llm-latency', type=float, default=0.5, help='stub LLM latency in seconds')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--output', help='write the JSON report to this file')
+    args = parser.parse_args()
+
+    modes = ['sync', 'async'] if args.mode == 'both' else [args.mode]
+    report = {
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': {mode: run_deployment(mode, args) for mode in modes},
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
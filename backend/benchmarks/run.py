@@ -0,0 +1,419 @@
+"""End-to-end backend benchmarks against the stub LLM/embedding backend.
+
+    cd backend
+    python -m benchmarks.run --output bench.json            # full suite
+    python -m benchmarks.run --quick --only retrieval        # one benchmark, small sizes
+    python -m benchmarks.run --compare old.json --output new.json
+
+The report is JSON with stable keys so two releases can be diffed directly;
+--compare prints the relative change of every timing against an older report.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+def timed(fn, repeat=5):
+    """Run fn `repeat` times; return timing summary in milliseconds and the last result"""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        'min_ms': round(min(samples), 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'max_ms': round(max(samples), 3),
+    }, result
+
+
+def seed_questions(db, document_id, count, offset=0):
+    ids = []
+    for i in range(offset, offset + count):
+        question = {
+            'question': f"Benchmark question {document_id}-{i}?",
+            'options': {'A': 'one', 'B': 'two', 'C': 'three', 'D': 'four'},
+            'correct_answer': 'ABCD'[i % 4],
+            'explanation': 'Because the document says so. ' * 10,
+            'cognitive_level': 'Analyze',
+        }
+        ids.append(db.save_question(document_id, question, f"bench-{document_id}-{i}"))
+    return ids
+
+
+@benchmark('upload')
+def bench_upload(app_module, quick):
+    from benchmarks.corpus import build_corpus, SIZES
+
+    sizes = {'small': SIZES['small'], 'medium': SIZES['medium']} if quick else SIZES
+    client = app_module.app.test_client()
+    results = {}
+    for filename, data, word_count, pages in build_corpus(sizes):
+        def upload():
+            response = client.post('/api/upload', data={'file': (io.BytesIO(data), filename)})
+            assert response.status_code == 200, response.data
+            return response
+
+        timing, _ = timed(upload, repeat=3)
+        seconds = timing['median_ms'] / 1000
+        results[filename] = dict(
+            timing,
+            bytes=len(data),
+            words=word_count,
+            pages=pages,
+            docs_per_second=round(1 / seconds, 2) if seconds else None,
+            pages_per_second=round(pages / seconds, 2) if seconds else None,
+        )
+    return results
+
+
+@benchmark('bulk_ingest')
+def bench_bulk_ingest(app_module, quick):
+    from benchmarks.corpus import make_txt, make_docx, make_pdf
+    from ingest import Ingester, find_documents
+
+    per_format = 10 if quick else 100
+    with tempfile.TemporaryDirectory() as library:
+        for i in range(per_format):
+            # Distinct seeds per file: identical text in two formats would be deduplicated
+            for extension, data in (('txt', make_txt(800, 1000 + i)), ('docx', make_docx(800, 2000 + i)),
+                                    ('pdf', make_pdf(1500, 3000 + i)[0])):
+                with open(os.path.join(library, f"doc-{i}.{extension}"), 'wb') as f:
+                    f.write(data)
+        report = Ingester(app_module).run(find_documents(library))
+    return {key: report[key] for key in (
+        'files', 'documents', 'pages', 'seconds', 'documents_per_second', 'pages_per_second',
+        'write_seconds', 'embedding_seconds',
+    )}
+
+
+@benchmark('embedding_cache')
+def bench_embedding_cache(app_module, quick):
+    from benchmarks.corpus import make_paragraphs
+
+    db = app_module.db
+    results = {}
+    for chunk_count in ([10, 100] if quick else [10, 100, 1000]):
+        text = '\n\n'.join(make_paragraphs(chunk_count * 60, seed=chunk_count))
+        document_id = db.save_document(f"embed-{chunk_count}.txt", text, f"embed-{chunk_count}", chunk_count * 60)
+        app_module.document_embeddings_cache.pop(document_id, None)
+
+        started = time.perf_counter()
+        chunks, _, _ = app_module.get_or_create_document_embeddings(document_id)
+        cold_ms = (time.perf_counter() - started) * 1000
+        # A restarted process reloads the checkpointed batches instead of calling the API
+        app_module.document_embeddings_cache.pop(document_id, None)
+        started = time.perf_counter()
+        app_module.get_or_create_document_embeddings(document_id)
+        checkpoint_ms = (time.perf_counter() - started) * 1000
+        warm, _ = timed(lambda: app_module.get_or_create_document_embeddings(document_id), repeat=20)
+        results[f"chunks_{chunk_count}"] = {
+            'chunks': len(chunks),
+            'cold_ms': round(cold_ms, 3),
+            'checkpoint_ms': round(checkpoint_ms, 3),
+            'warm_median_ms': warm['median_ms'],
+        }
+    return results
+
+
+@benchmark('retrieval')
+def bench_retrieval(app_module, quick):
+    import numpy as np
+    import stub_llm
+    from benchmarks.corpus import make_paragraphs
+
+    rng = np.random.default_rng(0)
+    query = 'what does photosynthesis produce'
+    results = {}
+    for chunk_count in ([100, 1000] if quick else [100, 1000, 10000, 50000]):
+        chunks = make_paragraphs(chunk_count * 40, seed=chunk_count)[:chunk_count]
+        chunks += [f"chunk {i}" for i in range(len(chunks), chunk_count)]
+        # As cached by get_or_create_document_embeddings
+        embeddings = rng.standard_normal((chunk_count, stub_llm.EMBEDDING_DIM)).astype(np.float32)
+        document_id = app_module.db.save_document(f"retrieval-{chunk_count}.txt", 'x', f"retrieval-{chunk_count}", 1)
+        index = app_module.lexical_index.build(document_id, chunks)
+
+        model = app_module.EMBEDDING_MODELS[0]
+        vector, top = timed(lambda: app_module.find_relevant_chunks(query, chunks, embeddings, embedding_model=model))
+        assert len(top) == 3
+        lexical, _ = timed(lambda: index.search(query, app_module.LEXICAL_CANDIDATES))
+        hybrid, top = timed(lambda: app_module.find_relevant_chunks(query, chunks, embeddings, document_id, model))
+        assert len(top) == 3
+        results[f"chunks_{chunk_count}"] = {'vector': vector, 'lexical': lexical, 'hybrid': hybrid}
+    return results
+
+
+@benchmark('stream_questions')
+def bench_stream_questions(app_module, quick):
+    from benchmarks.corpus import make_paragraphs
+
+    db = app_module.db
+    text = '\n\n'.join(make_paragraphs(3000))
+    document_id = db.save_document('stream.txt', text, 'stream', 3000)
+    question_count = 3 if quick else 10
+
+    started = time.perf_counter()
+    sections = app_module.plan_generation(document_id, question_count)
+    events = list(app_module.stream_questions(sections, document_id))
+    elapsed = time.perf_counter() - started
+    generated = sum(1 for e in events if '"question"' in e)
+    return {
+        'questions': generated,
+        'seconds': round(elapsed, 3),
+        'questions_per_second': round(generated / elapsed, 3) if elapsed else None,
+    }
+
+
+@benchmark('submit_answers')
+def bench_submit_answers(app_module, quick):
+    db = app_module.db
+    client = app_module.app.test_client()
+    results = {}
+    for quiz_size, bank_size in ([(10, 50), (50, 500)] if quick else [(10, 50), (10, 1000), (50, 1000), (50, 5000)]):
+        document_id = db.save_document(f"quiz-{quiz_size}-{bank_size}.txt", 'x', f"quiz-{quiz_size}-{bank_size}", 1)
+        question_ids = seed_questions(db, document_id, bank_size)
+        quiz_ids = question_ids[-quiz_size:]
+
+        def submit():
+            session_id = client.post('/api/session/start', json={
+                'document_id': document_id, 'total_questions': quiz_size, 'question_ids': quiz_ids
+            }).json['session_id']
+            response = client.post('/api/submit-answers', json={
+                'document_id': document_id,
+                'session_id': session_id,
+                'answers': {str(qid): 'A' for qid in quiz_ids},
+            })
+            assert response.status_code == 200, response.data
+            return response
+
+        timing, _ = timed(submit, repeat=3)
+        results[f"quiz_{quiz_size}_bank_{bank_size}"] = timing
+    return results
+
+
+@benchmark('analytics')
+def bench_analytics(app_module, quick):
+    db = app_module.db
+    document_id = db.save_document('analytics.txt', 'x', 'analytics', 1)
+    question_ids = seed_questions(db, document_id, 20)
+    results = {}
+    seeded = 0
+    for history_size in ([100, 1000] if quick else [100, 1000, 10000]):
+        with db.get_connection() as conn:
+            cursor = conn.cursor()
+            for i in range(seeded, history_size):
+                session_id = db.insert(
+                    cursor,
+                    "INSERT INTO sessions (document_id, total_questions, correct_answers, status) "
+                    "VALUES (?, 20, ?, 'completed')", (document_id, i % 21)
+                )
+                cursor.executemany(
+                    "INSERT INTO user_attempts (session_id, question_id, user_answer, is_correct) VALUES (?, ?, 'A', ?)",
+                    [(session_id, qid, int((i + j) % 3 == 0)) for j, qid in enumerate(question_ids)]
+                )
+        seeded = history_size
+
+        history, _ = timed(db.get_session_history)
+        overall, _ = timed(db.get_overall_analytics)
+        statistics_timing, _ = timed(lambda: db.get_document_statistics(document_id))
+        details, _ = timed(lambda: db.get_session_details(history_size // 2 or 1))
+        results[f"sessions_{history_size}"] = {
+            'session_history': history,
+            'overall_analytics': overall,
+            'document_statistics': statistics_timing,
+            'session_details': details,
+        }
+    return results
+
+
+@benchmark('http_cache')
+def bench_http_cache(app_module, quick):
+    db = app_module.db
+    client = app_module.app.test_client()
+    document_id = db.save_document('http-cache.txt', 'x', 'http-cache', 1)
+    question_ids = seed_questions(db, document_id, 50)
+    session_id = client.post('/api/session/start', json={
+        'document_id': document_id, 'question_ids': question_ids
+    }).json['session_id']
+    client.post('/api/submit-answers', json={
+        'document_id': document_id, 'session_id': session_id, 'answers': {str(question_ids[0]): 'D'},
+    })
+
+    results = {}
+    for name, url in (('session_history', '/api/session/history'), ('analytics', '/api/analytics'),
+                      ('statistics', f'/api/statistics/{document_id}'), ('session_details', f'/api/session/{session_id}')):
+        def fresh():
+            app_module.http_cache.response_memo.clear()
+            return client.get(url)
+
+        computed, response = timed(fresh)
+        etag = response.headers['ETag']
+        memoized, _ = timed(lambda: client.get(url))
+        revalidated, not_modified = timed(lambda: client.get(url, headers={'If-None-Match': etag}))
+        assert not_modified.status_code == 304, not_modified.status_code
+        compressed = client.get(url, headers={'Accept-Encoding': 'gzip'})
+        results[name] = {
+            'computed': computed,
+            'memoized': memoized,
+            'not_modified': revalidated,
+            'bytes': len(response.get_data()),
+            'gzip_bytes': len(compressed.get_data()),
+        }
+    return results
+
+
+STARTUP_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+try:
+    app.preload()
+    preload_ms = (time.perf_counter() - created) * 1000
+except ImportError:
+    preload_ms = None
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'preload_ms': preload_ms,
+}))
+"""
+
+
+@benchmark('startup')
+def bench_startup(app_module, quick):
+    """Worker boot in a fresh interpreter: importing app, create_app() (which migrates the schema),
+    and the lazily imported SDK/parsers that preload() moves into a preloading master"""
+    env = dict(os.environ)
+    env.pop('LLM_BACKEND', None)  # time the real SDK import when it is installed
+    repeat = 3 if quick else 7
+
+    with tempfile.TemporaryDirectory() as tmp:
+        def boot(db_path):
+            output = subprocess.check_output(
+                [sys.executable, '-c', STARTUP_SCRIPT], cwd=BACKEND_DIR, env=dict(env, DATABASE_PATH=db_path)
+            )
+            return json.loads(output.decode().strip().splitlines()[-1])
+
+        existing_db = os.path.join(tmp, 'existing.db')
+        boot(existing_db)
+        results = {}
+        for name, db_path in (('new_database', None), ('existing_database', existing_db)):
+            samples = [boot(db_path or os.path.join(tmp, f"new-{i}.db")) for i in range(repeat)]
+            results[name] = {
+                key: round(statistics.median(sample[key] for sample in samples), 3)
+                for key in ('import_ms', 'create_app_ms')
+            }
+        preload = [sample['preload_ms'] for sample in samples if sample['preload_ms'] is not None]
+        results['preload_ms'] = round(statistics.median(preload), 3) if preload else None
+    return results
+
+
+def load_app(db_path):
+    os.environ.setdefault('LLM_BACKEND', 'stub')
+    os.environ.setdefault('STUB_LLM_LATENCY', '0')
+    os.environ.setdefault('STUB_EMBED_LATENCY', '0')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ['DATABASE_PATH'] = db_path
+    import app
+    return app
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def flatten(prefix, value, out):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flatten(f"{prefix}.{key}" if prefix else key, item, out)
+    elif isinstance(value, (int, float)):
+        out[prefix] = value
+    return out
+
+
+def compare(old_report, new_report):
+    old = flatten('', old_report.get('results', {}), {})
+    new = flatten('', new_report.get('results', {}), {})
+    lines = []
+    for key in sorted(set(old) & set(new)):
+        if not key.endswith('_ms') and not key.endswith('seconds') and not key.endswith('per_second'):
+            continue
+        before, after = old[key], new[key]
+        change = ((after - before) / before * 100) if before else 0.0
+        lines.append(f"{key:<70} {before:>12} -> {after:>12}  ({change:+.1f}%)")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS), help='run only these benchmarks')
+    parser.add_argument('--quick', action='store_true', help='smaller sizes for a fast smoke run')
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--compare', help='older JSON report to compare against')
+    parser.add_argument('--database-url', help='run against this PostgreSQL database instead of a temporary SQLite file')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app_module = load_app(os.path.join(tmp, 'bench.db'))
+        results = {}
+        for name in args.only or list(BENCHMARKS):
+            print(f"running {name}...", file=sys.stderr)
+            results[name] = BENCHMARKS[name](app_module, args.quick)
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'quick': args.quick,
+            'storage': 'postgres' if args.database_url else 'sqlite',
+            'timestamp': int(time.time()),
+        },
+        'results': results,
+    }
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(json.load(f), report), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
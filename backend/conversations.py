@@ -0,0 +1,81 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import prompt_registry
+from logger import get_logger
+
+# Server-side chat memory. Each conversation keeps its messages in SQLite plus
+# a running summary. The prompt only ever sees the summary and the messages
+# newer than it, and the summary is refreshed in the background every
+# SUMMARY_EVERY_TURNS turns, so prompt size stays flat however long the chat.
+# A refresh folds in at most SUMMARY_CATCH_UP times that many turns, oldest
+# first, so a summary that fell behind (or kept failing) catches up over the
+# next few turns without the per-turn read or the summary prompt growing.
+
+SUMMARY_EVERY_TURNS = int(os.getenv('CONVERSATION_SUMMARY_EVERY_TURNS', '5'))
+SUMMARY_CATCH_UP = 2
+RECENT_MESSAGE_LIMIT = 20
+
+log = get_logger('conversations')
+
+
+class ConversationMemory:
+
+    def __init__(self, db, generate, every_turns=SUMMARY_EVERY_TURNS, max_workers=2):
+        self.db = db
+        self.generate = generate
+        self.every_turns = every_turns
+        self.window = every_turns * 2 * SUMMARY_CATCH_UP
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='conversation-summary')
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def start(self, document_id, language, wrong_questions):
+        return self.db.create_conversation(document_id, language, wrong_questions)
+
+    def load(self, conversation_id):
+        """Return (conversation, recent messages as chat history) or (None, None)"""
+        conversation = self.db.get_conversation(conversation_id)
+        if not conversation:
+            return None, None
+        messages = self.db.get_conversation_messages(
+            conversation_id, after_id=conversation['summarized_through'], limit=RECENT_MESSAGE_LIMIT
+        )
+        history = [{'role': m['role'], 'content': m['content']} for m in messages]
+        return conversation, history
+
+    def record_turn(self, conversation, user_message, ai_response):
+        self.db.add_conversation_messages(
+            conversation['id'], [('user', user_message), ('assistant', ai_response)]
+        )
+        self._maybe_refresh(conversation)
+
+    def _maybe_refresh(self, conversation):
+        conversation_id = conversation['id']
+        with self._lock:
+            if conversation_id in self._in_flight:
+                return
+            self._in_flight.add(conversation_id)
+        pending = self.db.get_unsummarized_messages(
+            conversation_id, conversation['summarized_through'], self.window
+        )
+        if len(pending) < self.every_turns * 2:
+            with self._lock:
+                self._in_flight.discard(conversation_id)
+            return
+        self._executor.submit(self._refresh, conversation_id, conversation.get('summary'), pending)
+
+    def _refresh(self, conversation_id, summary, messages):
+        try:
+            transcript = '\n'.join(f"{m['role']}: {m['content']}" for m in messages)
+            template = prompt_registry.summary_template()
+            prompt = template.render(summary=summary or '(none yet)', messages=transcript)
+            new_summary = self.generate('summary', prompt, template.label).text.strip()
+            self.db.update_conversation_summary(conversation_id, new_summary, messages[-1]['id'])
+            log.info("conversation_summarized", conversation_id=conversation_id, messages=len(messages))
+        except Exception as e:
+            log.warning("conversation_summary_failed", conversation_id=conversation_id, error=str(e))
+        finally:
+            with self._lock:
+                self._in_flight.discard(conversation_id)
@@ -1,126 +1,240 @@
+import abc
 import sqlite3
 import json
+from array import array
 from datetime import datetime
 from contextlib import contextmanager
+from collections import OrderedDict
+import threading
 import os
 
+import metrics
+import migrations
+from logger import get_logger
+
+log = get_logger('database')
+
 # Define the absolute path for the database
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DEFAULT_DB_PATH = os.path.join(BASE_DIR, 'study_assistant.db')
 
-class Database:
+DOCUMENT_META_COLUMNS = 'id, filename, content_hash, word_count, language, upload_date'
+QUESTION_COLUMNS = 'id, question_text, options, correct_answer, explanation, cognitive_level'
+
+# Ids per `id IN (...)` statement, well under SQLite's bound-parameter limit
+IN_BATCH_SIZE = 500
+
+# The hot read queries, shared with QUERY_PLAN_CHECKS below so the plan checks
+# (`python -m migrations check` and tests/test_query_plans.py) EXPLAIN exactly
+# what the methods run.
+QUESTION_EXISTS_SQL = '''
+    SELECT id FROM questions
+    WHERE document_id = ? AND question_hash = ?
+'''
+QUESTIONS_BY_DOCUMENT_SQL = f'''
+    SELECT {QUESTION_COLUMNS}
+    FROM questions
+    WHERE document_id = ?
+    ORDER BY id
+'''
+SESSION_QUESTIONS_SQL = '''
+    SELECT question_id FROM session_questions
+    WHERE session_id = ?
+    ORDER BY position
+'''
+DOCUMENT_QUESTION_COUNT_SQL = '''
+    SELECT COUNT(*) as total FROM questions
+    WHERE document_id = ?
+'''
+DOCUMENT_ATTEMPTS_SQL = '''
+    SELECT COUNT(*) as total FROM user_attempts ua
+    JOIN questions q ON ua.question_id = q.id
+    WHERE q.document_id = ?
+'''
+DOCUMENT_CORRECT_ATTEMPTS_SQL = '''
+    SELECT COUNT(*) as correct FROM user_attempts ua
+    JOIN questions q ON ua.question_id = q.id
+    WHERE q.document_id = ? AND ua.is_correct = 1
+'''
+SESSION_HISTORY_SQL = '''
+    SELECT 
+        s.id, 
+        s.start_time, 
+        s.total_questions, 
+        s.correct_answers,
+        d.filename
+    FROM sessions s
+    JOIN documents d ON s.document_id = d.id
+    WHERE s.status = 'completed'
+    ORDER BY s.start_time DESC
+    LIMIT 10
+'''
+COMPLETED_SESSIONS_SQL = "SELECT COUNT(*) FROM sessions WHERE status = 'completed'"
+COMPLETED_QUESTIONS_SQL = "SELECT SUM(total_questions) FROM sessions WHERE status = 'completed'"
+COMPLETED_CORRECT_SQL = "SELECT SUM(correct_answers) FROM sessions WHERE status = 'completed'"
+AVERAGE_SCORE_SQL = '''
+    SELECT AVG(CAST(correct_answers AS REAL) / total_questions) * 100
+    FROM sessions
+    WHERE status = 'completed' AND total_questions > 0
+'''
+SESSION_WRONG_ATTEMPTS_SQL = '''
+    SELECT question_id, user_answer
+    FROM user_attempts
+    WHERE session_id = ? AND is_correct = 0
+    ORDER BY id
+'''
+CONVERSATION_MESSAGES_SQL = '''
+    SELECT id, role, content FROM conversation_messages
+    WHERE conversation_id = ? AND id > ?
+    ORDER BY id DESC
+'''
+UNSUMMARIZED_MESSAGES_SQL = '''
+    SELECT id, role, content FROM conversation_messages
+    WHERE conversation_id = ? AND id > ?
+    ORDER BY id
+    LIMIT ?
+'''
+
+
+def select_questions_sql(count, by_document=False):
+    sql = f"SELECT {QUESTION_COLUMNS} FROM questions WHERE id IN ({', '.join('?' * count)})"
+    return sql + ' AND document_id = ?' if by_document else sql
+
+
+# (name, sql, params, index the plan must use) for every query above. A check
+# fails when the plan doesn't use that index, falls back to a full scan, or
+# needs a temporary sort (see migrations.check_query_plans).
+QUERY_PLAN_CHECKS = [
+    ('question_exists', QUESTION_EXISTS_SQL, (1, 'x'), 'sqlite_autoindex_questions_1'),
+    ('questions_by_document', QUESTIONS_BY_DOCUMENT_SQL, (1,), 'idx_questions_document_id'),
+    ('questions_by_id', select_questions_sql(3), (1, 2, 3), 'INTEGER PRIMARY KEY'),
+    ('questions_by_id_in_document', select_questions_sql(3, by_document=True), (1, 2, 3, 1), 'INTEGER PRIMARY KEY'),
+    ('session_questions', SESSION_QUESTIONS_SQL, (1,), 'idx_session_questions_position'),
+    ('document_question_count', DOCUMENT_QUESTION_COUNT_SQL, (1,), 'COVERING INDEX'),
+    ('document_attempts', DOCUMENT_ATTEMPTS_SQL, (1,), 'idx_attempts_question_correct'),
+    ('document_correct_attempts', DOCUMENT_CORRECT_ATTEMPTS_SQL, (1,), 'idx_attempts_question_correct'),
+    ('session_history', SESSION_HISTORY_SQL, (), 'idx_sessions_status_start'),
+    ('completed_sessions', COMPLETED_SESSIONS_SQL, (), 'idx_sessions_status_scores'),
+    ('completed_questions', COMPLETED_QUESTIONS_SQL, (), 'idx_sessions_status_scores'),
+    ('completed_correct', COMPLETED_CORRECT_SQL, (), 'idx_sessions_status_scores'),
+    ('average_score', AVERAGE_SCORE_SQL, (), 'idx_sessions_status_scores'),
+    ('session_wrong_attempts', SESSION_WRONG_ATTEMPTS_SQL, (1,), 'idx_attempts_session_correct'),
+    ('conversation_messages', CONVERSATION_MESSAGES_SQL + ' LIMIT ?', (1, 0, 20), 'idx_conversation_messages'),
+    ('unsummarized_messages', UNSUMMARIZED_MESSAGES_SQL, (1, 0, 20), 'idx_conversation_messages'),
+]
+
+
+class DocumentContentCache:
+    """Per-process LRU of hot document texts, bounded by entry count and total characters"""
+
+    def __init__(self, max_entries=32, max_chars=20_000_000):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._items = OrderedDict()
+        self._total_chars = 0
+        self._lock = threading.Lock()
+
+    def get(self, document_id):
+        with self._lock:
+            content = self._items.get(document_id)
+            if content is not None:
+                self._items.move_to_end(document_id)
+            return content
+
+    def put(self, document_id, content):
+        if content is None or len(content) > self.max_chars:
+            return
+        with self._lock:
+            previous = self._items.pop(document_id, None)
+            if previous is not None:
+                self._total_chars -= len(previous)
+            self._items[document_id] = content
+            self._total_chars += len(content)
+            while self._items and (len(self._items) > self.max_entries or self._total_chars > self.max_chars):
+                _, evicted = self._items.popitem(last=False)
+                self._total_chars -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._total_chars = 0
+
+
+class SQLStorage(abc.ABC):
+    """Storage interface: every query the app runs, written in the SQL subset that
+    SQLite and PostgreSQL share (with `?` placeholders). Backends provide
+    get_connection(), init_database(), insert(), enable_foreign_keys() and
+    IntegrityError; see Database (SQLite, below) and postgres_database.PostgresDatabase."""
     
-    def __init__(self, db_path=DEFAULT_DB_PATH): # Use the absolute path as default
-        self.db_path = db_path
-        print(f"Database connection path set to: {self.db_path}") # Debugging line
-        self.init_database()
+    IntegrityError = ()
     
-    @contextmanager
+    def __init__(self, content_cache_size=32):
+        self.content_cache = DocumentContentCache(max_entries=content_cache_size)
+    
+    @abc.abstractmethod
     def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        try:
-            yield conn
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            print(f"Database error: {e}")
-            raise
-        finally:
-            conn.close()
+        """Context manager yielding a connection whose cursors take `?` placeholders; commits on exit"""
     
+    @abc.abstractmethod
     def init_database(self):
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS documents (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    filename TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    content_hash TEXT NOT NULL,
-                    word_count INTEGER,
-                    language TEXT DEFAULT 'en', 
-                    upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS questions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    document_id INTEGER NOT NULL,
-                    question_text TEXT NOT NULL,
-                    question_hash TEXT NOT NULL,
-                    options TEXT NOT NULL,
-                    correct_answer TEXT NOT NULL,
-                    explanation TEXT,
-                    cognitive_level TEXT,
-                    times_shown INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (document_id) REFERENCES documents(id),
-                    UNIQUE(document_id, question_hash)
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS sessions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    document_id INTEGER NOT NULL,
-                    start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    end_time TIMESTAMP,
-                    total_questions INTEGER,
-                    correct_answers INTEGER,
-                    status TEXT DEFAULT 'started',
-                    FOREIGN KEY (document_id) REFERENCES documents(id)
-                )
-            ''')
-
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_attempts (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    question_id INTEGER NOT NULL,
-                    session_id INTEGER NOT NULL,
-                    user_answer TEXT,
-                    is_correct BOOLEAN,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (question_id) REFERENCES questions(id),
-                    FOREIGN KEY (session_id) REFERENCES sessions(id) ON DELETE CASCADE
-                )
-            ''')
-            
-            conn.execute("PRAGMA foreign_keys = ON")
-            
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_document_hash 
-                ON documents(content_hash)
-            ''')
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_question_document 
-                ON questions(document_id)
-            ''')
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_attempts_question 
-                ON user_attempts(question_id)
-            ''')
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_attempts_session
-                ON user_attempts(session_id)
-            ''')
-            
-            print("Database initialized successfully")
+        """Bring the schema up to date"""
+    
+    @abc.abstractmethod
+    def insert(self, cursor, sql, params):
+        """Run an INSERT and return the new row's id"""
+    
+    def enable_foreign_keys(self, cursor):
+        pass
     
     def save_document(self, filename, content, content_hash, word_count, language='en'):
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
-            cursor.execute('''
+            doc_id = self.insert(cursor, '''
                 INSERT INTO documents (filename, content, content_hash, word_count, language)
                 VALUES (?, ?, ?, ?, ?)
             ''', (filename, content, content_hash, word_count, language))
-            
-            doc_id = cursor.lastrowid
-            print(f"Document saved with ID: {doc_id}")
-            return doc_id
+            log.info("document_saved", document_id=doc_id, word_count=word_count)
+        
+        self.content_cache.put(doc_id, content)
+        return doc_id
+
+    def save_documents(self, documents):
+        """Insert many documents, and their BM25 postings when given, in one transaction.
+
+        Each item has filename, content, content_hash, word_count, language and
+        optionally lexical=(chunk_lengths, postings). Returns the new ids in order.
+        """
+        ids = []
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            for document in documents:
+                doc_id = self.insert(cursor, '''
+                    INSERT INTO documents (filename, content, content_hash, word_count, language)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (document['filename'], document['content'], document['content_hash'],
+                      document['word_count'], document.get('language', 'en')))
+                if document.get('lexical'):
+                    self._write_lexical_index(cursor, doc_id, *document['lexical'])
+                ids.append(doc_id)
+        log.info("documents_saved", count=len(ids))
+        return ids
+
+    def find_documents_by_hash(self, content_hashes):
+        """Return {content_hash: document_id} for hashes already stored"""
+        found = {}
+        hashes = list(dict.fromkeys(content_hashes))
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(hashes), IN_BATCH_SIZE):
+                batch = hashes[start:start + IN_BATCH_SIZE]
+                cursor.execute(f'''
+                    SELECT content_hash, MIN(id) FROM documents
+                    WHERE content_hash IN ({', '.join('?' * len(batch))})
+                    GROUP BY content_hash
+                ''', batch)
+                found.update((content_hash, doc_id) for content_hash, doc_id in cursor.fetchall())
+        return found
     
     def get_document(self, document_id):
         with self.get_connection() as conn:
@@ -131,13 +245,46 @@ class Database:
             )
             row = cursor.fetchone()
             return dict(row) if row else None
+
+    def get_document_meta(self, document_id):
+        """Fetch a document's metadata without its (potentially large) content"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f'SELECT {DOCUMENT_META_COLUMNS} FROM documents WHERE id = ?',
+                (document_id,)
+            )
+            row = cursor.fetchone()
+            return dict(row) if row else None
+
+    def get_document_content(self, document_id):
+        """Fetch a document's text, served from the in-process LRU when hot"""
+        content = self.content_cache.get(document_id)
+        metrics.record_cache('document_content', content is not None)
+        if content is not None:
+            return content
+        
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT content FROM documents WHERE id = ?',
+                (document_id,)
+            )
+            row = cursor.fetchone()
+        
+        if not row:
+            return None
+        
+        content = row['content']
+        self.content_cache.put(document_id, content)
+        return content
     
     def save_question(self, document_id, question_data, question_hash):
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
             try:
-                cursor.execute('''
+                q_id = self.insert(cursor, '''
                     INSERT INTO questions 
                     (document_id, question_text, question_hash, options, 
                      correct_answer, explanation, cognitive_level)
@@ -151,34 +298,23 @@ class Database:
                     question_data.get('explanation', ''),
                     question_data.get('cognitive_level', 'Unknown')
                 ))
-                
-                q_id = cursor.lastrowid
-                print(f"Question saved with ID: {q_id}")
+                log.sampled("question_saved", question_id=q_id, document_id=document_id)
                 return q_id
                 
-            except sqlite3.IntegrityError:
-                print(f"Question with hash {question_hash} already exists for document {document_id}")
+            except self.IntegrityError:
+                log.sampled("question_duplicate", document_id=document_id, question_hash=question_hash)
                 return None
     
     def question_exists(self, document_id, question_hash):
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id FROM questions 
-                WHERE document_id = ? AND question_hash = ?
-            ''', (document_id, question_hash))
+            cursor.execute(QUESTION_EXISTS_SQL, (document_id, question_hash))
             return cursor.fetchone() is not None
     
     def get_questions_by_document(self, document_id):
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, question_text, options, correct_answer, 
-                       explanation, cognitive_level
-                FROM questions
-                WHERE document_id = ?
-                ORDER BY id
-            ''', (document_id,))
+            cursor.execute(QUESTIONS_BY_DOCUMENT_SQL, (document_id,))
             
             questions = []
             for row in cursor.fetchall():
@@ -188,14 +324,67 @@ class Database:
             
             return questions
 
-    def start_session(self, document_id, total_questions):
+    def _select_questions(self, cursor, question_ids, document_id=None):
+        """Rows for the given ids by primary key lookups, keyed by id"""
+        rows = {}
+        ids = list(dict.fromkeys(question_ids))
+        for start in range(0, len(ids), IN_BATCH_SIZE):
+            batch = ids[start:start + IN_BATCH_SIZE]
+            params = list(batch)
+            if document_id is not None:
+                params.append(document_id)
+            cursor.execute(select_questions_sql(len(batch), by_document=document_id is not None), params)
+            for row in cursor.fetchall():
+                rows[row['id']] = row
+        return rows
+
+    def get_questions_by_ids(self, question_ids, document_id=None):
+        """Questions in the order given; ids that don't exist (or belong to another document) are skipped"""
+        with self.get_connection() as conn:
+            rows = self._select_questions(conn.cursor(), question_ids, document_id)
+
+        questions = []
+        for question_id in dict.fromkeys(question_ids):
+            if question_id in rows:
+                q = dict(rows[question_id])
+                q['options'] = json.loads(q['options'])
+                questions.append(q)
+        return questions
+
+    def start_session(self, document_id, total_questions, question_ids=None):
+        """Start a quiz; with `question_ids` the session remembers exactly which questions it covers"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
+            if question_ids:
+                rows = self._select_questions(cursor, question_ids, document_id)
+                question_ids = [q_id for q_id in dict.fromkeys(question_ids) if q_id in rows]
+                total_questions = len(question_ids)
+
+            session_id = self.insert(cursor, '''
                 INSERT INTO sessions (document_id, total_questions)
                 VALUES (?, ?)
             ''', (document_id, total_questions))
-            return cursor.lastrowid
+
+            if question_ids:
+                cursor.executemany('''
+                    INSERT INTO session_questions (session_id, question_id, position)
+                    VALUES (?, ?, ?)
+                ''', [(session_id, q_id, position) for position, q_id in enumerate(question_ids)])
+            return session_id
+
+    def get_session_question_ids(self, session_id):
+        """Ids of the questions a session was started with, in quiz order (empty for older sessions)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SESSION_QUESTIONS_SQL, (session_id,))
+            return [row['question_id'] for row in cursor.fetchall()]
+
+    def get_session(self, session_id):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM sessions WHERE id = ?", (session_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
             
     def end_session(self, session_id, correct_answers):
         with self.get_connection() as conn:
@@ -208,6 +397,26 @@ class Database:
                 WHERE id = ?
             ''', (correct_answers, session_id))
 
+    def save_attempts(self, session_id, attempts):
+        """Record a graded session in one transaction; `attempts` is [(question_id, user_answer, is_correct)]"""
+        if not attempts:
+            return
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT INTO user_attempts (session_id, question_id, user_answer, is_correct)
+                VALUES (?, ?, ?, ?)
+            ''', [(session_id, q_id, answer, 1 if correct else 0) for q_id, answer, correct in attempts])
+
+            question_ids = [q_id for q_id, _, _ in attempts]
+            for start in range(0, len(question_ids), IN_BATCH_SIZE):
+                batch = question_ids[start:start + IN_BATCH_SIZE]
+                cursor.execute(f'''
+                    UPDATE questions
+                    SET times_shown = times_shown + 1
+                    WHERE id IN ({', '.join('?' * len(batch))})
+                ''', batch)
+
     def save_attempt(self, session_id, question_id, user_answer, is_correct):
         with self.get_connection() as conn:
             cursor = conn.cursor()
@@ -226,24 +435,13 @@ class Database:
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
-            cursor.execute('''
-                SELECT COUNT(*) as total FROM questions
-                WHERE document_id = ?
-            ''', (document_id,))
+            cursor.execute(DOCUMENT_QUESTION_COUNT_SQL, (document_id,))
             total_questions = cursor.fetchone()['total']
             
-            cursor.execute('''
-                SELECT COUNT(*) as total FROM user_attempts ua
-                JOIN questions q ON ua.question_id = q.id
-                WHERE q.document_id = ?
-            ''', (document_id,))
+            cursor.execute(DOCUMENT_ATTEMPTS_SQL, (document_id,))
             total_attempts = cursor.fetchone()['total']
             
-            cursor.execute('''
-                SELECT COUNT(*) as correct FROM user_attempts ua
-                JOIN questions q ON ua.question_id = q.id
-                WHERE q.document_id = ? AND ua.is_correct = 1
-            ''', (document_id,))
+            cursor.execute(DOCUMENT_CORRECT_ATTEMPTS_SQL, (document_id,))
             correct_attempts = cursor.fetchone()['correct']
             
             accuracy = (correct_attempts / total_attempts * 100) if total_attempts > 0 else 0
@@ -258,19 +456,7 @@ class Database:
     def get_session_history(self):
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT 
-                    s.id, 
-                    s.start_time, 
-                    s.total_questions, 
-                    s.correct_answers,
-                    d.filename
-                FROM sessions s
-                JOIN documents d ON s.document_id = d.id
-                WHERE s.status = 'completed'
-                ORDER BY s.start_time DESC
-                LIMIT 10
-            ''')
+            cursor.execute(SESSION_HISTORY_SQL)
             sessions = []
             for row in cursor.fetchall():
                 s = dict(row)
@@ -292,22 +478,18 @@ class Database:
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
-            cursor.execute("SELECT COUNT(*) FROM sessions WHERE status = 'completed'")
+            cursor.execute(COMPLETED_SESSIONS_SQL)
             total_sessions = cursor.fetchone()[0]
             
-            cursor.execute("SELECT SUM(total_questions) FROM sessions WHERE status = 'completed'")
+            cursor.execute(COMPLETED_QUESTIONS_SQL)
             total_questions = cursor.fetchone()[0] or 0
             
-            cursor.execute("SELECT SUM(correct_answers) FROM sessions WHERE status = 'completed'")
+            cursor.execute(COMPLETED_CORRECT_SQL)
             total_correct = cursor.fetchone()[0] or 0
             
             avg_score = 0
             if total_sessions > 0 and total_questions > 0:
-                cursor.execute('''
-                    SELECT AVG(CAST(correct_answers AS REAL) / total_questions) * 100
-                    FROM sessions
-                    WHERE status = 'completed' AND total_questions > 0
-                ''')
+                cursor.execute(AVERAGE_SCORE_SQL)
                 avg_score_result = cursor.fetchone()[0]
                 avg_score = round(avg_score_result, 2) if avg_score_result is not None else 0
 
@@ -326,21 +508,21 @@ class Database:
             if not session:
                 return None
             
-            cursor.execute('''
-                SELECT q.question_text, q.options, q.correct_answer, q.explanation, ua.user_answer
-                FROM user_attempts ua
-                JOIN questions q ON ua.question_id = q.id
-                WHERE ua.session_id = ? AND ua.is_correct = 0
-            ''', (session_id,))
+            cursor.execute(SESSION_WRONG_ATTEMPTS_SQL, (session_id,))
+            wrong = cursor.fetchall()
+            questions = self._select_questions(cursor, [row['question_id'] for row in wrong])
             
             wrong_answers = []
-            for row in cursor.fetchall():
+            for row in wrong:
+                question = questions.get(row['question_id'])
+                if question is None:
+                    continue
                 wrong_answers.append({
-                    'question': row['question_text'],
-                    'options': json.loads(row['options']),
+                    'question': question['question_text'],
+                    'options': json.loads(question['options']),
                     'user_answer': row['user_answer'],
-                    'correct_answer': row['correct_answer'],
-                    'explanation': row['explanation']
+                    'correct_answer': question['correct_answer'],
+                    'explanation': question['explanation']
                 })
             
             return {
@@ -353,19 +535,223 @@ class Database:
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
-            cursor.execute("PRAGMA foreign_keys = ON")
+            self.enable_foreign_keys(cursor)
             cursor.execute("DELETE FROM user_attempts WHERE session_id = ?", (session_id,))
+            cursor.execute("DELETE FROM session_questions WHERE session_id = ?", (session_id,))
             cursor.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
             
-            print(f"Session {session_id} deleted successfully")
+            log.info("session_deleted", session_id=session_id)
             return cursor.rowcount > 0
 
+    def create_conversation(self, document_id, language='en', wrong_questions=None):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            return self.insert(cursor, '''
+                INSERT INTO conversations (document_id, language, wrong_questions)
+                VALUES (?, ?, ?)
+            ''', (document_id, language, json.dumps(wrong_questions or [], ensure_ascii=False)))
+
+    def get_conversation(self, conversation_id):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, document_id, language, wrong_questions, summary, summarized_through
+                FROM conversations
+                WHERE id = ?
+            ''', (conversation_id,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            conversation = dict(row)
+            conversation['wrong_questions'] = json.loads(conversation['wrong_questions'] or '[]')
+            return conversation
+
+    def add_conversation_messages(self, conversation_id, messages):
+        """Append (role, content) pairs; returns the id of the last message"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            last_id = None
+            for role, content in messages:
+                last_id = self.insert(cursor, '''
+                    INSERT INTO conversation_messages (conversation_id, role, content)
+                    VALUES (?, ?, ?)
+                ''', (conversation_id, role, content))
+            cursor.execute('''
+                UPDATE conversations SET updated_at = CURRENT_TIMESTAMP WHERE id = ?
+            ''', (conversation_id,))
+            return last_id
+
+    def get_conversation_messages(self, conversation_id, after_id=0, limit=None):
+        """Messages newer than `after_id`, oldest first; `limit` keeps only the most recent ones"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            sql = CONVERSATION_MESSAGES_SQL
+            params = (conversation_id, after_id)
+            if limit is not None:
+                sql += ' LIMIT ?'
+                params += (limit,)
+            cursor.execute(sql, params)
+            return [dict(row) for row in reversed(cursor.fetchall())]
+
+    def get_unsummarized_messages(self, conversation_id, after_id, limit):
+        """The oldest `limit` messages newer than `after_id`, oldest first"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(UNSUMMARIZED_MESSAGES_SQL, (conversation_id, after_id, limit))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def update_conversation_summary(self, conversation_id, summary, summarized_through):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE conversations
+                SET summary = ?, summarized_through = ?
+                WHERE id = ? AND summarized_through < ?
+            ''', (summary, summarized_through, conversation_id, summarized_through))
+
+    def save_lexical_index(self, document_id, chunk_lengths, postings):
+        """Replace a document's BM25 postings; `postings` maps term -> [(chunk_index, tf)]"""
+        with self.get_connection() as conn:
+            self._write_lexical_index(conn.cursor(), document_id, chunk_lengths, postings)
+
+    def _write_lexical_index(self, cursor, document_id, chunk_lengths, postings):
+        cursor.execute('DELETE FROM lexical_chunks WHERE document_id = ?', (document_id,))
+        cursor.execute('DELETE FROM lexical_postings WHERE document_id = ?', (document_id,))
+        cursor.executemany('''
+            INSERT INTO lexical_chunks (document_id, chunk_index, length) VALUES (?, ?, ?)
+        ''', [(document_id, i, length) for i, length in enumerate(chunk_lengths)])
+        cursor.executemany('''
+            INSERT INTO lexical_postings (document_id, term, chunk_index, tf) VALUES (?, ?, ?, ?)
+        ''', [(document_id, term, chunk_index, tf)
+              for term, entries in postings.items() for chunk_index, tf in entries])
+
+    def get_lexical_index(self, document_id):
+        """Return (chunk_lengths, postings) or None when the document has not been indexed"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT length FROM lexical_chunks WHERE document_id = ? ORDER BY chunk_index
+            ''', (document_id,))
+            chunk_lengths = [row[0] for row in cursor.fetchall()]
+            if not chunk_lengths:
+                return None
+            cursor.execute('''
+                SELECT term, chunk_index, tf FROM lexical_postings WHERE document_id = ?
+            ''', (document_id,))
+            postings = {}
+            for term, chunk_index, tf in cursor.fetchall():
+                postings.setdefault(term, []).append((chunk_index, tf))
+            return chunk_lengths, postings
+
+    def save_embedding_batches(self, batches):
+        """Checkpoint [(document_id, batch_index, batch_key, model, vectors)] in one transaction, as packed float32"""
+        rows = [
+            (document_id, batch_index, batch_key, model, len(vectors[0]) if vectors else 0,
+             array('f', [value for vector in vectors for value in vector]).tobytes())
+            for document_id, batch_index, batch_key, model, vectors in batches
+        ]
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                DELETE FROM embedding_batches WHERE document_id = ? AND batch_index = ?
+            ''', [row[:2] for row in rows])
+            cursor.executemany('''
+                INSERT INTO embedding_batches (document_id, batch_index, batch_key, model, dimensions, vectors)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+
+    def get_embedding_batches(self, document_id):
+        """Return {batch_index: (batch_key, model, vectors)} for a document's checkpointed batches"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT batch_index, batch_key, model, dimensions, vectors
+                FROM embedding_batches WHERE document_id = ?
+            ''', (document_id,))
+            batches = {}
+            for batch_index, batch_key, model, dimensions, packed in cursor.fetchall():
+                values = array('f')
+                values.frombytes(bytes(packed))
+                vectors = [values[start:start + dimensions].tolist()
+                           for start in range(0, len(values), dimensions)] if dimensions else []
+                batches[batch_index] = (batch_key, model, vectors)
+            return batches
+
+    def get_table_versions(self, tables):
+        """Change counters of `tables` (bumped by triggers on every write), in the order given"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT name, version FROM table_versions
+                WHERE name IN ({', '.join('?' * len(tables))})
+            ''', list(tables))
+            versions = dict(cursor.fetchall())
+        return tuple(versions.get(table) for table in tables)
+
     def clear_all_data(self):
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("PRAGMA foreign_keys = ON")
+            self.enable_foreign_keys(cursor)
+            cursor.execute('DELETE FROM embedding_batches')
+            cursor.execute('DELETE FROM lexical_postings')
+            cursor.execute('DELETE FROM lexical_chunks')
+            cursor.execute('DELETE FROM conversation_messages')
+            cursor.execute('DELETE FROM conversations')
             cursor.execute('DELETE FROM user_attempts')
+            cursor.execute('DELETE FROM session_questions')
             cursor.execute('DELETE FROM questions')
             cursor.execute('DELETE FROM sessions')
             cursor.execute('DELETE FROM documents')
-            print("All data cleared from database")
\ No newline at end of file
+            log.warning("all_data_cleared")
+        
+        self.content_cache.clear()
+
+
+class Database(SQLStorage):
+    """SQLite storage, one file shared by every worker on the host"""
+    
+    IntegrityError = sqlite3.IntegrityError
+    
+    def __init__(self, db_path=DEFAULT_DB_PATH, content_cache_size=32): # Use the absolute path as default
+        super().__init__(content_cache_size)
+        self.db_path = db_path
+        log.info("database_path", db_path=self.db_path)
+        self.init_database()
+    
+    @contextmanager
+    def get_connection(self):
+        with metrics.span('db'):
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            try:
+                yield conn
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                log.error("database_error", error=str(e))
+                raise
+            finally:
+                conn.close()
+    
+    def init_database(self):
+        """Run pending schema migrations; a no-op SELECT once the file is current"""
+        with self.get_connection() as conn:
+            applied = migrations.migrate(conn)
+        if applied:
+            log.info("database_initialized", migrations=applied)
+    
+    def insert(self, cursor, sql, params):
+        cursor.execute(sql, params)
+        return cursor.lastrowid
+    
+    def enable_foreign_keys(self, cursor):
+        cursor.execute("PRAGMA foreign_keys = ON")
+
+
+def open_database(url=None, path=None):
+    """PostgreSQL when DATABASE_URL is a postgres:// URL, otherwise SQLite at DATABASE_PATH"""
+    url = url or os.getenv('DATABASE_URL', '')
+    if url.startswith(('postgres://', 'postgresql://')):
+        from postgres_database import PostgresDatabase
+        return PostgresDatabase(url)
+    return Database(path or os.getenv('DATABASE_PATH', DEFAULT_DB_PATH))
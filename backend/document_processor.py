@@ -1,23 +1,37 @@
-import PyPDF2
-from docx import Document
 import io
 import re
 
+from logger import get_logger
+
+log = get_logger('document_processor')
+
 class DocumentProcessor:
     """Handle different document formats and text extraction"""
     
     SUPPORTED_FORMATS = ['.txt', '.pdf', '.docx', '.md']
     
+    # PyPDF2 and python-docx are imported on first use: most requests never
+    # touch them and they dominate import time otherwise.
+    @staticmethod
+    def preload():
+        """Import the parsers now (e.g. in a preloading server master before forking)"""
+        import PyPDF2  # noqa: F401
+        import docx  # noqa: F401
+    
     def extract_text(self, file):
         """Extract text from uploaded file"""
+        return self.extract(file)[0]
+    
+    def extract(self, file):
+        """Extract (text, page count); formats without pages count as one page"""
         filename = file.filename.lower()
         
         if filename.endswith('.txt') or filename.endswith('.md'):
-            return self._extract_from_txt(file)
+            return self._extract_from_txt(file), 1
         elif filename.endswith('.pdf'):
             return self._extract_from_pdf(file)
         elif filename.endswith('.docx'):
-            return self._extract_from_docx(file)
+            return self._extract_from_docx(file), 1
         else:
             raise ValueError(f"Unsupported file format. Supported formats: {', '.join(self.SUPPORTED_FORMATS)}")
     
@@ -36,7 +50,9 @@ class DocumentProcessor:
                 raise ValueError(f"Could not decode text file: {str(e)}")
     
     def _extract_from_pdf(self, file):
-        """Extract text from PDF file"""
+        """Extract text and page count from PDF file"""
+        import PyPDF2
+        
         try:
             pdf_reader = PyPDF2.PdfReader(io.BytesIO(file.read()))
             
@@ -50,19 +66,21 @@ class DocumentProcessor:
                     if page_text:
                         text += page_text + "\n"
                 except Exception as e:
-                    print(f"Warning: Could not extract text from page {page_num + 1}: {e}")
+                    log.warning("pdf_page_extraction_failed", page=page_num + 1, error=str(e))
                     continue
             
             if not text.strip():
                 raise ValueError("No text could be extracted from PDF")
             
-            return self._clean_text(text)
+            return self._clean_text(text), len(pdf_reader.pages)
             
         except Exception as e:
             raise ValueError(f"Could not extract text from PDF: {str(e)}")
     
     def _extract_from_docx(self, file):
         """Extract text from DOCX file"""
+        from docx import Document
+        
         try:
             doc = Document(io.BytesIO(file.read()))
             text = ""
@@ -0,0 +1,221 @@
+import contextvars
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from logger import get_logger
+
+# Embeds a document's chunks in bounded batches. Batches run concurrently on a
+# small thread pool, every request first takes a token from a shared rate
+# limiter, and a failed batch is retried on its own. Each completed batch is
+# checkpointed in the embedding_batches table (keyed by a hash of the model
+# and its chunk texts), so an interrupted or partly failed ingestion resumes
+# with only the missing batches, and a restarted process reloads embeddings
+# without any API calls.
+#
+# Vectors from different models live in different spaces, so every document
+# is embedded with a single model: the first of `models`, or the next one
+# for the whole document once a batch has failed with it. A document resumes
+# with the model most of its checkpointed batches were made with; batches
+# checkpointed under another model are re-embedded, never mixed in.
+#
+#   EMBED_BATCH_SIZE            chunks per request (default 100, the API's batch limit)
+#   EMBED_CONCURRENCY           requests in flight per call (default 4)
+#   EMBED_REQUESTS_PER_MINUTE   request budget shared by all documents (default 1500, 0 = unlimited)
+#   EMBED_BATCH_ATTEMPTS        tries per batch before the document is left incomplete (default 3)
+
+log = get_logger('embeddings')
+
+BATCH_SIZE = int(os.getenv('EMBED_BATCH_SIZE', '100'))
+CONCURRENCY = int(os.getenv('EMBED_CONCURRENCY', '4'))
+REQUESTS_PER_MINUTE = float(os.getenv('EMBED_REQUESTS_PER_MINUTE', '1500'))
+BATCH_ATTEMPTS = int(os.getenv('EMBED_BATCH_ATTEMPTS', '3'))
+RETRY_BACKOFF_SECONDS = 1.0
+
+
+class RateLimiter:
+    """Token bucket: `per_minute` requests on average, bursts of up to `burst`"""
+
+    def __init__(self, per_minute, burst=None):
+        self.rate = per_minute / 60.0
+        self.burst = burst or max(1, CONCURRENCY)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class EmbeddingError(Exception):
+
+    def __init__(self, document_id, failed, total, error):
+        super().__init__(f"{failed} of {total} embedding batches failed for document {document_id}: {error}")
+        self.failed = failed
+        self.total = total
+
+
+def batch_key(texts, model):
+    digest = hashlib.sha1(model.encode('utf-8'))
+    digest.update(b'\0')
+    for text in texts:
+        digest.update(text.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class EmbeddingPipeline:
+    """`embed_texts(texts, model)` returns one vector per text; `models` in order of preference"""
+
+    def __init__(self, db, embed_texts, models, batch_size=BATCH_SIZE, concurrency=CONCURRENCY,
+                 limiter=None, attempts=BATCH_ATTEMPTS):
+        self.db = db
+        self.embed_texts = embed_texts
+        self.models = tuple(models)
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.limiter = limiter or RateLimiter(REQUESTS_PER_MINUTE)
+        self.attempts = max(1, attempts)
+
+    def embed(self, document_id, chunks):
+        """(model, embeddings) for `chunks` in order; raises EmbeddingError if any batch still fails"""
+        embeddings, errors = self.embed_many([(document_id, chunks)])
+        if errors:
+            raise errors[document_id]
+        return embeddings[document_id]
+
+    def embed_many(self, documents):
+        """Embed [(document_id, chunks)]; returns ({document_id: (model, embeddings)}, {document_id: EmbeddingError}).
+
+        A document is checkpointed as its own batches of up to `batch_size`
+        chunks, but batches of small documents share requests, so a library of
+        short files costs as few API calls as one long book.
+        """
+        batches = {}
+        checkpoints = {}
+        model_index = {}
+        for document_id, chunks in documents:
+            batches[document_id] = [chunks[start:start + self.batch_size]
+                                    for start in range(0, len(chunks), self.batch_size)]
+            checkpoints[document_id] = self.db.get_embedding_batches(document_id) if batches[document_id] else {}
+            model_index[document_id] = self._resume_model(batches[document_id], checkpoints[document_id])
+
+        embeddings = {}
+        errors = {}
+        remaining = list(batches)
+        while remaining:
+            results = {}
+            pending = []
+            for document_id in remaining:
+                model = self.models[model_index[document_id]]
+                stored = self._checkpointed(batches[document_id], checkpoints[document_id], model)
+                results.update(((document_id, index), vectors) for index, vectors in stored.items())
+                pending.extend((document_id, index, model, batch_key(batch, model), batch)
+                               for index, batch in enumerate(batches[document_id]) if index not in stored)
+                if stored:
+                    log.info("embeddings_resumed", document_id=document_id, model=model,
+                             batches=len(batches[document_id]), checkpointed=len(stored))
+
+            completed, failed = self._run(pending)
+            results.update(completed)
+
+            retry = []
+            for document_id in remaining:
+                model = self.models[model_index[document_id]]
+                count = len(batches[document_id])
+                if document_id not in failed:
+                    embeddings[document_id] = (model, [vector for index in range(count)
+                                                       for vector in results[(document_id, index)]])
+                elif model_index[document_id] + 1 < len(self.models):
+                    # Start the whole document over with the next model rather than mix spaces
+                    model_index[document_id] += 1
+                    log.warning("embedding_model_fallback", document_id=document_id, failed_model=model,
+                                model=self.models[model_index[document_id]], error=str(failed[document_id][0]))
+                    retry.append(document_id)
+                else:
+                    errors[document_id] = EmbeddingError(document_id, len(failed[document_id]), count,
+                                                         failed[document_id][0])
+            remaining = retry
+        return embeddings, errors
+
+    def _checkpointed(self, batches, checkpoint, model):
+        """{batch_index: vectors} of the batches already checkpointed under `model`"""
+        stored = {}
+        for index, batch in enumerate(batches):
+            entry = checkpoint.get(index)
+            if entry and entry[0] == batch_key(batch, model) and len(entry[2]) == len(batch):
+                stored[index] = entry[2]
+        return stored
+
+    def _resume_model(self, batches, checkpoint):
+        """Position in `models` of the model with the most reusable checkpointed batches"""
+        if not checkpoint:
+            return 0
+        counts = [len(self._checkpointed(batches, checkpoint, model)) for model in self.models]
+        return counts.index(max(counts))
+
+    def _run(self, pending):
+        """Embed [(document_id, index, model, key, batch)]; returns ({(document_id, index): vectors}, {document_id: [errors]})"""
+        requests = []
+        request_size = 0
+        for unit in sorted(pending, key=lambda unit: unit[2]):
+            if requests and requests[-1][0][2] == unit[2] and request_size + len(unit[4]) <= self.batch_size:
+                requests[-1].append(unit)
+                request_size += len(unit[4])
+            else:
+                requests.append([unit])
+                request_size = len(unit[4])
+
+        completed = {}
+        failed = {}
+        if requests:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(requests))) as pool:
+                futures = [(units, pool.submit(contextvars.copy_context().run, self._embed_request, units))
+                           for units in requests]
+                for units, future in futures:
+                    try:
+                        completed.update(future.result())
+                    except Exception as e:
+                        for unit in units:
+                            failed.setdefault(unit[0], []).append(e)
+        return completed, failed
+
+    def _embed_request(self, units):
+        texts = [text for _, _, _, _, batch in units for text in batch]
+        model = units[0][2]
+        for attempt in range(1, self.attempts + 1):
+            self.limiter.acquire()
+            try:
+                vectors = self.embed_texts(texts, model)
+                if len(vectors) != len(texts):
+                    raise ValueError(f"expected {len(texts)} embeddings, got {len(vectors)}")
+                break
+            except Exception as e:
+                log.warning("embedding_batch_failed", documents=sorted({u[0] for u in units}), model=model,
+                            chunks=len(texts), attempt=attempt, error=str(e))
+                if attempt == self.attempts:
+                    raise
+                time.sleep(RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+
+        completed = {}
+        checkpoints = []
+        offset = 0
+        for document_id, index, _, key, batch in units:
+            completed[(document_id, index)] = vectors[offset:offset + len(batch)]
+            checkpoints.append((document_id, index, key, model, completed[(document_id, index)]))
+            offset += len(batch)
+        self.db.save_embedding_batches(checkpoints)
+        return completed
@@ -0,0 +1,17 @@
+import os
+
+# Picked up automatically when gunicorn is started from the backend directory
+# (see Procfile). The app is imported once in the master and workers are
+# forked from it, so migrations run once and the heavy modules preloaded in
+# when_ready() are shared copy-on-write instead of imported per worker.
+
+preload_app = True
+worker_class = 'uvicorn.workers.UvicornWorker'
+# Each worker serves Flask routes on WSGI_THREADS threads and runs up to
+# ASGI_THREADS database calls at once (see asgi.py); model calls need no thread
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+
+
+def when_ready(server):
+    import app
+    app.preload()
@@ -0,0 +1,96 @@
+import gzip
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is used when it is not installed
+    brotli = None
+
+# Response-layer caching for the read endpoints (history, analytics,
+# statistics, session details). Each response is tied to the change counters
+# of the tables it reads (db.get_table_versions, maintained by triggers on
+# every write; see migrations 5 and 8):
+#
+#   ETag      hash of the endpoint key and those counters; a matching
+#             If-None-Match gets 304 without running any query but the
+#             counter lookup
+#   memo      per-process copy of the serialized (and compressed) body for the
+#             same key and counters, so a write anywhere invalidates it at once;
+#             entries also expire after RESPONSE_MEMO_SECONDS (default 30)
+#
+# JSON bodies of at least COMPRESS_MIN_BYTES (default 1024) are sent with
+# brotli when the client accepts it and the package is installed, else gzip.
+# HTTP_CACHE=0 turns ETags and the memo off; compression stays on.
+
+ENABLED = os.getenv('HTTP_CACHE', '1') != '0'
+MEMO_SECONDS = float(os.getenv('RESPONSE_MEMO_SECONDS', '30'))
+MEMO_ENTRIES = int(os.getenv('RESPONSE_MEMO_ENTRIES', '256'))
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+COMPRESSIBLE_TYPES = ('application/json', 'text/plain', 'text/html')
+
+
+def make_etag(key, versions):
+    return hashlib.sha1(repr((key, versions)).encode('utf-8')).hexdigest()[:20]
+
+
+def choose_encoding(accept_encodings):
+    """'br', 'gzip' or None for a werkzeug Accept-Encoding header"""
+    if brotli is not None and accept_encodings.quality('br') > 0:
+        return 'br'
+    if accept_encodings.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+class ResponseMemo:
+    """LRU of serialized bodies keyed by (endpoint key, table versions)"""
+
+    def __init__(self, max_entries=MEMO_ENTRIES, ttl_seconds=MEMO_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, versions):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['versions'] != versions or time.monotonic() - entry['stored'] > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, versions, body):
+        entry = {'versions': versions, 'stored': time.monotonic(), 'body': body, 'encoded': {}}
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def encoded(self, entry, encoding):
+        """The entry's body compressed with `encoding`, compressed once and kept"""
+        body = entry['encoded'].get(encoding)
+        if body is None:
+            body = entry['encoded'][encoding] = compress(entry['body'], encoding)
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+response_memo = ResponseMemo()
@@ -0,0 +1,198 @@
+"""Bulk-ingest a directory of study material without going through /api/upload.
+
+    cd backend
+    python -m ingest /path/to/library                     # every .txt/.md/.pdf/.docx below it
+    python -m ingest library --language bn --workers 8
+    python -m ingest library --database-url postgresql://...  --json
+
+Files are extracted in a process pool, documents whose text is already stored
+(same content hash as /api/upload uses) are skipped, documents and their BM25
+postings are written in transactions of --batch-documents, and the chunks of
+each transaction are embedded together in full-size, checkpointed requests.
+Ends with a throughput report in documents and pages per second.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from document_processor import DocumentProcessor
+from lexical_index import LexicalIndex
+from logger import get_logger
+
+log = get_logger('ingest')
+
+DEFAULT_BATCH_DOCUMENTS = 100
+
+
+class LocalFile(io.BytesIO):
+    """A file on disk shaped like the upload object DocumentProcessor expects"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            super().__init__(f.read())
+        self.filename = os.path.basename(path)
+
+
+def find_documents(root):
+    """Supported files under `root` in a stable order"""
+    if os.path.isfile(root):
+        return [root]
+    paths = []
+    for directory, subdirectories, filenames in os.walk(root):
+        subdirectories.sort()
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].lower() in DocumentProcessor.SUPPORTED_FORMATS:
+                paths.append(os.path.join(directory, filename))
+    return paths
+
+
+def extract_file(path):
+    """Runs in a worker process; returns a plain dict so it pickles cheaply"""
+    started = time.perf_counter()
+    try:
+        text, pages = DocumentProcessor().extract(LocalFile(path))
+    except Exception as e:
+        return {'path': path, 'error': str(e)}
+    return {
+        'path': path,
+        'filename': os.path.basename(path),
+        'content': text,
+        'content_hash': hashlib.md5(text.encode('utf-8')).hexdigest(),
+        'word_count': len(text.split()),
+        'pages': pages,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+class Ingester:
+
+    def __init__(self, app_module, language='en', batch_documents=DEFAULT_BATCH_DOCUMENTS, embed=True):
+        self.app = app_module
+        self.db = app_module.db
+        self.language = language
+        self.batch_documents = max(1, batch_documents)
+        self.embed = embed
+        self.seen_hashes = set()
+        self.stats = {
+            'files': 0, 'documents': 0, 'pages': 0, 'words': 0, 'chunks': 0,
+            'duplicates': 0, 'failed': 0, 'embedding_failed': 0,
+            'extract_seconds': 0.0, 'write_seconds': 0.0, 'embedding_seconds': 0.0,
+        }
+
+    def run(self, paths, workers=None):
+        started = time.perf_counter()
+        self.stats['files'] = len(paths)
+        pending = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Workers keep extracting while the main process writes and embeds a full batch
+            for result in pool.map(extract_file, paths, chunksize=4):
+                if 'error' in result:
+                    self.stats['failed'] += 1
+                    log.warning("ingest_extract_failed", path=result['path'], error=result['error'])
+                    continue
+                if not result['content']:
+                    self.stats['failed'] += 1
+                    log.warning("ingest_empty_document", path=result['path'])
+                    continue
+                self.stats['extract_seconds'] += result['seconds']
+                pending.append(result)
+                if len(pending) >= self.batch_documents:
+                    self.flush(pending)
+                    pending = []
+        self.flush(pending)
+        self.stats['seconds'] = time.perf_counter() - started
+        return self.report()
+
+    def flush(self, results):
+        if not results:
+            return
+        stored = self.db.find_documents_by_hash([r['content_hash'] for r in results])
+        documents = []
+        for result in results:
+            if result['content_hash'] in stored or result['content_hash'] in self.seen_hashes:
+                self.stats['duplicates'] += 1
+                log.info("ingest_duplicate", path=result['path'], document_id=stored.get(result['content_hash']))
+                continue
+            self.seen_hashes.add(result['content_hash'])
+            chunks = self.app.get_document_chunks(result['content'])
+            documents.append(dict(result, language=self.language, chunks=chunks,
+                                  lexical=LexicalIndex.compute(chunks)))
+        if not documents:
+            return
+
+        started = time.perf_counter()
+        ids = self.db.save_documents(documents)
+        self.stats['write_seconds'] += time.perf_counter() - started
+        for document in documents:
+            self.stats['documents'] += 1
+            self.stats['pages'] += document['pages']
+            self.stats['words'] += document['word_count']
+            self.stats['chunks'] += len(document['chunks'])
+
+        if self.embed:
+            started = time.perf_counter()
+            _, errors = self.app.embedding_pipeline.embed_many(
+                [(document_id, document['chunks']) for document_id, document in zip(ids, documents)]
+            )
+            self.stats['embedding_seconds'] += time.perf_counter() - started
+            for document_id, error in errors.items():
+                # The document is stored; its missing batches are embedded on first use
+                self.stats['embedding_failed'] += 1
+                log.warning("ingest_embedding_incomplete", document_id=document_id, error=str(error))
+        log.info("ingest_batch_saved", documents=len(ids))
+
+    def report(self):
+        seconds = self.stats['seconds']
+        report = {key: round(value, 3) if isinstance(value, float) else value for key, value in self.stats.items()}
+        report['documents_per_second'] = round(self.stats['documents'] / seconds, 2) if seconds else None
+        report['pages_per_second'] = round(self.stats['pages'] / seconds, 2) if seconds else None
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='directory (searched recursively) or a single file')
+    parser.add_argument('--language', default='en', help='language recorded for every document (default en)')
+    parser.add_argument('--workers', type=int, default=None, help='extraction processes (default: CPU count)')
+    parser.add_argument('--batch-documents', type=int, default=DEFAULT_BATCH_DOCUMENTS,
+                        help=f'documents per transaction and embedding round (default {DEFAULT_BATCH_DOCUMENTS})')
+    parser.add_argument('--no-embed', action='store_true', help='skip embeddings; they are created on first use')
+    parser.add_argument('--db', help='SQLite file (default DATABASE_PATH or backend/study_assistant.db)')
+    parser.add_argument('--database-url', help='PostgreSQL URL (default DATABASE_URL)')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    if args.db:
+        os.environ['DATABASE_PATH'] = args.db
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    import app  # its services open the database selected above on first use
+
+    paths = find_documents(args.path)
+    if not paths:
+        print(f"no {', '.join(DocumentProcessor.SUPPORTED_FORMATS)} files under {args.path}", file=sys.stderr)
+        return 1
+
+    ingester = Ingester(app, language=args.language, batch_documents=args.batch_documents, embed=not args.no_embed)
+    report = ingester.run(paths, workers=args.workers)
+
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print(f"{report['documents']} documents ({report['pages']} pages, {report['words']} words, "
+              f"{report['chunks']} chunks) in {report['seconds']:.2f}s")
+        print(f"  {report['documents_per_second']} documents/s, {report['pages_per_second']} pages/s")
+        print(f"  skipped {report['duplicates']} duplicates, {report['failed']} unreadable files; "
+              f"{report['embedding_failed']} documents left to embed on first use")
+        print(f"  extraction {report['extract_seconds']:.2f}s (summed over workers), "
+              f"writes {report['write_seconds']:.2f}s, embeddings {report['embedding_seconds']:.2f}s")
+    return 1 if report['failed'] == report['files'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
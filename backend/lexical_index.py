@@ -0,0 +1,115 @@
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+
+import metrics
+
+# Per-document BM25 inverted index. Postings are built once at ingestion and
+# stored in SQLite (lexical_chunks / lexical_postings); queries run against an
+# in-memory copy kept in a small LRU, so lookups need no remote call at all.
+
+# \w alone splits Bengali words at vowel signs (combining marks), so the
+# Bengali block is matched explicitly.
+TOKEN_RE = re.compile(r'[\wঀ-৿]+', re.UNICODE)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class DocumentIndex:
+
+    def __init__(self, chunk_lengths, postings):
+        self.chunk_lengths = chunk_lengths
+        self.postings = postings
+        self.chunk_count = len(chunk_lengths)
+        self.avg_length = (sum(chunk_lengths) / self.chunk_count) if self.chunk_count else 0.0
+
+    def search(self, query, top_k=20):
+        """Return [(chunk_index, score)] best first"""
+        if not self.chunk_count:
+            return []
+        scores = {}
+        for term in set(tokenize(query)):
+            entries = self.postings.get(term)
+            if not entries:
+                continue
+            df = len(entries)
+            idf = math.log(1 + (self.chunk_count - df + 0.5) / (df + 0.5))
+            for chunk_index, tf in entries:
+                length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.chunk_lengths[chunk_index] / self.avg_length)
+                scores[chunk_index] = scores.get(chunk_index, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + length_norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+
+
+class LexicalIndex:
+
+    def __init__(self, db, max_documents=64):
+        self.db = db
+        self.max_documents = max_documents
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def compute(chunks):
+        """Return (chunk_lengths, postings) for a document's chunks without storing them"""
+        chunk_lengths = []
+        postings = {}
+        for chunk_index, chunk in enumerate(chunks):
+            terms = Counter(tokenize(chunk))
+            chunk_lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                postings.setdefault(term, []).append((chunk_index, tf))
+        return chunk_lengths, postings
+
+    def build(self, document_id, chunks):
+        chunk_lengths, postings = self.compute(chunks)
+        self.db.save_lexical_index(document_id, chunk_lengths, postings)
+        index = DocumentIndex(chunk_lengths, postings)
+        self._remember(document_id, index)
+        return index
+
+    def get(self, document_id):
+        with self._lock:
+            index = self._indexes.get(document_id)
+            if index is not None:
+                self._indexes.move_to_end(document_id)
+        metrics.record_cache('lexical_index', index is not None)
+        if index is not None:
+            return index
+
+        stored = self.db.get_lexical_index(document_id)
+        if stored is None:
+            return None
+        index = DocumentIndex(*stored)
+        self._remember(document_id, index)
+        return index
+
+    def ensure(self, document_id, chunks):
+        """Index built at ingestion, or built now for documents uploaded before the index existed"""
+        return self.get(document_id) or self.build(document_id, chunks)
+
+    def _remember(self, document_id, index):
+        with self._lock:
+            self._indexes[document_id] = index
+            self._indexes.move_to_end(document_id)
+            while len(self._indexes) > self.max_documents:
+                self._indexes.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+def reciprocal_rank_fusion(*rankings, k=RRF_K):
+    """Fuse ranked lists of chunk indices; returns indices best first"""
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_index in enumerate(ranking):
+            scores[chunk_index] = scores.get(chunk_index, 0.0) + 1.0 / (k + rank + 1)
+    return [chunk_index for chunk_index, _ in sorted(scores.items(), key=lambda item: (-item[1], item[0]))]
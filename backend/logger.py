@@ -0,0 +1,164 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+
+# Structured, non-blocking logging. Records are pushed onto a bounded queue by
+# the request threads and written to stdout by a single background listener,
+# so a slow stdout never stalls a request.
+#
+#   LOG_LEVEL        DEBUG / INFO / WARNING / ERROR (default INFO)
+#   LOG_FORMAT       json (default) or text
+#   LOG_SAMPLE_RATE  fraction of high-volume events that are kept (default 0.1)
+#   LOG_QUEUE_SIZE   max buffered records before new ones are dropped (default 10000)
+
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '0.1'))
+
+_listener = None
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+
+def set_request_id(request_id=None):
+    request_id = request_id or new_request_id()
+    request_id_var.set(request_id)
+    return request_id
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'event': record.getMessage(),
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            entry['request_id'] = request_id
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+
+    def format(self, record):
+        fields = ' '.join(f'{key}={value}' for key, value in getattr(record, 'fields', {}).items())
+        request_id = getattr(record, 'request_id', None)
+        prefix = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.created))
+        line = f"{prefix} {record.levelname:<7} {record.name} [{request_id or '-'}] {record.getMessage()}"
+        if fields:
+            line += ' ' + fields
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the caller: when the queue is full the record is dropped and counted"""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Resolve everything that depends on the caller's state before the
+        # record crosses to the listener thread.
+        record = copy.copy(record)
+        record.request_id = request_id_var.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+def configure_logging():
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if os.getenv('LOG_FORMAT', 'json') == 'text':
+        stream_handler.setFormatter(TextFormatter())
+    else:
+        stream_handler.setFormatter(JsonFormatter())
+
+    queue_size = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    log_queue = queue.Queue(maxsize=queue_size)
+    root = logging.getLogger('study_assistant')
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    queue_handler = DroppingQueueHandler(log_queue)
+    root.addHandler(queue_handler)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    def restart_in_child():
+        # Only the forking thread survives fork(), so a worker forked from a
+        # preloading master needs its own queue and listener thread.
+        child_queue = queue.Queue(maxsize=queue_size)
+        queue_handler.queue = child_queue
+        _listener.queue = child_queue
+        _listener.start()
+
+    os.register_at_fork(after_in_child=restart_in_child)
+
+
+class StructuredLogger:
+    """`log.info('question_saved', question_id=7)` -> one structured record"""
+
+    def __init__(self, name):
+        self._logger = logging.getLogger(f'study_assistant.{name}')
+
+    def _log(self, level, event, fields, exc_info=False):
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, event, extra={'fields': fields}, exc_info=exc_info)
+
+    def debug(self, event, **fields):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event, **fields):
+        self._log(logging.ERROR, event, fields)
+
+    def exception(self, event, **fields):
+        self._log(logging.ERROR, event, fields, exc_info=True)
+
+    def sampled(self, event, rate=None, **fields):
+        """Info-level event that is only kept for a fraction of calls (high-volume paths)"""
+        rate = SAMPLE_RATE if rate is None else rate
+        if rate >= 1 or random.random() < rate:
+            self._log(logging.INFO, event, dict(fields, sample_rate=rate))
+
+
+def get_logger(name):
+    configure_logging()
+    return StructuredLogger(name)
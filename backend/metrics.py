@@ -0,0 +1,249 @@
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+
+# Lightweight in-process metrics with Prometheus text exposition.
+# Set METRICS_ENABLED=0 to turn every recording call into a no-op.
+#
+# Every process keeps its own registry, and a scrape of /api/metrics is
+# answered by whichever worker takes the request. Each series is therefore
+# labelled with the worker's pid: a worker's counters only ever go up, and
+# totals are a sum over pids (e.g. `sum without (pid) (rate(...))`), for the
+# workers that scrapes have reached.
+
+ENABLED = os.getenv('METRICS_ENABLED', '1') != '0'
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_NULL_SPAN = nullcontext()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key, extra=None, const=()):
+    pairs = list(const) + list(key) + (list(extra) if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class Counter:
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if not ENABLED:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self, const=()):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(key, const=const)} {value}')
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if not ENABLED:
+            return
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self, const=()):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = [(key, (list(s[0]), s[1], s[2])) for key, s in self._series.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{_format_labels(key, [("le", bound)], const)} {cumulative}')
+            lines.append(f'{self.name}_bucket{_format_labels(key, [("le", "+Inf")], const)} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(key, const=const)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(key, const=const)} {count}')
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text):
+        metric = Counter(name, help_text)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        # Read at render time, so workers forked from a preloading master each report their own
+        const = (('pid', os.getpid()),)
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(const))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_seconds = registry.histogram(
+    'study_assistant_request_seconds', 'HTTP request latency by endpoint'
+)
+span_seconds = registry.histogram(
+    'study_assistant_span_seconds', 'Time spent in instrumented phases (extraction, embedding, retrieval, llm, db, ...)'
+)
+llm_requests = registry.counter(
+    'study_assistant_llm_requests_total', 'LLM calls by kind, prompt version and outcome'
+)
+llm_tokens = registry.counter(
+    'study_assistant_llm_tokens_total',
+    'LLM tokens by kind, prompt version and direction (estimated when the API reports no usage)'
+)
+llm_seconds = registry.histogram(
+    'study_assistant_llm_seconds', 'LLM call latency by kind and prompt version'
+)
+generation_retries = registry.counter(
+    'study_assistant_generation_retries_total', 'Question generation retries by reason'
+)
+cache_lookups = registry.counter(
+    'study_assistant_cache_lookups_total', 'Cache lookups by cache and result (hit/miss)'
+)
+slow_requests = registry.counter(
+    'study_assistant_slow_requests_total', 'Requests over SLOW_REQUEST_SECONDS by endpoint'
+)
+
+# Per-request phase totals for the slow-request log (profiling.py). The
+# recorder is set at the start of a request and inherited by the threads it
+# hands work to (asyncio.to_thread and the embedding pool copy the context).
+# Phases can nest (retrieval includes its db queries), so `covered` counts
+# only the outermost spans.
+request_phases = contextvars.ContextVar('request_phases', default=None)
+_span_depth = contextvars.ContextVar('span_depth', default=0)
+
+
+class PhaseRecorder:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.covered = 0.0
+        self._phases = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, outermost):
+        with self._lock:
+            phase = self._phases.get(name)
+            if phase is None:
+                phase = self._phases[name] = [0.0, 0]
+            phase[0] += seconds
+            phase[1] += 1
+            if outermost:
+                self.covered += seconds
+
+    def breakdown(self):
+        """{phase: {'seconds', 'calls'}}, slowest first"""
+        with self._lock:
+            items = sorted(self._phases.items(), key=lambda item: -item[1][0])
+        return {name: {'seconds': round(seconds, 4), 'calls': calls} for name, (seconds, calls) in items}
+
+
+@contextmanager
+def _span(name):
+    phases = request_phases.get()
+    if phases is not None:
+        _span_depth.set(_span_depth.get() + 1)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        if ENABLED:
+            span_seconds.observe(seconds, span=name)
+        if phases is not None:
+            depth = _span_depth.get() - 1
+            _span_depth.set(depth)
+            phases.add(name, seconds, outermost=depth == 0)
+
+
+def span(name):
+    """Time a block of work: `with metrics.span('embedding'): ...`"""
+    return _span(name) if ENABLED or request_phases.get() is not None else _NULL_SPAN
+
+
+def observe_request(endpoint, method, status, seconds):
+    request_seconds.observe(seconds, endpoint=endpoint, method=method, status=status)
+
+
+def record_cache(cache, hit):
+    cache_lookups.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def estimate_tokens(text):
+    # ~4 characters per token is the usual rule of thumb for Gemini tokenizers
+    return max(1, len(text) // 4) if text else 0
+
+
+def record_llm_call(kind, prompt, response=None, outcome='ok', prompt_version=None, seconds=None):
+    if not ENABLED:
+        return
+    prompt_version = prompt_version or 'none'
+    llm_requests.inc(kind=kind, prompt_version=prompt_version, outcome=outcome)
+    if seconds is not None:
+        llm_seconds.observe(seconds, kind=kind, prompt_version=prompt_version)
+    if response is None:
+        return
+    usage = getattr(response, 'usage_metadata', None)
+    prompt_tokens = getattr(usage, 'prompt_token_count', None) if usage else None
+    completion_tokens = getattr(usage, 'candidates_token_count', None) if usage else None
+    if prompt_tokens is None:
+        prompt_tokens = estimate_tokens(prompt)
+    if completion_tokens is None:
+        try:
+            completion_tokens = estimate_tokens(response.text)
+        except Exception:
+            completion_tokens = 0
+    llm_tokens.inc(prompt_tokens, kind=kind, prompt_version=prompt_version, direction='prompt')
+    llm_tokens.inc(completion_tokens, kind=kind, prompt_version=prompt_version, direction='completion')
+
+
+def render():
+    return registry.render()
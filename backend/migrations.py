@@ -0,0 +1,582 @@
+"""Versioned schema migrations.
+
+    cd backend
+    python -m migrations status        # current version and pending migrations
+    python -m migrations upgrade       # apply pending migrations (the app also does this at start)
+    python -m migrations check         # EXPLAIN QUERY PLAN the hot queries, fail if an index is unused
+"""
+import argparse
+import os
+import sqlite3
+import sys
+
+from logger import get_logger
+
+# Versioned schema migrations. Each migration runs once per database and is
+# recorded in schema_version, so a normal process start costs one SELECT
+# instead of re-running every CREATE TABLE / CREATE INDEX. Statements use
+# IF NOT EXISTS so databases created before versioning migrate cleanly.
+#
+# To change the schema, append a migration with the next version number;
+# never edit one that has shipped.
+
+log = get_logger('migrations')
+
+# Tables whose writes invalidate cached API responses (see migration 5)
+VERSIONED_TABLES = ('documents', 'questions', 'sessions', 'user_attempts')
+
+MIGRATIONS = [
+    (1, 'initial schema', [
+        '''
+        CREATE TABLE IF NOT EXISTS documents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT NOT NULL,
+            content TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            word_count INTEGER,
+            language TEXT DEFAULT 'en', 
+            upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            document_id INTEGER NOT NULL,
+            question_text TEXT NOT NULL,
+            question_hash TEXT NOT NULL,
+            options TEXT NOT NULL,
+            correct_answer TEXT NOT NULL,
+            explanation TEXT,
+            cognitive_level TEXT,
+            times_shown INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (document_id) REFERENCES documents(id),
+            UNIQUE(document_id, question_hash)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            document_id INTEGER NOT NULL,
+            start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            end_time TIMESTAMP,
+            total_questions INTEGER,
+            correct_answers INTEGER,
+            status TEXT DEFAULT 'started',
+            FOREIGN KEY (document_id) REFERENCES documents(id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_attempts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            question_id INTEGER NOT NULL,
+            session_id INTEGER NOT NULL,
+            user_answer TEXT,
+            is_correct BOOLEAN,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (question_id) REFERENCES questions(id),
+            FOREIGN KEY (session_id) REFERENCES sessions(id) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            document_id INTEGER NOT NULL,
+            language TEXT DEFAULT 'en',
+            wrong_questions TEXT,
+            summary TEXT,
+            summarized_through INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (document_id) REFERENCES documents(id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS conversation_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS lexical_chunks (
+            document_id INTEGER NOT NULL,
+            chunk_index INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            PRIMARY KEY (document_id, chunk_index)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS lexical_postings (
+            document_id INTEGER NOT NULL,
+            term TEXT NOT NULL,
+            chunk_index INTEGER NOT NULL,
+            tf INTEGER NOT NULL,
+            PRIMARY KEY (document_id, term, chunk_index)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_document_hash 
+        ON documents(content_hash)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_question_document 
+        ON questions(document_id)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_attempts_question 
+        ON user_attempts(question_id)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_attempts_session
+        ON user_attempts(session_id)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_conversation_messages
+        ON conversation_messages(conversation_id, id)
+        ''',
+    ]),
+    (2, 'covering indexes for history, analytics and grading queries', [
+        # Session history: WHERE status = 'completed' ORDER BY start_time DESC LIMIT 10
+        '''
+        CREATE INDEX IF NOT EXISTS idx_sessions_status_start
+        ON sessions(status, start_time)
+        ''',
+        # Overall analytics aggregates over completed sessions, read from the index alone
+        '''
+        CREATE INDEX IF NOT EXISTS idx_sessions_status_scores
+        ON sessions(status, total_questions, correct_answers)
+        ''',
+        # Session details (wrong answers of one session); supersedes idx_attempts_session
+        '''
+        CREATE INDEX IF NOT EXISTS idx_attempts_session_correct
+        ON user_attempts(session_id, is_correct)
+        ''',
+        'DROP INDEX IF EXISTS idx_attempts_session',
+        # Document statistics join attempts by question and filter on is_correct
+        '''
+        CREATE INDEX IF NOT EXISTS idx_attempts_question_correct
+        ON user_attempts(question_id, is_correct)
+        ''',
+        'DROP INDEX IF EXISTS idx_attempts_question',
+        # questions(document_id, question_hash) is already the UNIQUE constraint's index,
+        # which also covers lookups by document_id alone
+        'DROP INDEX IF EXISTS idx_question_document',
+        'ANALYZE',
+    ]),
+    (3, 'questions drawn for each session', [
+        # Grading and session details look up a quiz's questions by primary key
+        # instead of reading the document's whole bank
+        '''
+        CREATE TABLE IF NOT EXISTS session_questions (
+            session_id INTEGER NOT NULL,
+            question_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (session_id, question_id),
+            FOREIGN KEY (session_id) REFERENCES sessions(id) ON DELETE CASCADE,
+            FOREIGN KEY (question_id) REFERENCES questions(id)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    (4, 'checkpointed embedding batches', [
+        # float32 vectors of one batch of a document's chunks; batch_key is a hash
+        # of the batch's chunk texts so a re-chunked document is not mixed up
+        '''
+        CREATE TABLE IF NOT EXISTS embedding_batches (
+            document_id INTEGER NOT NULL,
+            batch_index INTEGER NOT NULL,
+            batch_key TEXT NOT NULL,
+            dimensions INTEGER NOT NULL,
+            vectors BLOB NOT NULL,
+            PRIMARY KEY (document_id, batch_index)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    (5, 'per-table change counters for HTTP caching', [
+        # Read endpoints derive their ETags from these counters; triggers bump
+        # them on every write, whichever code path (or process) made it.
+        # Counters start at a random value so a new database never reuses the
+        # ETags of an old one.
+        '''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        *(f"INSERT OR IGNORE INTO table_versions (name, version) VALUES ('{table}', abs(random() % 1000000000))"
+          for table in VERSIONED_TABLES),
+        *(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version AFTER {event} ON {table}
+        BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+        END
+        ''' for table in VERSIONED_TABLES for event in ('INSERT', 'UPDATE', 'DELETE')),
+    ]),
+    (6, 'ordered index for a document\'s question bank', [
+        # Migration 2 dropped idx_question_document on the assumption that the
+        # (document_id, question_hash) unique index covers it, but that index
+        # can't return get_questions_by_document's rows in id order without a
+        # temporary sort
+        'CREATE INDEX IF NOT EXISTS idx_questions_document_id ON questions(document_id, id)',
+        'ANALYZE',
+    ]),
+    (7, 'embedding model recorded with each checkpointed batch', [
+        # A document's vectors must all come from one model. Batches written
+        # before this migration don't say which model made them (a failed
+        # request fell back to another model for that batch alone), so they
+        # are dropped and the documents re-embedded on first use.
+        'DELETE FROM embedding_batches',
+        "ALTER TABLE embedding_batches ADD COLUMN model TEXT NOT NULL DEFAULT ''",
+    ]),
+    (8, 'table change counters without a shared row to lock', [
+        # PostgreSQL only: SQLite already serialises every writer on the file,
+        # so its per-table counter rows cost nothing extra
+    ]),
+    (9, 'session questions in quiz order', [
+        # The (session_id, question_id) primary key returns a session's
+        # questions in id order; grading wants them by position
+        '''
+        CREATE INDEX IF NOT EXISTS idx_session_questions_position
+        ON session_questions(session_id, position, question_id)
+        ''',
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# The same schema versions for PostgreSQL (postgres_database.PostgresDatabase).
+# Keep version numbers and descriptions in step with MIGRATIONS.
+POSTGRES_MIGRATIONS = [
+    (1, 'initial schema', [
+        '''
+        CREATE TABLE IF NOT EXISTS documents (
+            id SERIAL PRIMARY KEY,
+            filename TEXT NOT NULL,
+            content TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            word_count INTEGER,
+            language TEXT DEFAULT 'en',
+            upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS questions (
+            id SERIAL PRIMARY KEY,
+            document_id INTEGER NOT NULL REFERENCES documents(id),
+            question_text TEXT NOT NULL,
+            question_hash TEXT NOT NULL,
+            options TEXT NOT NULL,
+            correct_answer TEXT NOT NULL,
+            explanation TEXT,
+            cognitive_level TEXT,
+            times_shown INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(document_id, question_hash)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id SERIAL PRIMARY KEY,
+            document_id INTEGER NOT NULL REFERENCES documents(id),
+            start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            end_time TIMESTAMP,
+            total_questions INTEGER,
+            correct_answers INTEGER,
+            status TEXT DEFAULT 'started'
+        )
+        ''',
+        # is_correct stays an integer so the shared queries can compare it with 0/1
+        '''
+        CREATE TABLE IF NOT EXISTS user_attempts (
+            id SERIAL PRIMARY KEY,
+            question_id INTEGER NOT NULL REFERENCES questions(id),
+            session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+            user_answer TEXT,
+            is_correct INTEGER,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS conversations (
+            id SERIAL PRIMARY KEY,
+            document_id INTEGER NOT NULL REFERENCES documents(id),
+            language TEXT DEFAULT 'en',
+            wrong_questions TEXT,
+            summary TEXT,
+            summarized_through INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS conversation_messages (
+            id SERIAL PRIMARY KEY,
+            conversation_id INTEGER NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS lexical_chunks (
+            document_id INTEGER NOT NULL,
+            chunk_index INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            PRIMARY KEY (document_id, chunk_index)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS lexical_postings (
+            document_id INTEGER NOT NULL,
+            term TEXT NOT NULL,
+            chunk_index INTEGER NOT NULL,
+            tf INTEGER NOT NULL,
+            PRIMARY KEY (document_id, term, chunk_index)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_document_hash ON documents(content_hash)',
+        'CREATE INDEX IF NOT EXISTS idx_question_document ON questions(document_id)',
+        'CREATE INDEX IF NOT EXISTS idx_attempts_question ON user_attempts(question_id)',
+        'CREATE INDEX IF NOT EXISTS idx_attempts_session ON user_attempts(session_id)',
+        'CREATE INDEX IF NOT EXISTS idx_conversation_messages ON conversation_messages(conversation_id, id)',
+    ]),
+    (2, 'covering indexes for history, analytics and grading queries', [
+        'CREATE INDEX IF NOT EXISTS idx_sessions_status_start ON sessions(status, start_time)',
+        'CREATE INDEX IF NOT EXISTS idx_sessions_status_scores ON sessions(status, total_questions, correct_answers)',
+        'CREATE INDEX IF NOT EXISTS idx_attempts_session_correct ON user_attempts(session_id, is_correct)',
+        'DROP INDEX IF EXISTS idx_attempts_session',
+        'CREATE INDEX IF NOT EXISTS idx_attempts_question_correct ON user_attempts(question_id, is_correct)',
+        'DROP INDEX IF EXISTS idx_attempts_question',
+        'DROP INDEX IF EXISTS idx_question_document',
+        'ANALYZE',
+    ]),
+    (3, 'questions drawn for each session', [
+        '''
+        CREATE TABLE IF NOT EXISTS session_questions (
+            session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+            question_id INTEGER NOT NULL REFERENCES questions(id),
+            position INTEGER NOT NULL,
+            PRIMARY KEY (session_id, question_id)
+        )
+        ''',
+    ]),
+    (4, 'checkpointed embedding batches', [
+        '''
+        CREATE TABLE IF NOT EXISTS embedding_batches (
+            document_id INTEGER NOT NULL,
+            batch_index INTEGER NOT NULL,
+            batch_key TEXT NOT NULL,
+            dimensions INTEGER NOT NULL,
+            vectors BYTEA NOT NULL,
+            PRIMARY KEY (document_id, batch_index)
+        )
+        ''',
+    ]),
+    (5, 'per-table change counters for HTTP caching', [
+        '''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version BIGINT NOT NULL
+        )
+        ''',
+        *(f'''
+        INSERT INTO table_versions (name, version) VALUES ('{table}', floor(random() * 1000000000))
+        ON CONFLICT (name) DO NOTHING
+        ''' for table in VERSIONED_TABLES),
+        '''
+        CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+        BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = TG_TABLE_NAME;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        ''',
+        *(f'''
+        CREATE TRIGGER {table}_version AFTER INSERT OR UPDATE OR DELETE ON {table}
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()
+        ''' for table in VERSIONED_TABLES),
+    ]),
+    (6, 'ordered index for a document\'s question bank', [
+        'CREATE INDEX IF NOT EXISTS idx_questions_document_id ON questions(document_id, id)',
+        'ANALYZE',
+    ]),
+    (7, 'embedding model recorded with each checkpointed batch', [
+        'DELETE FROM embedding_batches',
+        "ALTER TABLE embedding_batches ADD COLUMN IF NOT EXISTS model TEXT NOT NULL DEFAULT ''",
+    ]),
+    (8, 'table change counters without a shared row to lock', [
+        # Migration 5's triggers updated one table_versions row per table, so
+        # every writing transaction, in every worker, queued on that row's
+        # lock until the previous writer committed. Now each writing
+        # transaction inserts its own (table, txid) row instead, and a table's
+        # version is table_versions.version plus its number of change rows,
+        # i.e. a count of committed writes that becomes visible atomically
+        # with the data. PostgresDatabase.get_table_versions folds the rows
+        # back into table_versions once there are enough of them.
+        '''
+        CREATE TABLE IF NOT EXISTS table_changes (
+            name TEXT NOT NULL,
+            txid BIGINT NOT NULL,
+            PRIMARY KEY (name, txid)
+        )
+        ''',
+        '''
+        CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO table_changes (name, txid) VALUES (TG_TABLE_NAME, txid_current())
+            ON CONFLICT DO NOTHING;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        ''',
+    ]),
+    (9, 'session questions in quiz order', [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_session_questions_position
+        ON session_questions(session_id, position, question_id)
+        ''',
+    ]),
+]
+
+# Arbitrary key for the advisory lock that serialises PostgreSQL migrations
+POSTGRES_MIGRATION_LOCK = 7_341_026
+
+
+def current_version(conn):
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+
+def pending_migrations(conn):
+    version = current_version(conn)
+    return [migration for migration in MIGRATIONS if migration[0] > version]
+
+
+def migrate(conn):
+    """Apply pending migrations; returns the versions applied (usually none)"""
+    if not pending_migrations(conn):
+        return []
+
+    # Serialise concurrent workers starting against the same file
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        applied = []
+        for version, description, statements in pending_migrations(conn):
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)", (version, description)
+            )
+            applied.append(version)
+            log.info("migration_applied", version=version, description=description)
+        conn.execute("COMMIT")
+        return applied
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+
+def migrate_postgres(conn):
+    """PostgreSQL counterpart of migrate() on a psycopg2 connection; the caller commits"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+    if cursor.fetchone()[0]:
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        if cursor.fetchone()[0] >= POSTGRES_MIGRATIONS[-1][0]:
+            return []
+
+    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (POSTGRES_MIGRATION_LOCK,))
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    version = cursor.fetchone()[0]
+    applied = []
+    for migration_version, description, statements in POSTGRES_MIGRATIONS:
+        if migration_version <= version:
+            continue
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.execute(
+            "INSERT INTO schema_version (version, description) VALUES (%s, %s)", (migration_version, description)
+        )
+        applied.append(migration_version)
+        log.info("migration_applied", version=migration_version, description=description, dialect='postgres')
+    return applied
+
+def query_plan(conn, sql, params=()):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def check_plan(plan, index):
+    uses_index = any(index in line for line in plan)
+    # "SCAN x USING [COVERING] INDEX" walks an index in order and is fine
+    full_scan = any(line.startswith('SCAN') and 'INDEX' not in line for line in plan)
+    temp_sort = any('USE TEMP B-TREE' in line for line in plan)
+    return uses_index and not full_scan and not temp_sort
+
+
+def check_query_plans(conn):
+    """Return [(name, ok, plan lines)] for database.QUERY_PLAN_CHECKS"""
+    from database import QUERY_PLAN_CHECKS
+
+    results = []
+    for name, sql, params, index in QUERY_PLAN_CHECKS:
+        plan = query_plan(conn, sql, params)
+        results.append((name, check_plan(plan, index), plan))
+    return results
+
+
+def main():
+    from database import DEFAULT_DB_PATH
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['status', 'upgrade', 'check'])
+    parser.add_argument('--db', default=os.getenv('DATABASE_PATH', DEFAULT_DB_PATH), help='SQLite file')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.command == 'status':
+            print(f"{args.db}: schema version {current_version(conn)} (latest {LATEST_VERSION})")
+            for version, description, _ in pending_migrations(conn):
+                print(f"  pending {version}: {description}")
+        elif args.command == 'upgrade':
+            applied = migrate(conn)
+            print(f"applied {applied}" if applied else "already up to date")
+        else:
+            if pending_migrations(conn):
+                print("schema is behind; run `python -m migrations upgrade` first", file=sys.stderr)
+                return 1
+            failed = 0
+            for name, ok, plan in check_query_plans(conn):
+                print(f"{'ok  ' if ok else 'FAIL'} {name}")
+                for line in plan:
+                    print(f"       {line}")
+                failed += not ok
+            return 1 if failed else 0
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
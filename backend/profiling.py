@@ -0,0 +1,202 @@
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+import metrics
+from logger import get_logger, request_id_var
+
+# Opt-in diagnostics for finding where a slow request spends its time without
+# redeploying.
+#
+#   sampling profiler   GET /api/debug/profile?seconds=10 samples every thread's
+#                       Python stack every PROFILE_INTERVAL_MS (default 10) for
+#                       that long and returns collapsed stacks ("a;b;c 42" per
+#                       line), the input format of flamegraph.pl, speedscope and
+#                       inferno. Only the worker process that serves the call
+#                       is profiled; one profile runs at a time per process.
+#   slow-request log    every request slower than SLOW_REQUEST_SECONDS (default
+#                       2, 0 = off) is kept with its time per phase (the
+#                       metrics.span names: db, extraction, embedding, llm,
+#                       retrieval, serialization, compression, ...) in a ring
+#                       buffer of SLOW_REQUEST_BUFFER entries (default 100),
+#                       read with GET /api/debug/slow-requests. Streamed
+#                       responses are measured until the stream closes.
+#
+# Both endpoints answer 404 unless PROFILE_TOKEN is set, and then require it as
+# `Authorization: Bearer <token>` or `X-Profile-Token: <token>`.
+#
+#   PROFILE_MAX_SECONDS   longest profile a single call may ask for (default 60)
+
+log = get_logger('profiling')
+
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN') or None
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '60'))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '10'))
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', '2'))
+SLOW_REQUEST_BUFFER = int(os.getenv('SLOW_REQUEST_BUFFER', '100'))
+
+# Innermost Python frames of threads that are parked waiting for work; their
+# samples are dropped unless the caller asks for idle stacks
+IDLE_FRAMES = {
+    ('threading', 'Condition.wait'),
+    ('threading', 'Event.wait'),
+    ('queue', 'Queue.get'),
+    ('selectors', 'EpollSelector.select'),
+    ('selectors', 'PollSelector.select'),
+    ('selectors', 'KqueueSelector.select'),
+    ('selectors', 'SelectSelector.select'),
+    ('socket', 'socket.accept'),
+    ('concurrent.futures.thread', '_worker'),
+}
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def supplied_token(authorization, profile_token):
+    """The token from `Authorization: Bearer ...` or X-Profile-Token, if any"""
+    if authorization and authorization.lower().startswith('bearer '):
+        return authorization[7:].strip()
+    return profile_token
+
+
+def check_token(token):
+    """None when `token` grants access, else (status, message)"""
+    if PROFILE_TOKEN is None:
+        return 404, 'Not found'
+    if not token or not hmac.compare_digest(token.encode('utf-8'), PROFILE_TOKEN.encode('utf-8')):
+        return 403, 'Invalid profiling token'
+    return None
+
+
+def parse_profile_options(args):
+    """(seconds, interval_seconds, include_idle) from query args; raises ValueError"""
+    seconds = float(args.get('seconds', 10))
+    interval_ms = float(args.get('interval_ms', PROFILE_INTERVAL_MS))
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise ValueError(f'seconds must be between 0 and {PROFILE_MAX_SECONDS:g}')
+    if not 1 <= interval_ms <= 1000:
+        raise ValueError('interval_ms must be between 1 and 1000')
+    include_idle = args.get('idle', '0').lower() in ('1', 'true', 'yes')
+    return seconds, interval_ms / 1000.0, include_idle
+
+
+class SamplingProfiler:
+    """Polls sys._current_frames(); nothing is installed in the profiled threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._labels = {}
+
+    def _frame_label(self, frame):
+        code = frame.f_code
+        label = self._labels.get(code)
+        if label is None:
+            module = frame.f_globals.get('__name__', '?')
+            label = self._labels[code] = (module, getattr(code, 'co_qualname', code.co_name))
+        return label
+
+    def sample(self, counts, include_idle, own_thread):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_label(frame))
+                frame = frame.f_back
+            if not stack or (not include_idle and stack[0] in IDLE_FRAMES):
+                continue
+            counts[';'.join(f'{module}:{name}' for module, name in reversed(stack))] += 1
+
+    def profile(self, seconds, interval, include_idle=False):
+        """Collapsed stacks sampled for `seconds`; raises ProfilerBusy if one is already running"""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy()
+        try:
+            log.info("profile_started", seconds=seconds, interval_ms=round(interval * 1000, 1))
+            counts = Counter()
+            own_thread = threading.get_ident()
+            samples = 0
+            started = time.perf_counter()
+            deadline = started + seconds
+            while True:
+                self.sample(counts, include_idle, own_thread)
+                samples += 1
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                time.sleep(min(interval, remaining))
+            log.info("profile_finished", samples=samples, stacks=len(counts),
+                     seconds=round(time.perf_counter() - started, 3))
+            return counts, samples
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def collapsed(counts):
+        return ''.join(f'{stack} {count}\n' for stack, count in counts.most_common())
+
+
+def profile_filename():
+    return f"profile-{os.getpid()}-{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}.collapsed"
+
+
+class SlowRequestLog:
+    """Ring buffer of per-phase breakdowns of requests over `threshold` seconds"""
+
+    def __init__(self, threshold=SLOW_REQUEST_SECONDS, capacity=SLOW_REQUEST_BUFFER):
+        self.threshold = threshold
+        self.capacity = capacity
+        self._entries = deque(maxlen=max(1, capacity))
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Begin recording phases for the current request; None when the log is off"""
+        if self.threshold <= 0:
+            return None
+        phases = metrics.PhaseRecorder()
+        metrics.request_phases.set(phases)
+        return phases
+
+    def finish(self, phases, method, path, endpoint, status, request_id=None, streamed=False):
+        if phases is None:
+            return
+        seconds = time.perf_counter() - phases.started
+        if seconds < self.threshold:
+            return
+        breakdown = phases.breakdown()
+        entry = {
+            'request_id': request_id or request_id_var.get(),
+            'method': method,
+            'path': path,
+            'endpoint': endpoint,
+            'status': status,
+            'streamed': streamed,
+            'finished_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'seconds': round(seconds, 4),
+            'phases': breakdown,
+            'unattributed_seconds': round(max(0.0, seconds - phases.covered), 4),
+        }
+        with self._lock:
+            self._entries.append(entry)
+        metrics.slow_requests.inc(endpoint=endpoint)
+        log.warning("slow_request", endpoint=endpoint, status=status, seconds=entry['seconds'],
+                    phases={name: phase['seconds'] for name, phase in breakdown.items()})
+
+    def entries(self, limit=None):
+        """Newest first"""
+        with self._lock:
+            entries = list(reversed(self._entries))
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+profiler = SamplingProfiler()
+slow_requests = SlowRequestLog()
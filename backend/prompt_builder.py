@@ -0,0 +1,228 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import metrics
+
+# Token-budgeted assembly of the tutor chat prompt. Each section gets its own
+# budget so a long quiz review or chat cannot blow up request latency/cost:
+#
+#   context          retrieved document excerpts
+#   wrong_questions  questions the student got wrong, most relevant first
+#   history          recent turns verbatim; the conversation's running summary
+#                    and older turns as one-line summaries
+#   message          the student's current message
+
+DEFAULT_BUDGETS = {
+    'context': 2000,
+    'wrong_questions': 1200,
+    'history': 1000,
+    'message': 400,
+}
+
+# Share of the history budget reserved for summaries of older turns
+HISTORY_SUMMARY_SHARE = 0.25
+SUMMARY_LINE_TOKENS = 30
+EXPLANATION_TOKENS = 120
+
+ROLE_LABELS = {
+    'en': {'user': 'Student', 'assistant': 'Tutor'},
+    'bn': {'user': 'শিক্ষার্থী', 'assistant': 'শিক্ষক'}
+}
+WRONG_LABELS = {
+    'en': "Questions the student got wrong:",
+    'bn': "শিক্ষার্থী যে প্রশ্নগুলি ভুল করেছে:"
+}
+CORRECT_LABELS = {'en': 'Correct answer:', 'bn': 'সঠিক উত্তর:'}
+EXPLANATION_LABELS = {'en': 'Explanation:', 'bn': 'ব্যাখ্যা:'}
+EARLIER_LABELS = {'en': 'Earlier in the conversation:', 'bn': 'কথোপকথনের আগের অংশ:'}
+OMITTED_LABELS = {'en': 'more omitted', 'bn': 'টি বাদ দেওয়া হয়েছে'}
+
+prompt_tokens = metrics.registry.histogram(
+    'study_assistant_prompt_tokens', 'Estimated chat prompt tokens by section',
+    buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+)
+
+
+def count_tokens(text):
+    return metrics.estimate_tokens(text)
+
+
+def truncate_to_tokens(text, max_tokens):
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(' ', 0, max_chars)
+    return text[:cut if cut > max_chars // 2 else max_chars].rstrip() + '…'
+
+
+class EmbeddingMemo:
+    """Small LRU of text embeddings so repeated wrong questions are embedded once"""
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed(self, texts, embed_texts, model):
+        """Vectors of `texts` from `embed_texts(texts, model)`, memoised per model"""
+        keys = [hashlib.md5(f"{model}\0{t}".encode('utf-8')).hexdigest() for t in texts]
+        with self._lock:
+            found = {k: self._items[k] for k in keys if k in self._items}
+        missing = {k: t for k, t in zip(keys, texts) if k not in found}
+        if missing:
+            import numpy as np
+            vectors = embed_texts(list(missing.values()), model)
+            found.update((key, np.asarray(vector, dtype=float)) for key, vector in zip(missing, vectors))
+        with self._lock:
+            # Answer from `found`: more texts than max_entries evict their own new entries
+            for key in keys:
+                self._items[key] = found[key]
+                self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return [found[key] for key in keys]
+
+
+embedding_memo = EmbeddingMemo()
+
+
+def rank_wrong_questions(wrong_questions, query_embedding=None, embed_texts=None, embedding_model=None):
+    """Most relevant to the current message first; original order if embeddings are unavailable.
+    `embedding_model` must be the model query_embedding was made with"""
+    if len(wrong_questions) < 2 or query_embedding is None or embed_texts is None or embedding_model is None:
+        return list(wrong_questions)
+    import numpy as np
+    try:
+        vectors = np.vstack(embedding_memo.embed([wq['question'] for wq in wrong_questions], embed_texts,
+                                                  embedding_model))
+        query = np.asarray(query_embedding, dtype=float)
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+        norms[norms == 0] = 1e-9
+        order = np.argsort(-(vectors @ query / norms), kind='stable')
+        return [wrong_questions[i] for i in order]
+    except Exception:
+        return list(wrong_questions)
+
+
+def build_context_section(relevant_chunks, budget):
+    parts = []
+    remaining = budget
+    for chunk in relevant_chunks:
+        if remaining <= 0:
+            break
+        part = truncate_to_tokens(chunk, remaining)
+        parts.append(part)
+        remaining -= count_tokens(part)
+    return "\n\n---\n\n".join(parts)
+
+
+def build_wrong_section(ranked_questions, language, budget):
+    if not ranked_questions:
+        return "", 0
+    correct_label = CORRECT_LABELS.get(language, CORRECT_LABELS['en'])
+    explanation_label = EXPLANATION_LABELS.get(language, EXPLANATION_LABELS['en'])
+
+    section = WRONG_LABELS.get(language, WRONG_LABELS['en']) + "\n"
+    used = count_tokens(section)
+    included = 0
+    for wq in ranked_questions:
+        explanation = truncate_to_tokens(str(wq.get('explanation', '')), EXPLANATION_TOKENS)
+        entry = f"- {wq['question']}\n"
+        entry += f"  {correct_label} {wq['correct_answer']}\n"
+        entry += f"  {explanation_label} {explanation}\n\n"
+        cost = count_tokens(entry)
+        if used + cost > budget:
+            break
+        section += entry
+        used += cost
+        included += 1
+
+    omitted = len(ranked_questions) - included
+    if omitted:
+        section += f"(+{omitted} {OMITTED_LABELS.get(language, OMITTED_LABELS['en'])})\n"
+    return section, included
+
+
+def build_history_section(chat_history, language, budget, summary=None):
+    labels = ROLE_LABELS.get(language, ROLE_LABELS['en'])
+    summary_budget = int(budget * HISTORY_SUMMARY_SHARE)
+    verbatim_budget = budget - summary_budget
+
+    running_summary = truncate_to_tokens(summary, summary_budget) if summary else ""
+    summary_budget -= count_tokens(running_summary)
+
+    verbatim = []
+    used = 0
+    index = len(chat_history)
+    while index > 0:
+        msg = chat_history[index - 1]
+        line = f"{labels.get(msg['role'], msg['role'])}: {msg['content']}\n"
+        cost = count_tokens(line)
+        if used + cost > verbatim_budget:
+            break
+        verbatim.append(line)
+        used += cost
+        index -= 1
+    verbatim.reverse()
+
+    summary_lines = []
+    used = 0
+    older = index
+    while older > 0:
+        msg = chat_history[older - 1]
+        line = f"- {labels.get(msg['role'], msg['role'])}: {truncate_to_tokens(msg['content'], SUMMARY_LINE_TOKENS)}\n"
+        cost = count_tokens(line)
+        if used + cost > summary_budget:
+            break
+        summary_lines.append(line)
+        used += cost
+        older -= 1
+    summary_lines.reverse()
+
+    text = ""
+    if running_summary or summary_lines or older:
+        text += EARLIER_LABELS.get(language, EARLIER_LABELS['en']) + "\n"
+        if running_summary:
+            text += running_summary + "\n"
+        if older:
+            text += f"(+{older} {OMITTED_LABELS.get(language, OMITTED_LABELS['en'])})\n"
+        text += ''.join(summary_lines) + "\n"
+    text += ''.join(verbatim)
+    return text, len(verbatim)
+
+
+def build_chat_prompt(template, user_message, chat_history, wrong_questions, language, relevant_chunks,
+                      query_embedding=None, embed_texts=None, embedding_model=None, budgets=None,
+                      summary=None):
+    """Render a PromptTemplate within per-section token budgets; returns (prompt, token report)"""
+    budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+
+    context_section = build_context_section(relevant_chunks, budgets['context'])
+    ranked = rank_wrong_questions(wrong_questions or [], query_embedding, embed_texts, embedding_model)
+    wrong_section, wrong_included = build_wrong_section(ranked, language, budgets['wrong_questions'])
+    history_section, history_verbatim = build_history_section(
+        chat_history or [], language, budgets['history'], summary
+    )
+    message = truncate_to_tokens(user_message, budgets['message'])
+
+    prompt = template.render(
+        context_from_document=context_section,
+        wrong_section=wrong_section,
+        history=history_section,
+        message=message
+    )
+
+    report = {
+        'context': count_tokens(context_section),
+        'wrong_questions': count_tokens(wrong_section),
+        'history': count_tokens(history_section),
+        'message': count_tokens(message),
+        'total': count_tokens(prompt),
+        'wrong_questions_included': wrong_included,
+        'history_messages_verbatim': history_verbatim,
+        'prompt_version': template.label,
+    }
+    for section in ('context', 'wrong_questions', 'history', 'message', 'total'):
+        prompt_tokens.observe(report[section], section=section)
+    return prompt, report
@@ -0,0 +1,120 @@
+import json
+import os
+import re
+import string
+from functools import lru_cache
+
+# Versioned prompt templates, loaded once from backend/prompts/ and
+# pre-parsed into literal/placeholder segments so rendering is a join.
+#
+#   <name>.v<version>[.<language>].txt   a template ({placeholder} fields,
+#                                        {{ and }} for literal braces)
+#   <name>.v<version>.json               data used to fill templates
+#
+# The newest version of each prompt is used unless pinned, e.g.
+# PROMPT_VERSIONS=question=1,tutor=2. Template labels ("question.v1") are
+# passed to generate_content so metrics can be split by prompt version.
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prompts')
+DEFAULT_LANGUAGE = 'en'
+
+_FILENAME = re.compile(r'^(?P<name>[a-z_]+)\.v(?P<version>\d+)(?:\.(?P<language>[a-z]{2}))?\.(?P<ext>txt|json)$')
+
+
+class PromptTemplate:
+
+    def __init__(self, name, version, language, segments):
+        self.name = name
+        self.version = version
+        self.language = language
+        self.label = f"{name}.v{version}"
+        self._segments = segments
+        self.fields = frozenset(field for _, field in segments if field is not None)
+
+    @classmethod
+    def parse(cls, name, version, language, text):
+        segments = [(literal, field) for literal, field, _, _ in string.Formatter().parse(text)]
+        return cls(name, version, language, segments)
+
+    def render(self, **values):
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"{self.label} needs {', '.join(sorted(missing))}")
+        return ''.join(
+            literal + (str(values[field]) if field is not None else '')
+            for literal, field in self._segments
+        )
+
+    def partial(self, **values):
+        """Fill some fields now; the result still renders the rest"""
+        segments = []
+        for literal, field in self._segments:
+            if field is not None and field in values:
+                segments.append((literal + str(values[field]), None))
+            else:
+                segments.append((literal, field))
+        return PromptTemplate(self.name, self.version, self.language, segments)
+
+
+class PromptRegistry:
+
+    def __init__(self, directory=PROMPTS_DIR, pinned=None):
+        self._templates = {}
+        self._data = {}
+        self._versions = {}
+        for filename in sorted(os.listdir(directory)):
+            match = _FILENAME.match(filename)
+            if not match:
+                continue
+            name, version, language = match['name'], int(match['version']), match['language']
+            with open(os.path.join(directory, filename), encoding='utf-8') as f:
+                if match['ext'] == 'json':
+                    self._data[(name, version)] = json.load(f)
+                else:
+                    self._templates[(name, version, language)] = PromptTemplate.parse(name, version, language, f.read())
+            self._versions[name] = max(self._versions.get(name, 0), version)
+        self._versions.update(pinned or {})
+
+    def version(self, name):
+        return self._versions[name]
+
+    def template(self, name, language=None, version=None):
+        version = version or self.version(name)
+        for candidate in (language, DEFAULT_LANGUAGE, None):
+            template = self._templates.get((name, version, candidate))
+            if template is not None:
+                return template
+        raise KeyError(f"No prompt template {name}.v{version}")
+
+    def data(self, name, version=None):
+        return self._data[(name, version or self.version(name))]
+
+
+def parse_pinned_versions(value):
+    pinned = {}
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        name, _, version = item.partition('=')
+        pinned[name.strip()] = int(version.strip().lstrip('v'))
+    return pinned
+
+
+registry = PromptRegistry(pinned=parse_pinned_versions(os.getenv('PROMPT_VERSIONS')))
+
+
+@lru_cache(maxsize=64)
+def question_template(language='en', difficulty='medium', version=None):
+    """Question prompt with the difficulty filled in; renders document_text and previous_questions"""
+    instructions = registry.data('difficulty')
+    difficulty = difficulty if difficulty in instructions else 'medium'
+    return registry.template('question', language, version).partial(
+        difficulty=difficulty.upper(),
+        difficulty_instructions=instructions[difficulty].get(language, instructions[difficulty][DEFAULT_LANGUAGE])
+    )
+
+
+def tutor_template(language='en', version=None):
+    return registry.template('tutor', language, version)
+
+
+def summary_template(version=None):
+    return registry.template('summary', version=version)
@@ -0,0 +1,244 @@
+import json
+import re
+
+import metrics
+
+# Turns raw model output into validated MCQ dicts. Objects are pulled out of
+# the text incrementally (so partial streamed output can be fed as it
+# arrives), one response may hold several questions, and every object is
+# checked against QUESTION_SCHEMA. Near-misses the model commonly produces
+# (options as a list, "B)" or the option text as the answer, a markdown fence
+# around the JSON) are repaired rather than costing another model call.
+
+OPTION_KEYS = ('A', 'B', 'C', 'D')
+
+QUESTION_SCHEMA = {
+    'question': {'type': str, 'required': True},
+    'options': {'type': dict, 'required': True, 'keys': OPTION_KEYS},
+    'correct_answer': {'type': str, 'required': True, 'choices': OPTION_KEYS},
+    'explanation': {'type': str, 'required': True},
+    'cognitive_level': {'type': str, 'required': False},
+}
+
+parse_outcomes = metrics.registry.counter(
+    'study_assistant_question_parse_total', 'Parsed question objects by outcome (valid/salvaged/invalid)'
+)
+
+# A bare option letter ("B", "(b)", "Option B.") and nothing else; "A cell wall" is an answer text
+_ANSWER_LETTER = re.compile(r'^\(?\s*(?:option\s+)?([A-D])\s*[).:]?\s*$', re.IGNORECASE)
+_OPTION_PREFIX = re.compile(r'^\(?[A-Da-d]\s*[).:]\s+')
+
+
+class QuestionParseError(Exception):
+    pass
+
+
+class IncrementalJSONParser:
+    """Feed text as it arrives; each call returns the JSON objects completed so far.
+
+    Tracks brace depth outside string literals, so braces inside strings,
+    prose around the JSON and several back-to-back objects are all fine.
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._scanned = 0
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text):
+        self._buffer += text
+        objects = []
+        position = self._scanned
+        while position < len(self._buffer):
+            char = self._buffer[position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"' and self._start is not None:
+                self._in_string = True
+            elif char == '{':
+                if self._start is None:
+                    self._start = position
+                self._depth += 1
+            elif char == '}' and self._start is not None:
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = self._buffer[self._start:position + 1]
+                    try:
+                        objects.append(json.loads(candidate))
+                    except ValueError:
+                        # A stray brace opened this span; rescan from just after it
+                        position = self._start
+                    self._start = None
+            position += 1
+
+        if self._start is None:
+            self._buffer = ''
+            self._scanned = 0
+        else:
+            self._buffer = self._buffer[self._start:]
+            self._scanned = position - self._start
+            self._start = 0
+        return objects
+
+    def close(self):
+        """End of output: retry past an opening brace that never closed"""
+        objects = []
+        while self._start is not None:
+            remainder = self._buffer[self._start + 1:]
+            self.__init__()
+            objects.extend(self.feed(remainder))
+        return objects
+
+
+def _flatten_batches(objects):
+    flattened = []
+    for obj in objects:
+        # Some responses wrap a batch as {"questions": [...]}
+        if isinstance(obj, dict) and isinstance(obj.get('questions'), list):
+            flattened.extend(item for item in obj['questions'] if isinstance(item, dict))
+        else:
+            flattened.append(obj)
+    return flattened
+
+
+def extract_json_objects(text):
+    parser = IncrementalJSONParser()
+    return _flatten_batches(parser.feed(text) + parser.close())
+
+
+def _repair_options(options):
+    if isinstance(options, list) and len(options) == len(OPTION_KEYS):
+        options = dict(zip(OPTION_KEYS, options))
+    if not isinstance(options, dict):
+        return options
+    repaired = {}
+    for key, value in options.items():
+        letter = _ANSWER_LETTER.match(str(key).strip())
+        if letter:
+            key = letter.group(1).upper()
+        repaired[key] = _OPTION_PREFIX.sub('', str(value).strip()) if value is not None else value
+    return repaired
+
+
+def _repair_answer(answer, options):
+    if not isinstance(answer, str):
+        return answer
+    answer = answer.strip()
+    # Option texts first: an answer like "A cell wall" must not be read as letter A
+    if isinstance(options, dict):
+        candidates = {answer.lower(), _OPTION_PREFIX.sub('', answer).lower()}
+        for key, value in options.items():
+            if isinstance(value, str) and value.strip().lower() in candidates:
+                return key
+    letter = _ANSWER_LETTER.match(answer)
+    if letter:
+        return letter.group(1).upper()
+    return answer
+
+
+def compile_schema(schema):
+    """Build a validator once; it returns a list of problems (empty when valid)"""
+    checks = []
+    for field, rule in schema.items():
+        def check(obj, field=field, rule=rule):
+            if field not in obj or obj[field] in (None, ''):
+                return [f"missing {field}"] if rule['required'] else []
+            value = obj[field]
+            if not isinstance(value, rule['type']):
+                return [f"{field} must be {rule['type'].__name__}"]
+            if 'keys' in rule and tuple(sorted(value)) != rule['keys']:
+                return [f"{field} must have keys {', '.join(rule['keys'])}"]
+            if 'keys' in rule and not all(isinstance(v, str) and v.strip() for v in value.values()):
+                return [f"{field} values must be non-empty strings"]
+            if 'choices' in rule and value not in rule['choices']:
+                return [f"{field} must be one of {', '.join(rule['choices'])}"]
+            return []
+        checks.append(check)
+
+    def validate(obj):
+        if not isinstance(obj, dict):
+            return ['not an object']
+        return [problem for check in checks for problem in check(obj)]
+    return validate
+
+
+validate_question = compile_schema(QUESTION_SCHEMA)
+
+
+def normalize_question(obj):
+    """Return (question, salvaged) or raise QuestionParseError with the schema problems"""
+    problems = validate_question(obj)
+    if not problems:
+        return obj, False
+
+    if not isinstance(obj, dict):
+        raise QuestionParseError('; '.join(problems))
+    repaired = dict(obj)
+    repaired['options'] = _repair_options(obj.get('options'))
+    repaired['correct_answer'] = _repair_answer(obj.get('correct_answer'), repaired['options'])
+    for field in ('question', 'explanation'):
+        if isinstance(repaired.get(field), str):
+            repaired[field] = repaired[field].strip()
+
+    problems = validate_question(repaired)
+    if problems:
+        raise QuestionParseError('; '.join(problems))
+    return repaired, True
+
+
+class QuestionStreamParser:
+    """parse_questions for a response that arrives in pieces: feed() returns the
+    questions completed by each piece and close() the rest at its end"""
+
+    PREVIEW_CHARS = 200
+
+    def __init__(self):
+        self._objects = IncrementalJSONParser()
+        self.parsed = 0
+        self.problems = []
+        self.preview = ''
+
+    def feed(self, text):
+        if len(self.preview) < self.PREVIEW_CHARS:
+            self.preview = (self.preview + text)[:self.PREVIEW_CHARS]
+        return self._questions(self._objects.feed(text))
+
+    def close(self):
+        return self._questions(self._objects.close())
+
+    def error(self):
+        """The QuestionParseError for a response without a usable question, else None"""
+        if self.parsed:
+            return None
+        return QuestionParseError('; '.join(self.problems) or "No JSON object found in response")
+
+    def _questions(self, objects):
+        questions = []
+        for obj in _flatten_batches(objects):
+            try:
+                question, salvaged = normalize_question(obj)
+            except QuestionParseError as e:
+                parse_outcomes.inc(outcome='invalid')
+                self.problems.append(str(e))
+                continue
+            parse_outcomes.inc(outcome='salvaged' if salvaged else 'valid')
+            questions.append(question)
+        self.parsed += len(questions)
+        return questions
+
+
+def parse_questions(response_text):
+    """All valid (or repairable) questions in a model response; raises if there are none"""
+    parser = QuestionStreamParser()
+    questions = parser.feed(response_text) + parser.close()
+    if not questions:
+        raise parser.error()
+    return questions
@@ -0,0 +1,184 @@
+from embedding_pipeline import BATCH_SIZE
+from logger import get_logger
+from prompt_builder import embedding_memo
+
+# Decides how many new questions each part of a document needs before any
+# model call is made. Chunks are grouped into topical sections by clustering
+# their embeddings (contiguous runs of chunks when embeddings are missing).
+# A section's capacity grows with its length; questions already in the bank
+# are assigned to their nearest section and count against that capacity, so
+# covered topics are not regenerated and short sections are not over-covered.
+# A large bank is attributed from an evenly spaced sample of MAX_EMBEDDED_BANK
+# questions, embedded in requests of at most EMBED_BATCH_SIZE texts.
+# numpy is imported on first use so that importing the app stays cheap.
+
+log = get_logger('planner')
+
+WORDS_PER_QUESTION = 150
+WORDS_PER_SECTION = 600
+MAX_SECTIONS = 12
+MAX_SECTION_WORDS = 1500
+MAX_PLANNED_QUESTIONS = 50
+KMEANS_ITERATIONS = 10
+MAX_EMBEDDED_BANK = 500
+
+
+def _normalize(matrix):
+    import numpy as np
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1e-9
+    return matrix / norms
+
+
+def cluster_chunks(embeddings, k, iterations=KMEANS_ITERATIONS):
+    """Spherical k-means seeded with evenly spaced chunks; returns (labels, centroids)"""
+    import numpy as np
+    vectors = _normalize(np.asarray(embeddings, dtype=float))
+    seeds = np.linspace(0, len(vectors) - 1, k).round().astype(int)
+    centroids = vectors[seeds]
+    labels = np.zeros(len(vectors), dtype=int)
+    for iteration in range(iterations):
+        new_labels = np.argmax(vectors @ centroids.T, axis=1)
+        if iteration and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        for cluster in range(k):
+            members = vectors[labels == cluster]
+            if len(members):
+                centroids[cluster] = members.mean(axis=0)
+        centroids = _normalize(centroids)
+    return labels, centroids
+
+
+def contiguous_labels(chunk_count, k):
+    import numpy as np
+    return np.minimum(np.arange(chunk_count) * k // max(chunk_count, 1), k - 1)
+
+
+def largest_remainder(weights, total):
+    """Split `total` into integers proportional to `weights`"""
+    import numpy as np
+    weights = np.asarray(weights, dtype=float)
+    if total <= 0 or not len(weights) or weights.sum() <= 0:
+        return [0] * len(weights)
+    exact = weights / weights.sum() * total
+    shares = np.floor(exact).astype(int)
+    for i in np.argsort(-(exact - shares), kind='stable')[:total - shares.sum()]:
+        shares[i] += 1
+    return shares.tolist()
+
+
+def section_text(chunks, chunk_ids):
+    words = ' '.join(chunks[i] for i in chunk_ids).split()
+    return ' '.join(words[:MAX_SECTION_WORDS])
+
+
+def plan_questions(chunks, embeddings, existing_questions, requested=None, embed_texts=None,
+                   embedding_model=None):
+    """Return sections [{chunk_ids, text, words, capacity, existing, previous, quota}].
+
+    With `requested` the quotas add up to exactly that many questions, uncovered
+    sections first; without it the plan only fills the sections' remaining need.
+    """
+    if not chunks:
+        return []
+    total_words = sum(len(chunk.split()) for chunk in chunks)
+    k = int(min(MAX_SECTIONS, len(chunks), max(1, round(total_words / WORDS_PER_SECTION))))
+
+    centroids = None
+    if len(embeddings) and len(embeddings) == len(chunks):
+        labels, centroids = cluster_chunks(embeddings, k)
+    else:
+        labels = contiguous_labels(len(chunks), k)
+
+    sections = []
+    for cluster in range(k):
+        chunk_ids = [i for i in range(len(chunks)) if labels[i] == cluster]
+        if not chunk_ids:
+            continue
+        words = sum(len(chunks[i].split()) for i in chunk_ids)
+        sections.append({
+            'chunk_ids': chunk_ids,
+            'text': section_text(chunks, chunk_ids),
+            'words': words,
+            'capacity': max(1, round(words / WORDS_PER_QUESTION)),
+            'existing': 0,
+            'previous': [],
+            'centroid': centroids[cluster] if centroids is not None else None,
+        })
+
+    assign_existing(sections, existing_questions, embed_texts, embedding_model)
+
+    need = [max(0, s['capacity'] - s['existing']) for s in sections]
+    if requested is None:
+        quotas = need if sum(need) <= MAX_PLANNED_QUESTIONS else largest_remainder(need, MAX_PLANNED_QUESTIONS)
+    elif requested <= sum(need):
+        quotas = largest_remainder(need, requested)
+    else:
+        # Every section's need is met; spread the extra by section size
+        extra = largest_remainder([s['capacity'] for s in sections], requested - sum(need))
+        quotas = [n + e for n, e in zip(need, extra)]
+
+    for section, quota in zip(sections, quotas):
+        section['quota'] = quota
+        del section['centroid']
+    return sections
+
+
+def assign_existing(sections, existing_questions, embed_texts=None, embedding_model=None):
+    """Attribute bank questions to their nearest section (proportionally without embeddings)"""
+    import numpy as np
+    if not existing_questions or not sections:
+        return
+    if embed_texts is not None and embedding_model and all(s['centroid'] is not None for s in sections):
+        sample = existing_questions
+        if len(sample) > MAX_EMBEDDED_BANK:
+            # Evenly spaced, always including the newest questions
+            positions = np.unique(np.linspace(0, len(sample) - 1, MAX_EMBEDDED_BANK).round().astype(int))
+            sample = [existing_questions[i] for i in positions]
+        try:
+            vectors = []
+            for start in range(0, len(sample), BATCH_SIZE):
+                vectors.extend(embedding_memo.embed(sample[start:start + BATCH_SIZE], embed_texts, embedding_model))
+            vectors = _normalize(np.vstack(vectors))
+        except Exception as e:
+            log.warning("bank_assignment_fallback", questions=len(existing_questions), embedded=len(sample),
+                        model=embedding_model, error=str(e))
+        else:
+            nearest = np.argmax(vectors @ np.vstack([s['centroid'] for s in sections]).T, axis=1)
+            sampled = np.bincount(nearest, minlength=len(sections))
+            counts = sampled if len(sample) == len(existing_questions) else \
+                largest_remainder(sampled, len(existing_questions))
+            for section, count in zip(sections, counts):
+                section['existing'] += int(count)
+            for question, index in zip(sample, nearest):
+                sections[index]['previous'].append(question)
+            return
+
+    shares = largest_remainder([s['capacity'] for s in sections], len(existing_questions))
+    for section, share in zip(sections, shares):
+        section['existing'] += share
+    for section in sections:
+        section['previous'] = list(existing_questions)
+
+
+def schedule(sections):
+    """Section indices in generation order, round-robin so early questions cover the whole document"""
+    remaining = [s['quota'] for s in sections]
+    order = []
+    while any(remaining):
+        for index, left in enumerate(remaining):
+            if left:
+                order.append(index)
+                remaining[index] -= 1
+    return order
+
+
+def plan_summary(sections):
+    return {
+        'total': sum(s['quota'] for s in sections),
+        'sections': [
+            {'chunks': len(s['chunk_ids']), 'existing': s['existing'], 'planned': s['quota']}
+            for s in sections
+        ],
+    }
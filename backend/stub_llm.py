@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import math
+import os
+import re
+import time
+
+# Drop-in stand-in for the parts of google.generativeai used by the app.
+# Enabled with LLM_BACKEND=stub; used for local load tests and benchmarks.
+
+GENERATION_LATENCY = float(os.getenv('STUB_LLM_LATENCY', '0.5'))
+EMBEDDING_LATENCY = float(os.getenv('STUB_EMBED_LATENCY', '0.05'))
+EMBEDDING_DIM = 256
+
+_question_counter = itertools.count(1)
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class StubResponse:
+    """Mimics the `.text` attribute of a Gemini response"""
+
+    def __init__(self, text):
+        self.text = text
+
+
+class StubStreamResponse:
+    """Mimics a stream=True response: iterate (or async-iterate) for the pieces,
+    which arrive spread over the model latency; `.text` is the whole reply"""
+
+    PIECES = 4
+
+    def __init__(self, text, latency):
+        self.text = text
+        size = -(-len(text) // self.PIECES) or 1
+        self._pieces = [StubResponse(text[i:i + size]) for i in range(0, len(text), size)]
+        self._delay = latency / max(len(self._pieces), 1)
+
+    def __iter__(self):
+        for piece in self._pieces:
+            if self._delay:
+                time.sleep(self._delay)
+            yield piece
+
+    async def __aiter__(self):
+        for piece in self._pieces:
+            if self._delay:
+                await asyncio.sleep(self._delay)
+            yield piece
+
+
+class GenerativeModel:
+    """Returns canned MCQ JSON or tutor replies after a fixed delay"""
+
+    def __init__(self, model_name='stub', latency=None):
+        self.model_name = model_name
+        self.latency = GENERATION_LATENCY if latency is None else latency
+
+    def _respond(self, prompt):
+        if '"correct_answer"' in prompt:
+            n = next(_question_counter)
+            return StubResponse(json.dumps({
+                'question': f"Stub question #{n}: which statement best follows from the document?",
+                'options': {
+                    'A': f"Inference {n}-A",
+                    'B': f"Inference {n}-B",
+                    'C': f"Inference {n}-C",
+                    'D': f"Inference {n}-D"
+                },
+                'correct_answer': 'ABCD'[n % 4],
+                'explanation': f"Stub explanation for question {n}.",
+                'cognitive_level': 'Analyze'
+            }))
+        return StubResponse(f"Stub tutor reply to a prompt of {len(prompt)} characters.")
+
+    def generate_content(self, prompt, stream=False):
+        if stream:
+            return StubStreamResponse(self._respond(prompt).text, self.latency)
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(prompt)
+
+    async def generate_content_async(self, prompt, stream=False):
+        if stream:
+            return StubStreamResponse(self._respond(prompt).text, self.latency)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(prompt)
+
+
+def configure(**kwargs):
+    pass
+
+
+def _embed_text(text):
+    """Hashed bag-of-words vector so that similar texts get similar embeddings"""
+    vector = [0.0] * EMBEDDING_DIM
+    for token in _TOKEN_RE.findall(text.lower()):
+        digest = hashlib.md5(token.encode('utf-8')).digest()
+        index = int.from_bytes(digest[:4], 'little') % EMBEDDING_DIM
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    length = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / length for v in vector]
+
+
+def embed_content(model=None, content=None, task_type=None, **kwargs):
+    if EMBEDDING_LATENCY:
+        time.sleep(EMBEDDING_LATENCY)
+    if isinstance(content, str):
+        return {'embedding': _embed_text(content)}
+    return {'embedding': [_embed_text(text) for text in content]}
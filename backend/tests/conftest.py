@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Tests import the backend modules the way the app does (flat, from backend/),
+# with the stub LLM so nothing calls the Gemini API, and a throwaway SQLite
+# file for the tests that import the app.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LLM_BACKEND', 'stub')
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(prefix='study-tests-'), 'app.db'))
+
+
+@pytest.fixture(scope='session')
+def postgres_url(tmp_path_factory):
+    """DATABASE_URL when it is a PostgreSQL URL, otherwise a throwaway server started
+    with pgserver (requirements-dev.txt); tests that need it skip when neither is there"""
+    url = os.getenv('DATABASE_URL', '')
+    if url.startswith(('postgres://', 'postgresql://')):
+        yield url
+        return
+    pytest.importorskip('psycopg2')
+    pgserver = pytest.importorskip('pgserver')
+    server = pgserver.get_server(tmp_path_factory.mktemp('pgdata'), cleanup_mode='delete')
+    try:
+        yield server.get_uri()
+    finally:
+        server.cleanup()
@@ -0,0 +1,62 @@
+import asyncio
+import json
+
+import pytest
+
+import app
+import asgi
+
+
+def call(method, path, body=b'', headers=()):
+    """Run one request through the ASGI app; returns (status, headers dict, body)"""
+    sent = []
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+        'root_path': '', 'server': ('testserver', 80), 'client': ('127.0.0.1', 1234),
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers],
+    }
+    asyncio.run(asgi.application(scope, receive, send))
+    start = next(m for m in sent if m['type'] == 'http.response.start')
+    response_headers = {name.decode().lower(): value.decode() for name, value in start['headers']}
+    return start['status'], response_headers, b''.join(m.get('body', b'') for m in sent if m['type'] == 'http.response.body')
+
+
+@pytest.fixture(scope='module')
+def document_id():
+    text = '\n\n'.join(f"Paragraph {i} on how plant cells use chlorophyll, light and water to make glucose "
+                       f"and release oxygen in photosynthesis." for i in range(6))
+    return app.db.save_document('request-id.txt', text, 'request-id', len(text.split()))
+
+
+@pytest.mark.parametrize('method, path, body', [
+    ('POST', '/api/chat', None),
+    ('OPTIONS', '/api/chat', b''),
+    ('GET', '/api/generate-questions/{document_id}?count=1', b''),
+    ('GET', '/api/generate-questions/999999', b''),
+    ('GET', '/api/health', b''),
+], ids=['chat', 'preflight', 'sse', 'not-found', 'flask'])
+def test_request_id_is_echoed(document_id, method, path, body):
+    if body is None:
+        body = json.dumps({'document_id': document_id, 'message': 'What does chlorophyll do?'}).encode()
+    status, headers, _ = call(method, path.format(document_id=document_id), body,
+                              [('Content-Type', 'application/json'), ('X-Request-ID', 'req-123')])
+    assert status < 500
+    assert headers['x-request-id'] == 'req-123'
+
+
+def test_request_id_is_generated_when_missing(document_id):
+    body = json.dumps({'document_id': document_id, 'message': 'What is glucose?'}).encode()
+    _, headers, _ = call('POST', '/api/chat', body, [('Content-Type', 'application/json')])
+    assert headers['x-request-id']
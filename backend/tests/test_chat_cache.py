@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+import app
+import asgi
+from answer_cache import answer_cache
+
+TEXT = '\n\n'.join(f"Paragraph {i} says mitochondria release energy from glucose through cellular "
+                   f"respiration inside every animal and plant cell." for i in range(6))
+
+
+@pytest.fixture
+def document_id():
+    answer_cache.clear()
+    return app.db.save_document('chat-cache.txt', TEXT, 'chat-cache', len(TEXT.split()))
+
+
+def flask_chat(body):
+    response = app.app.test_client().post('/api/chat', json=body)
+    return response.status_code, response.get_json()
+
+
+def asgi_chat(body):
+    return asyncio.run(asgi.chat_async(body))
+
+
+@pytest.mark.parametrize('chat', [flask_chat, asgi_chat], ids=['flask', 'asgi'])
+def test_string_and_integer_ids_share_cached_answers(chat, document_id):
+    first_status, first = chat({'document_id': str(document_id), 'message': 'What do mitochondria do?', 'history': []})
+    second_status, second = chat({'document_id': document_id, 'message': 'What do mitochondria do?', 'history': []})
+
+    assert (first_status, second_status) == (200, 200)
+    assert 'cached' not in first
+    assert second.get('cached') is True
+    assert second['response'] == first['response']
+
+
+@pytest.mark.parametrize('chat', [flask_chat, asgi_chat], ids=['flask', 'asgi'])
+@pytest.mark.parametrize('bad_id', ['abc', '1.5', 2.5, True, [1]])
+def test_malformed_document_id_is_rejected(chat, bad_id):
+    status, payload = chat({'document_id': bad_id, 'message': 'Hello?'})
+    assert status == 400
+    assert payload['error'] == 'Invalid document_id'
@@ -0,0 +1,64 @@
+import pytest
+
+from conversations import ConversationMemory
+from database import Database
+
+
+class Summarizer:
+    """Records each summary prompt; fails while `failing` is set"""
+
+    def __init__(self, failing=False):
+        self.failing = failing
+        self.prompts = []
+
+    def __call__(self, kind, prompt, prompt_version=None):
+        self.prompts.append(prompt)
+        if self.failing:
+            raise RuntimeError('model unavailable')
+        return type('Response', (), {'text': f"summary {len(self.prompts)}"})()
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / 'conversations.db'))
+    db.document_id = db.save_document('notes.txt', 'Some text.', 'notes', 2)
+    return db
+
+
+def chat(memory, conversation_id, turns):
+    for i in range(turns):
+        conversation, _ = memory.load(conversation_id)
+        memory.record_turn(conversation, f"question {i}", f"answer {i}")
+        memory._executor.submit(lambda: None).result()  # let the background summary finish
+
+
+def test_summary_backlog_is_folded_in_bounded_windows(db):
+    summarizer = Summarizer(failing=True)
+    memory = ConversationMemory(db, summarizer, every_turns=2, max_workers=1)
+    conversation_id = memory.start(db.document_id, 'en', [])
+
+    chat(memory, conversation_id, 20)
+    assert all(prompt.count('user: question') <= memory.window // 2 for prompt in summarizer.prompts)
+
+    summarizer.failing = False
+    chat(memory, conversation_id, 12)
+
+    conversation = db.get_conversation(conversation_id)
+    assert conversation['summary']
+    assert all(prompt.count('user: question') <= memory.window // 2 for prompt in summarizer.prompts)
+    # Caught up: fewer unsummarized messages than one refresh's worth
+    pending = db.get_unsummarized_messages(conversation_id, conversation['summarized_through'], 100)
+    assert len(pending) < memory.every_turns * 2
+
+
+def test_per_turn_read_is_limited(db, monkeypatch):
+    memory = ConversationMemory(db, Summarizer(failing=True), every_turns=2, max_workers=1)
+    conversation_id = memory.start(db.document_id, 'en', [])
+    chat(memory, conversation_id, 10)
+
+    reads = []
+    get = db.get_unsummarized_messages
+    monkeypatch.setattr(db, 'get_unsummarized_messages', lambda *args: reads.append(args) or get(*args))
+    chat(memory, conversation_id, 1)
+
+    assert [len(get(*args)) for args in reads] == [memory.window]
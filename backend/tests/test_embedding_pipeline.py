@@ -0,0 +1,94 @@
+import pytest
+
+from database import Database
+from embedding_pipeline import EmbeddingError, EmbeddingPipeline
+
+MODELS = ('primary', 'fallback')
+
+
+class FakeEmbedder:
+    """Vectors tagged with the model that made them; `failing` models raise for texts in `bad`"""
+
+    def __init__(self, failing=(), bad=()):
+        self.failing = set(failing)
+        self.bad = set(bad)
+        self.calls = []
+
+    def __call__(self, texts, model):
+        self.calls.append((model, list(texts)))
+        if model in self.failing and self.bad.intersection(texts):
+            raise RuntimeError(f"{model} unavailable")
+        return [[float(MODELS.index(model)), float(len(text))] for text in texts]
+
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(str(tmp_path / 'embeddings.db'))
+
+
+def pipeline(db, embedder):
+    return EmbeddingPipeline(db, embedder, MODELS, batch_size=2, concurrency=2, attempts=1)
+
+
+def chunks(count):
+    return [f"chunk number {i}" for i in range(count)]
+
+
+def test_one_failed_batch_moves_the_whole_document_to_the_fallback(db):
+    document = chunks(5)
+    embedder = FakeEmbedder(failing={'primary'}, bad={document[4]})
+
+    model, vectors = pipeline(db, embedder).embed(1, document)
+
+    assert model == 'fallback'
+    assert len(vectors) == len(document)
+    assert {vector[0] for vector in vectors} == {MODELS.index('fallback')}
+    assert {stored[1] for stored in db.get_embedding_batches(1).values()} == {'fallback'}
+
+
+def test_resume_keeps_the_model_of_the_checkpoint(db):
+    document = chunks(6)
+    pipeline(db, FakeEmbedder(failing={'primary'}, bad={document[0]})).embed(1, document)
+
+    embedder = FakeEmbedder()
+    model, vectors = pipeline(db, embedder).embed(1, document)
+
+    assert model == 'fallback'
+    assert embedder.calls == []
+    assert {vector[0] for vector in vectors} == {MODELS.index('fallback')}
+
+
+def test_batches_of_another_model_are_re_embedded(db):
+    document = chunks(4)
+    pipeline(db, FakeEmbedder()).embed(1, document)
+    # Pretend the second batch was left over from a fallback run
+    db.save_embedding_batches([(1, 1, 'stale', 'fallback', [[1.0, 0.0], [1.0, 0.0]])])
+
+    embedder = FakeEmbedder()
+    model, vectors = pipeline(db, embedder).embed(1, document)
+
+    assert model == 'primary'
+    assert embedder.calls == [('primary', document[2:])]
+    assert {vector[0] for vector in vectors} == {MODELS.index('primary')}
+
+
+def test_documents_sharing_a_request_fall_back_independently(db):
+    healthy, broken = ['healthy chunk'], ['broken chunk']
+    embedder = FakeEmbedder(failing={'primary'}, bad=set(broken))
+
+    embeddings, errors = pipeline(db, embedder).embed_many([(1, healthy), (2, broken)])
+
+    assert not errors
+    assert embeddings[2][0] == 'fallback'
+    # Both shared the failed request, so both start over with one model each
+    assert embeddings[1][0] == 'fallback'
+    for model, vectors in embeddings.values():
+        assert {vector[0] for vector in vectors} == {MODELS.index(model)}
+
+
+def test_error_once_every_model_has_failed(db):
+    document = chunks(3)
+    embedder = FakeEmbedder(failing=set(MODELS), bad={document[0]})
+
+    with pytest.raises(EmbeddingError):
+        pipeline(db, embedder).embed(1, document)
@@ -0,0 +1,15 @@
+import os
+
+from metrics import Registry
+
+
+def test_every_series_is_labelled_with_the_worker_pid():
+    registry = Registry()
+    registry.counter('requests_total', 'Requests').inc(endpoint='/api/health')
+    registry.histogram('latency_seconds', 'Latency', buckets=(0.1,)).observe(0.05)
+
+    samples = [line for line in registry.render().splitlines() if not line.startswith('#')]
+
+    assert samples[0] == f'requests_total{{pid="{os.getpid()}",endpoint="/api/health"}} 1'
+    assert f'latency_seconds_bucket{{pid="{os.getpid()}",le="0.1"}} 1' in samples
+    assert all(f'pid="{os.getpid()}"' in line for line in samples)
@@ -0,0 +1,38 @@
+import sqlite3
+
+import pytest
+
+import migrations
+from database import QUERY_PLAN_CHECKS
+
+
+@pytest.fixture(scope='module')
+def conn(tmp_path_factory):
+    conn = sqlite3.connect(tmp_path_factory.mktemp('plans') / 'plans.db')
+    migrations.migrate(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize('name, sql, params, index', QUERY_PLAN_CHECKS, ids=[check[0] for check in QUERY_PLAN_CHECKS])
+def test_query_uses_index(conn, name, sql, params, index):
+    plan = migrations.query_plan(conn, sql, params)
+    assert migrations.check_plan(plan, index), f"{name} should use {index} without a scan or temp sort: {plan}"
+
+
+@pytest.mark.parametrize('name, index', [
+    # The regressions migrations 6 and 9 fix: without them the rows are sorted in a temp B-tree
+    ('questions_by_document', 'idx_questions_document_id'),
+    ('session_questions', 'idx_session_questions_position'),
+])
+def test_ordered_queries_need_their_index(tmp_path, name, index):
+    conn = sqlite3.connect(tmp_path / 'without_index.db')
+    try:
+        migrations.migrate(conn)
+        conn.execute(f'DROP INDEX {index}')
+        sql = dict((check[0], check[1]) for check in QUERY_PLAN_CHECKS)[name]
+        plan = migrations.query_plan(conn, sql, (1,))
+        assert not migrations.check_plan(plan, index)
+        assert any('USE TEMP B-TREE' in line for line in plan)
+    finally:
+        conn.close()
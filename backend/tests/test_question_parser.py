@@ -0,0 +1,42 @@
+import pytest
+
+from question_parser import QuestionParseError, normalize_question
+
+OPTIONS = {'A': 'Cell membrane', 'B': 'A cell wall', 'C': 'Nucleus', 'D': 'Ribosome'}
+
+
+def question(correct_answer, options=OPTIONS):
+    return {
+        'question': 'Which structure gives plant cells their rigid shape?',
+        'options': dict(options),
+        'correct_answer': correct_answer,
+        'explanation': 'The cellulose wall resists turgor pressure.',
+    }
+
+
+@pytest.mark.parametrize('answer, expected', [
+    ('A cell wall', 'B'),       # option text that starts with a letter and a space
+    ('a cell wall', 'B'),
+    ('B) A cell wall', 'B'),
+    ('Nucleus', 'C'),
+    ('b', 'B'),
+    ('(d)', 'D'),
+    ('Option C.', 'C'),
+    ('C:', 'C'),
+])
+def test_answer_is_keyed_to_the_right_option(answer, expected):
+    repaired, salvaged = normalize_question(question(answer))
+    assert salvaged
+    assert repaired['correct_answer'] == expected
+
+
+def test_unknown_answer_text_is_rejected():
+    with pytest.raises(QuestionParseError):
+        normalize_question(question('A vacuole'))
+
+
+def test_prefixed_option_keys_are_repaired():
+    options = {'A)': 'Cell membrane', 'B)': 'A cell wall', 'C)': 'Nucleus', 'D)': 'Ribosome'}
+    repaired, _ = normalize_question(question('A cell wall', options))
+    assert repaired['options'] == OPTIONS
+    assert repaired['correct_answer'] == 'B'
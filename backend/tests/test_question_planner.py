@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+import question_planner
+from embedding_pipeline import BATCH_SIZE
+from prompt_builder import EmbeddingMemo
+
+
+class TopicEmbedder:
+    """Questions about 'alpha' point one way, everything else the other; like the API, refuses big batches"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts, model):
+        self.calls.append(len(texts))
+        if len(texts) > BATCH_SIZE:
+            raise ValueError(f"at most {BATCH_SIZE} texts per request")
+        return [[1.0, 0.0] if 'alpha' in text else [0.0, 1.0] for text in texts]
+
+
+def sections():
+    return [
+        {'capacity': 10, 'existing': 0, 'previous': [], 'centroid': np.array([1.0, 0.0])},
+        {'capacity': 10, 'existing': 0, 'previous': [], 'centroid': np.array([0.0, 1.0])},
+    ]
+
+
+@pytest.fixture(autouse=True)
+def fresh_memo(monkeypatch):
+    monkeypatch.setattr(question_planner, 'embedding_memo', EmbeddingMemo(max_entries=64))
+
+
+def bank(alpha, beta):
+    return [f"alpha question {i}" for i in range(alpha)] + [f"beta question {i}" for i in range(beta)]
+
+
+def test_large_bank_is_embedded_in_api_sized_batches():
+    embedder = TopicEmbedder()
+    planned = sections()
+
+    question_planner.assign_existing(planned, bank(240, 60), embedder, 'model')
+
+    assert max(embedder.calls) <= BATCH_SIZE
+    assert [s['existing'] for s in planned] == [240, 60]
+
+
+def test_bank_over_the_cap_is_sampled_and_scaled(monkeypatch):
+    monkeypatch.setattr(question_planner, 'MAX_EMBEDDED_BANK', 100)
+    embedder = TopicEmbedder()
+    planned = sections()
+    questions = bank(300, 100)
+
+    question_planner.assign_existing(planned, questions, embedder, 'model')
+
+    assert sum(embedder.calls) == 100
+    assert sum(s['existing'] for s in planned) == len(questions)
+    assert planned[0]['existing'] == pytest.approx(300, abs=2)
+    assert questions[-1] in planned[1]['previous']
+
+
+def test_embedding_failure_falls_back_to_proportional_shares():
+    def broken(texts, model):
+        raise RuntimeError('quota exceeded')
+
+    planned = sections()
+    question_planner.assign_existing(planned, bank(3, 1), broken, 'model')
+
+    assert [s['existing'] for s in planned] == [2, 2]
+
+
+def test_memo_returns_texts_beyond_its_capacity():
+    memo = EmbeddingMemo(max_entries=4)
+    texts = [f"text {i}" for i in range(10)]
+
+    vectors = memo.embed(texts, lambda batch, model: [[float(t.split()[1])] for t in batch], 'model')
+
+    assert [v[0] for v in vectors] == list(range(10))
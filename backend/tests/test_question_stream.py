@@ -0,0 +1,149 @@
+import asyncio
+import json
+
+import pytest
+
+import app
+import asgi
+
+TEXT = '\n\n'.join(
+    f"Section {i} explains how chlorophyll in the membranes of plant cells turns light energy, water "
+    f"and carbon dioxide into glucose and oxygen during photosynthesis, step {i}." for i in range(12)
+)
+
+
+@pytest.fixture(autouse=True)
+def no_pauses(monkeypatch):
+    async def no_sleep(seconds):
+        pass
+    monkeypatch.setattr(app.time, 'sleep', lambda seconds: None)
+    monkeypatch.setattr(asgi.asyncio, 'sleep', no_sleep)
+
+
+@pytest.fixture
+def flaky_model(monkeypatch):
+    """The first model call fails; the rest go to the stub"""
+    calls = []
+    stream, stream_async = app.stream_content, asgi.stream_content_async
+
+    def flaky(kind, prompt, prompt_version=None):
+        calls.append(kind)
+        if len(calls) == 1:
+            raise RuntimeError('model unavailable')
+        yield from stream(kind, prompt, prompt_version)
+
+    async def flaky_async(kind, prompt, prompt_version=None):
+        calls.append(kind)
+        if len(calls) == 1:
+            raise RuntimeError('model unavailable')
+        async for text in stream_async(kind, prompt, prompt_version):
+            yield text
+    monkeypatch.setattr(app, 'stream_content', flaky)
+    monkeypatch.setattr(asgi, 'stream_content_async', flaky_async)
+    return calls
+
+
+class TwoQuestionModel:
+    """Streams two questions, each split over two pieces, and notes when each piece is sent"""
+
+    def __init__(self, log):
+        self.log = log
+
+    def pieces(self):
+        for n in (1, 2):
+            text = json.dumps({
+                'question': f"Why does step {n} of photosynthesis need light?",
+                'options': {'A': 'Energy', 'B': 'Heat', 'C': 'Water', 'D': 'Soil'},
+                'correct_answer': 'A',
+                'explanation': 'Light provides the energy.',
+            })
+            middle = len(text) // 2
+            for piece in (text[:middle], text[middle:]):
+                self.log.append('piece')
+                yield type('Piece', (), {'text': piece})()
+
+    def generate_content(self, prompt, stream=False):
+        assert stream
+        return self.pieces()
+
+    async def generate_content_async(self, prompt, stream=False):
+        assert stream
+
+        async def pieces():
+            for piece in self.pieces():
+                yield piece
+        return pieces()
+
+
+def new_document(name):
+    return app.db.save_document(name, TEXT, name, len(TEXT.split()))
+
+
+def statuses(events):
+    parsed = [json.loads(event[len('data: '):]) for event in events]
+    return [event.get('status', 'question') for event in parsed]
+
+
+def sync_events(document_id, count):
+    return list(app.stream_questions(app.plan_generation(document_id, count), document_id))
+
+
+def async_events(document_id, count):
+    async def collect():
+        return [event async for event in asgi.stream_questions_async(app.plan_generation(document_id, count), document_id)]
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize('stream', [sync_events, async_events], ids=['flask', 'asgi'])
+def test_both_servers_stream_the_same_events(stream, flaky_model):
+    document_id = new_document(f"stream-{stream.__name__}.txt")
+
+    events = stream(document_id, 3)
+
+    assert statuses(events) == ['planned', 'retrying', 'question', 'question', 'question', 'done']
+    assert len(app.db.get_questions_by_document(document_id)) == 3
+
+
+def test_async_stream_stops_when_the_client_disconnects():
+    document_id = new_document('stream-disconnect.txt')
+    disconnected = asyncio.Event()
+
+    async def collect():
+        events = []
+        async for event in asgi.stream_questions_async(
+            app.plan_generation(document_id, 5), document_id, disconnected=disconnected
+        ):
+            events.append(event)
+            if len(events) == 2:
+                disconnected.set()
+        return events
+
+    assert statuses(asyncio.run(collect())) == ['planned', 'question']
+
+
+def test_async_stream_makes_model_calls_without_a_thread(monkeypatch):
+    document_id = new_document('stream-no-threads.txt')
+
+    def blocking_call(*args, **kwargs):
+        raise AssertionError('the async stream must await the model, not call it on a thread')
+    monkeypatch.setattr(app, 'stream_content', blocking_call)
+    monkeypatch.setattr(app, 'generate_content', blocking_call)
+
+    assert statuses(async_events(document_id, 2)) == ['planned', 'question', 'question', 'done']
+
+
+@pytest.mark.parametrize('stream', [sync_events, async_events], ids=['flask', 'asgi'])
+def test_each_question_is_sent_as_soon_as_it_parses(stream, monkeypatch):
+    document_id = new_document(f"stream-early-{stream.__name__}.txt")
+    log = []
+    monkeypatch.setattr(app, '_generation_model', TwoQuestionModel(log))
+    sse_event = app.sse_event
+
+    def logged_event(payload):
+        if 'question' in payload:
+            log.append('question')
+        return sse_event(payload)
+    monkeypatch.setattr(app, 'sse_event', logged_event)
+
+    assert statuses(stream(document_id, 2)) == ['planned', 'question', 'question', 'done']
+    assert log == ['piece', 'piece', 'question', 'piece', 'piece', 'question']
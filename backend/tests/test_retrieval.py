@@ -0,0 +1,29 @@
+import numpy as np
+
+import app
+
+TEXT = '\n\n'.join(
+    f"Paragraph {i} is about {topic}: the {topic} section explains how {topic} works in some detail here."
+    for i, topic in enumerate(['mitochondria', 'chloroplasts', 'ribosomes', 'vacuoles'] * 3)
+)
+
+
+def test_document_embeddings_are_cached_as_one_float32_matrix():
+    document_id = app.db.save_document('retrieval.txt', TEXT, 'retrieval', len(TEXT.split()))
+    chunks, embeddings, model = app.get_or_create_document_embeddings(document_id)
+
+    assert isinstance(embeddings, np.ndarray) and embeddings.dtype == np.float32
+    assert embeddings.shape[0] == len(chunks)
+    assert app.get_or_create_document_embeddings(document_id)[1] is embeddings
+
+    relevant, chunk_ids, _ = app.retrieve_context('what do ribosomes do', chunks, embeddings, 3, document_id, model)
+    assert 'ribosomes' in relevant[0]
+    assert len(chunk_ids) == 3
+
+
+def test_ranking_reads_only_the_candidate_rows():
+    embeddings = np.eye(4, dtype=np.float32)
+    query = [0.1, 0.9, 0.0, 0.5]
+
+    assert app.rank_by_similarity(query, embeddings) == [1, 3, 0, 2]
+    assert app.rank_by_similarity(query, embeddings, candidates=[0, 3]) == [3, 0]
@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter, since the test session has long imported everything
+CHECK = """
+import os, sys
+import app
+assert 'numpy' not in sys.modules, 'numpy imported by app'
+assert 'google.generativeai' not in sys.modules, 'LLM SDK imported by app'
+assert not os.path.exists(os.environ['DATABASE_PATH']), 'database opened by app'
+app.create_app()
+assert os.path.exists(os.environ['DATABASE_PATH'])
+"""
+
+
+def test_importing_app_opens_no_database_and_no_heavy_modules(tmp_path):
+    env = dict(os.environ, DATABASE_PATH=str(tmp_path / 'startup.db'), LLM_BACKEND='stub', LOG_LEVEL='ERROR')
+    env.pop('DATABASE_URL', None)  # the SQLite file is what shows whether storage was opened
+    subprocess.run([sys.executable, '-c', CHECK], cwd=BACKEND_DIR, env=env, check=True)
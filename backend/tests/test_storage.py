@@ -0,0 +1,186 @@
+import uuid
+
+import pytest
+
+import migrations
+from database import Database, SQLStorage
+
+# The same storage behaviour on both backends. PostgreSQL is the server from
+# the postgres_url fixture (conftest.py): DATABASE_URL, or one started with
+# pgserver. A DATABASE_URL should be a scratch database, since the tests add
+# rows (each under its own new document, so they don't depend on what is there).
+
+
+@pytest.fixture(scope='module', params=['sqlite', 'postgres'])
+def storage(request, tmp_path_factory):
+    if request.param == 'sqlite':
+        yield Database(str(tmp_path_factory.mktemp('storage') / 'storage.db'))
+        return
+    from postgres_database import PostgresDatabase
+    db = PostgresDatabase(request.getfixturevalue('postgres_url'))
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def document_id(storage):
+    name = f"storage-{uuid.uuid4().hex}"
+    return storage.save_document(f"{name}.txt", 'Some text about cells.', name, 4)
+
+
+def question(text, answer='A'):
+    return {
+        'question': text,
+        'options': {'A': 'Nucleus', 'B': 'Cell wall', 'C': 'Ribosome', 'D': 'Vacuole'},
+        'correct_answer': answer,
+        'explanation': 'Because.',
+        'cognitive_level': 'Remember',
+    }
+
+
+def save_questions(storage, document_id, count):
+    return [storage.save_question(document_id, question(f"Question {i}?"), f"hash-{i}") for i in range(count)]
+
+
+def test_backends_must_implement_the_connection_hooks():
+    class Incomplete(SQLStorage):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_schema_is_current(storage):
+    with storage.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT MAX(version) FROM schema_version')
+        assert cursor.fetchone()[0] == migrations.LATEST_VERSION
+
+
+def test_document_round_trip(storage, document_id):
+    storage.content_cache.clear()
+    assert storage.get_document_content(document_id) == 'Some text about cells.'
+    meta = storage.get_document_meta(document_id)
+    assert meta['id'] == document_id
+    assert 'content' not in meta
+    assert storage.find_documents_by_hash([meta['content_hash']]) == {meta['content_hash']: document_id}
+
+
+def test_save_documents_returns_ids_in_order(storage):
+    names = [f"bulk-{uuid.uuid4().hex}" for _ in range(3)]
+    ids = storage.save_documents([
+        {'filename': f"{name}.txt", 'content': name, 'content_hash': name, 'word_count': 1, 'language': 'en',
+         'lexical': ([1], {'word': [(0, 1)]})}
+        for name in names
+    ])
+    assert [storage.get_document_meta(i)['filename'] for i in ids] == [f"{name}.txt" for name in names]
+    assert storage.get_lexical_index(ids[0]) == ([1], {'word': [(0, 1)]})
+
+
+def test_duplicate_question_is_rejected(storage, document_id):
+    first = storage.save_question(document_id, question('Which organelle holds DNA?'), 'same-hash')
+    assert first is not None
+    assert storage.save_question(document_id, question('Which organelle holds DNA?'), 'same-hash') is None
+    assert storage.question_exists(document_id, 'same-hash')
+    assert not storage.question_exists(document_id, 'other-hash')
+
+
+def test_questions_come_back_in_insertion_order(storage, document_id):
+    ids = save_questions(storage, document_id, 5)
+    questions = storage.get_questions_by_document(document_id)
+    assert [q['id'] for q in questions] == ids
+    assert questions[0]['options']['B'] == 'Cell wall'
+    assert [q['id'] for q in storage.get_questions_by_ids(ids[::-1])] == ids[::-1]
+
+
+def test_graded_session(storage, document_id):
+    ids = save_questions(storage, document_id, 3)
+    session_id = storage.start_session(document_id, 3, ids)
+    assert storage.get_session_question_ids(session_id) == ids
+
+    storage.save_attempts(session_id, [(ids[0], 'A', True), (ids[1], 'B', False), (ids[2], 'A', True)])
+    storage.end_session(session_id, 2)
+
+    assert storage.get_document_statistics(document_id) == {
+        'total_questions': 3, 'total_attempts': 3, 'correct_attempts': 2, 'accuracy': 66.67,
+    }
+    details = storage.get_session_details(session_id)
+    assert (details['total'], details['correct']) == (3, 2)
+    assert [wrong['user_answer'] for wrong in details['wrong']] == ['B']
+    history = {entry['id']: entry for entry in storage.get_session_history()}
+    assert history[session_id]['percentage'] == 67
+    assert storage.get_overall_analytics()['total_sessions'] >= 1
+
+    assert storage.delete_session(session_id)
+    assert storage.get_session(session_id) is None
+
+
+def test_conversation_messages(storage, document_id):
+    conversation_id = storage.create_conversation(document_id, 'en', [{'question': 'Q?'}])
+    last = storage.add_conversation_messages(conversation_id, [('user', 'Hi'), ('assistant', 'Hello'), ('user', 'Bye')])
+
+    messages = storage.get_conversation_messages(conversation_id, limit=2)
+    assert [m['content'] for m in messages] == ['Hello', 'Bye']
+    assert messages[-1]['id'] == last
+
+    storage.update_conversation_summary(conversation_id, 'Greetings', messages[0]['id'])
+    conversation = storage.get_conversation(conversation_id)
+    assert conversation['summary'] == 'Greetings'
+    assert conversation['wrong_questions'] == [{'question': 'Q?'}]
+
+
+def test_embedding_batches_round_trip(storage, document_id):
+    storage.save_embedding_batches([(document_id, 0, 'key-0', 'model-a', [[0.5, 1.0], [2.0, -1.5]])])
+    storage.save_embedding_batches([(document_id, 0, 'key-1', 'model-b', [[3.0, 4.0]])])
+    assert storage.get_embedding_batches(document_id) == {0: ('key-1', 'model-b', [[3.0, 4.0]])}
+
+
+def test_writes_bump_table_versions(storage, document_id):
+    before = storage.get_table_versions(migrations.VERSIONED_TABLES)
+    save_questions(storage, document_id, 1)
+    after = storage.get_table_versions(migrations.VERSIONED_TABLES)
+
+    changed = {table for table, old, new in zip(migrations.VERSIONED_TABLES, before, after) if old != new}
+    assert changed == {'questions'}
+
+
+def postgres_only(storage):
+    if isinstance(storage, Database):
+        pytest.skip('PostgreSQL change log')
+    import psycopg2
+    return psycopg2
+
+
+def test_concurrent_writers_do_not_queue_on_the_version_counter(storage, document_id, postgres_url):
+    psycopg2 = postgres_only(storage)
+    first, second = psycopg2.connect(postgres_url), psycopg2.connect(postgres_url)
+    try:
+        before = storage.get_table_versions(['sessions'])[0]
+        first.cursor().execute('INSERT INTO sessions (document_id, total_questions) VALUES (%s, 1)', (document_id,))
+        cursor = second.cursor()
+        # Blocked behind the open transaction's lock this would time out
+        cursor.execute("SET statement_timeout = '2s'")
+        cursor.execute('INSERT INTO sessions (document_id, total_questions) VALUES (%s, 1)', (document_id,))
+        second.commit()
+        # The later transaction committed first; the earlier one's commit must still change the version
+        middle = storage.get_table_versions(['sessions'])[0]
+        first.commit()
+        after = storage.get_table_versions(['sessions'])[0]
+        assert before < middle < after
+    finally:
+        first.close()
+        second.close()
+
+
+def test_folding_the_change_log_keeps_versions(storage, document_id, monkeypatch):
+    postgres_only(storage)
+    import postgres_database
+    monkeypatch.setattr(postgres_database, 'TABLE_CHANGES_FOLD_AT', 3)
+    save_questions(storage, document_id, 4)
+
+    folded = storage.get_table_versions(migrations.VERSIONED_TABLES)
+    assert storage.get_table_versions(migrations.VERSIONED_TABLES) == folded
+    with storage.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM table_changes WHERE name = 'questions'")
+        assert cursor.fetchone()[0] == 0
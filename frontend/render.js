@@ -0,0 +1,217 @@
+// Rendering helpers shared by script.js and render-benchmark.html.
+//
+// VirtualList keeps only the items near the visible area in the DOM (plus
+// `overscan` items either side); everything else is stood in for by two
+// spacer elements sized from measured heights, or an estimate for items not
+// yet seen. New items are appended incrementally, so a streamed question or
+// a chat reply adds one node instead of rebuilding the whole list.
+
+class VirtualList {
+    constructor(container, { renderItem, estimatedHeight = 200, overscan = 3, scroller = null }) {
+        this.container = container;
+        this.renderItem = renderItem;
+        this.estimatedHeight = estimatedHeight;
+        this.overscan = overscan;
+        this.scroller = scroller;
+        this.count = 0;
+        this.heights = [];
+        this.mounted = new Map();
+        this.start = 0;
+        this.end = 0;
+        this.freshFrom = 0;
+        this.frame = null;
+        this.margin = null;
+
+        container.innerHTML = '';
+        this.topSpacer = document.createElement('div');
+        this.bottomSpacer = document.createElement('div');
+        container.append(this.topSpacer, this.bottomSpacer);
+
+        // Scroll events don't bubble, but a capturing listener sees every scroller
+        this.onScroll = () => this.schedule();
+        document.addEventListener('scroll', this.onScroll, { capture: true, passive: true });
+        window.addEventListener('resize', this.onScroll, { passive: true });
+    }
+
+    setCount(count) {
+        for (const node of this.mounted.values()) node.remove();
+        this.mounted.clear();
+        this.count = count;
+        this.heights = new Array(count).fill(null);
+        this.freshFrom = count;
+        this.update();
+    }
+
+    append(added = 1) {
+        this.freshFrom = this.count;
+        this.count += added;
+        for (let i = 0; i < added; i++) this.heights.push(null);
+        this.update();
+        this.freshFrom = this.count;
+    }
+
+    refresh(index) {
+        const node = this.mounted.get(index);
+        if (!node) return;
+        const replacement = this.renderItem(index, false);
+        node.replaceWith(replacement);
+        this.mounted.set(index, replacement);
+        this.measure();
+    }
+
+    itemNode(index) {
+        return this.mounted.get(index) || null;
+    }
+
+    scrollToEnd() {
+        if (!this.scroller) return;
+        this.scroller.scrollTop = this.scroller.scrollHeight;
+        this.update();
+        this.scroller.scrollTop = this.scroller.scrollHeight;
+    }
+
+    destroy() {
+        document.removeEventListener('scroll', this.onScroll, { capture: true });
+        window.removeEventListener('resize', this.onScroll);
+        if (this.frame !== null) cancelAnimationFrame(this.frame);
+        this.mounted.clear();
+        this.container.innerHTML = '';
+    }
+
+    schedule() {
+        if (this.frame === null) {
+            this.frame = requestAnimationFrame(() => this.update());
+        }
+    }
+
+    height(index) {
+        return this.heights[index] ?? this.estimatedHeight;
+    }
+
+    visibleRange() {
+        // In list coordinates: the top spacer's edge is the list's origin wherever it has scrolled to
+        const origin = this.topSpacer.getBoundingClientRect().top;
+        const clip = this.scroller ? this.scroller.getBoundingClientRect() : { top: 0, bottom: window.innerHeight };
+        return [clip.top - origin, clip.bottom - origin];
+    }
+
+    update() {
+        if (this.frame !== null) {
+            cancelAnimationFrame(this.frame);
+            this.frame = null;
+        }
+        const [top, bottom] = this.visibleRange();
+
+        let start = 0;
+        let offset = 0;
+        while (start < this.count - 1 && offset + this.height(start) < top) {
+            offset += this.height(start);
+            start++;
+        }
+        let end = start;
+        while (end < this.count && offset < bottom) {
+            offset += this.height(end);
+            end++;
+        }
+        start = Math.max(0, start - this.overscan);
+        end = Math.min(this.count, Math.max(end, start + 1) + this.overscan);
+
+        for (const [index, node] of this.mounted) {
+            if (index < start || index >= end) {
+                node.remove();
+                this.mounted.delete(index);
+            }
+        }
+        let next = this.bottomSpacer;
+        for (let index = end - 1; index >= start; index--) {
+            let node = this.mounted.get(index);
+            if (!node) {
+                node = this.renderItem(index, index >= this.freshFrom);
+                this.container.insertBefore(node, next);
+                this.mounted.set(index, node);
+            }
+            next = node;
+        }
+        this.start = start;
+        this.end = end;
+        this.measure();
+    }
+
+    measure() {
+        // Hidden lists (display: none) have no layout; keep the estimates until shown
+        if (this.container.offsetParent !== null) {
+            for (const [index, node] of this.mounted) {
+                if (this.margin === null) {
+                    const style = getComputedStyle(node);
+                    this.margin = parseFloat(style.marginTop) + parseFloat(style.marginBottom);
+                }
+                this.heights[index] = node.offsetHeight + this.margin;
+            }
+        }
+        let above = 0;
+        for (let index = 0; index < this.start; index++) above += this.height(index);
+        let below = 0;
+        for (let index = this.end; index < this.count; index++) below += this.height(index);
+        this.topSpacer.style.height = `${above}px`;
+        this.bottomSpacer.style.height = `${below}px`;
+    }
+}
+
+function createQuestionCard(q, index, { selectedAnswer = null, bookmarked = false } = {}) {
+    const card = document.createElement('div');
+    card.className = 'question-card';
+    card.id = `question-${index}`;
+    card.dataset.index = index;
+
+    const optionsHTML = Object.entries(q.options).map(([key, value]) => {
+        const isSelected = selectedAnswer === key;
+        return `
+            <label class="option ${isSelected ? 'selected' : ''}">
+                <input type="radio" name="q_${q.id}" value="${key}" ${isSelected ? 'checked' : ''}>
+                <span><strong>${key}.</strong> ${value}</span>
+            </label>
+        `;
+    }).join('');
+
+    card.innerHTML = `
+        <div class="question-header">
+            <div style="display: flex; align-items: flex-start; gap: 1rem; flex: 1;">
+                <div class="question-number">${index + 1}</div>
+                <div class="question-text">${q.question}</div>
+            </div>
+            <div class="question-actions">
+                <button class="action-btn bookmark-btn ${bookmarked ? 'active' : ''}" data-question-id="${q.id}">
+                    <svg width="16" height="16" viewBox="0 0 24 24" fill="${bookmarked ? 'currentColor' : 'none'}" stroke="currentColor" stroke-width="2" style="pointer-events: none;">
+                        <path d="M19 21l-7-5-7 5V5a2 2 0 0 1 2-2h10a2 2 0 0 1 2 2z"/>
+                    </svg>
+                </button>
+            </div>
+        </div>
+        <div class="options">${optionsHTML}</div>
+    `;
+    return card;
+}
+
+function createChatMessage(msg, animate = true) {
+    const escapedContent = msg.content
+        .replace(/"/g, '&quot;')
+        .replace(/'/g, '&#39;');
+
+    const node = document.createElement('div');
+    node.className = `chat-message ${msg.role}`;
+    if (!animate) node.style.animation = 'none';
+    node.innerHTML = `
+        ${msg.content}
+        ${msg.role === 'assistant' ? `
+            <div style="margin-top: 0.5rem; display: flex; gap: 0.5rem;">
+                <button class="action-btn copy-btn" data-message-content="${escapedContent}">
+                    <svg width="14" height="14" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" style="pointer-events: none;">
+                        <rect x="9" y="9" width="13" height="13" rx="2" ry="2"/>
+                        <path d="M5 15H4a2 2 0 0 1-2-2V4a2 2 0 0 1 2-2h9a2 2 0 0 1 2 2v1"/>
+                    </svg>
+                </button>
+            </div>
+        ` : ''}
+    `;
+    return node;
+}
@@ -12,6 +12,7 @@ const state = {
     bookmarkedQuestions: new Set(),
     results: null,
     chatMessages: [],
+    conversationId: null,
     sessions: [],
     settings: {
         questionCount: 10,
@@ -45,35 +46,90 @@ const translations = {
     }
 };
 
-document.addEventListener('DOMContentLoaded', () => {
-    loadStateFromStorage();
+// State is persisted per record (see store.js): questions, answers and chat
+// messages are written one at a time as they change, and saveState() only
+// writes the scalar fields below whose value differs from what was last saved.
+const store = createStudyStore('studyai');
+const META_FIELDS = [
+    'currentView', 'currentStep', 'language', 'sessionId', 'documentId', 'documentInfo',
+    'results', 'conversationId', 'settings', 'bookmarkedQuestions', 'timer'
+];
+const savedMeta = {};
+
+let questionList = null;
+let chatList = null;
+
+document.addEventListener('DOMContentLoaded', async () => {
+    setTheme(localStorage.getItem('studyai_theme') || 'dark');
+    await loadState();
     setupEventListeners();
     renderUI();
 });
 
-function loadStateFromStorage() {
-    const saved = localStorage.getItem('studyai_state');
-    if (saved) {
-        try {
-            const parsed = JSON.parse(saved);
+async function loadState() {
+    try {
+        const legacy = localStorage.getItem('studyai_state');
+        if (legacy) {
+            // One-time move of the old single-snapshot format into per-record storage
+            const parsed = JSON.parse(legacy);
             Object.assign(state, parsed);
             state.bookmarkedQuestions = new Set(parsed.bookmarkedQuestions || []);
-        } catch (e) {
-            console.error('Failed to load state:', e);
+            state.timer = { ...state.timer, interval: null };
+            saveAllRecords();
+            await store.flush();
+            localStorage.removeItem('studyai_state');
+            return;
+        }
+
+        const loaded = await store.loadAll();
+        for (const [field, value] of loaded.meta) {
+            if (!META_FIELDS.includes(field)) continue;
+            state[field] = value;
+            savedMeta[field] = JSON.stringify(value);
         }
+        state.bookmarkedQuestions = new Set(state.bookmarkedQuestions || []);
+        state.questions = loaded.questions.map(([, question]) => question);
+        state.userAnswers = Object.fromEntries(loaded.answers);
+        state.chatMessages = loaded.chat.map(([, message]) => message);
+    } catch (e) {
+        console.error('Failed to load state:', e);
     }
-    
-    const theme = localStorage.getItem('studyai_theme') || 'dark';
-    setTheme(theme);
+}
+
+function metaValue(field) {
+    if (field === 'bookmarkedQuestions') return Array.from(state.bookmarkedQuestions);
+    if (field === 'timer') return { started: state.timer.started, elapsed: state.timer.elapsed, interval: null };
+    return state[field] ?? null;
 }
 
 function saveState() {
-    const toSave = {
-        ...state,
-        file: null,
-        bookmarkedQuestions: Array.from(state.bookmarkedQuestions)
-    };
-    localStorage.setItem('studyai_state', JSON.stringify(toSave));
+    for (const field of META_FIELDS) {
+        const serialized = JSON.stringify(metaValue(field));
+        if (serialized !== savedMeta[field]) {
+            savedMeta[field] = serialized;
+            store.put('meta', field, JSON.parse(serialized));
+        }
+    }
+}
+
+function saveQuestion(index) {
+    store.put('questions', index, state.questions[index]);
+}
+
+function saveAnswer(questionId) {
+    store.put('answers', String(questionId), state.userAnswers[questionId]);
+}
+
+function saveChatMessage(index) {
+    store.put('chat', index, state.chatMessages[index]);
+}
+
+function saveAllRecords() {
+    saveState();
+    ['questions', 'answers', 'chat'].forEach(name => store.clear(name));
+    state.questions.forEach((_, index) => saveQuestion(index));
+    Object.keys(state.userAnswers).forEach(saveAnswer);
+    state.chatMessages.forEach((_, index) => saveChatMessage(index));
 }
 
 function toggleTheme() {
@@ -115,6 +171,10 @@ function showView(viewName) {
     
     updateStepper(viewName);
     saveState();
+
+    // Lists laid out while hidden were sized from estimates; measure them now
+    if (viewName === 'answering' && questionList) questionList.update();
+    if (viewName === 'discussion' && chatList) chatList.update();
 }
 
 function updateStepper(currentStep) {
@@ -232,6 +292,19 @@ function setupEventListeners() {
         startNewSession();
     });
 
+    document.getElementById('question-list').addEventListener('change', (e) => {
+        if (e.target.type === 'radio') {
+            const qId = e.target.name.replace('q_', '');
+            state.userAnswers[qId] = e.target.value;
+
+            e.target.closest('.question-card').querySelectorAll('.option').forEach(o => o.classList.remove('selected'));
+            e.target.closest('.option').classList.add('selected');
+
+            updateAnsweredCount();
+            saveAnswer(qId);
+        }
+    });
+
     document.getElementById('question-list').addEventListener('click', (e) => {
         const bookmarkBtn = e.target.closest('.bookmark-btn');
         if (bookmarkBtn) {
@@ -325,6 +398,7 @@ function startQuestionGeneration() {
     }
     
     state.questions = [];
+    store.clear('questions');
     showView('generating');
 
     document.getElementById('generating-loader-content').style.display = 'block';
@@ -345,6 +419,12 @@ function startQuestionGeneration() {
     eventSource.onmessage = (event) => {
         const data = JSON.parse(event.data);
 
+        if (data.status === 'planned') {
+            document.getElementById('generating-info').textContent =
+                `Document: ${state.documentInfo.filename} • Generating ${data.total} questions`;
+            return;
+        }
+
         if (data.status === 'done') {
             eventSource.close(); 
             if (!sessionStarted) { 
@@ -370,6 +450,7 @@ function startQuestionGeneration() {
 
         const question = data;
         state.questions.push(question);
+        saveQuestion(state.questions.length - 1);
         
         const item = document.createElement('div');
         item.className = 'session-card';
@@ -424,7 +505,8 @@ async function startNewSession() {
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
                 document_id: state.documentId,
-                total_questions: state.questions.length
+                total_questions: state.questions.length,
+                question_ids: state.questions.map(q => q.id)
             })
         });
         if (!response.ok) throw new Error('Failed to start session');
@@ -442,61 +524,27 @@ async function startNewSession() {
     }
 }
 
+function getQuestionList() {
+    if (!questionList) {
+        questionList = new VirtualList(document.getElementById('question-list'), {
+            estimatedHeight: 280,
+            renderItem: (index) => {
+                const q = state.questions[index];
+                return createQuestionCard(q, index, {
+                    selectedAnswer: state.userAnswers[q.id],
+                    bookmarked: state.bookmarkedQuestions.has(q.id)
+                });
+            }
+        });
+    }
+    return questionList;
+}
+
 function renderQuestions() {
     showView('answering');
     
-    const container = document.getElementById('question-list');
-    container.innerHTML = '';
-    
-    state.questions.forEach((q, index) => {
-        const card = document.createElement('div');
-        card.className = 'question-card';
-        card.id = `question-${index}`;
-        
-        const optionsHTML = Object.entries(q.options).map(([key, value]) => {
-            const isSelected = state.userAnswers[q.id] === key;
-            return `
-                <label class="option ${isSelected ? 'selected' : ''}">
-                    <input type="radio" name="q_${q.id}" value="${key}" ${isSelected ? 'checked' : ''}>
-                    <span><strong>${key}.</strong> ${value}</span>
-                </label>
-            `;
-        }).join('');
-        
-        const isBookmarked = state.bookmarkedQuestions.has(q.id);
-        
-        card.innerHTML = `
-            <div class="question-header">
-                <div style="display: flex; align-items: flex-start; gap: 1rem; flex: 1;">
-                    <div class="question-number">${index + 1}</div>
-                    <div class="question-text">${q.question}</div>
-                </div>
-                <div class="question-actions">
-                    <button class="action-btn bookmark-btn ${isBookmarked ? 'active' : ''}" data-question-id="${q.id}">
-                        <svg width="16" height="16" viewBox="0 0 24 24" fill="${isBookmarked ? 'currentColor' : 'none'}" stroke="currentColor" stroke-width="2" style="pointer-events: none;">
-                            <path d="M19 21l-7-5-7 5V5a2 2 0 0 1 2-2h10a2 2 0 0 1 2 2z"/>
-                        </svg>
-                    </button>
-                </div>
-            </div>
-            <div class="options">${optionsHTML}</div>
-        `;
-        
-        container.appendChild(card);
-    });
-    
-    container.addEventListener('change', (e) => {
-        if (e.target.type === 'radio') {
-            const qId = e.target.name.replace('q_', '');
-            state.userAnswers[qId] = e.target.value;
-            
-            e.target.closest('.question-card').querySelectorAll('.option').forEach(o => o.classList.remove('selected'));
-            e.target.closest('.option').classList.add('selected');
-            
-            updateAnsweredCount();
-            saveState();
-        }
-    });
+    // Only the cards near the viewport are in the DOM; see render.js
+    getQuestionList().setCount(state.questions.length);
     
     updateAnsweredCount();
     
@@ -580,6 +628,7 @@ async function submitAnswers() {
         
         state.results = await response.json();
         state.results.timeTaken = state.timer.elapsed;
+        state.conversationId = null;
         
         renderResults();
         saveState();
@@ -762,6 +811,7 @@ function saveAndExit() {
 
 function retryQuiz() {
     state.userAnswers = {};
+    store.clear('answers');
     state.bookmarkedQuestions.clear();
     state.timer.elapsed = 0;
     renderQuestions();
@@ -779,6 +829,7 @@ function newSession() {
     state.bookmarkedQuestions.clear();
     state.results = null;
     state.chatMessages = [];
+    state.conversationId = null;
     state.timer = { started: null, elapsed: 0, interval: null };
     
     document.getElementById('file-input').value = '';
@@ -786,17 +837,34 @@ function newSession() {
     document.getElementById('upload-btn').disabled = true;
     document.getElementById('start-generation-btn').disabled = true;
     
-    saveState();
+    if (chatList) chatList.setCount(0);
+    saveAllRecords();
     showView('upload');
     renderActiveSession();
 }
 
+function buildChatRequest(message) {
+    // The server keeps the conversation; only the first turn carries the quiz context.
+    const body = {
+        document_id: state.documentId,
+        message: message,
+        language: state.language
+    };
+    if (state.conversationId) {
+        body.conversation_id = state.conversationId;
+    } else {
+        body.wrong_questions = state.results?.wrong || [];
+    }
+    return body;
+}
+
 async function sendChatMessage() {
     const input = document.getElementById('chat-input');
     const message = input.value.trim();
     if (!message) return;
     
     state.chatMessages.push({ role: 'user', content: message });
+    saveChatMessage(state.chatMessages.length - 1);
     renderChatMessages();
     input.value = '';
     
@@ -807,63 +875,60 @@ async function sendChatMessage() {
         const response = await fetch(`${API_URL}/chat`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                document_id: state.documentId,
-                message: message,
-                history: state.chatMessages,
-                wrong_questions: state.results?.wrong || [],
-                language: state.language
-            })
+            body: JSON.stringify(buildChatRequest(message))
         });
         
+        if (response.status === 404 && state.conversationId) {
+            state.conversationId = null;
+        }
         if (!response.ok) throw new Error('Chat failed');
         
         const data = await response.json();
+        state.conversationId = data.conversation_id || null;
         state.chatMessages.push({ role: 'assistant', content: data.response });
+        saveChatMessage(state.chatMessages.length - 1);
         renderChatMessages();
         saveState();
     } catch (error) {
         state.chatMessages.push({ role: 'assistant', content: 'Sorry, I encountered an error. Please try again.' });
+        saveChatMessage(state.chatMessages.length - 1);
         renderChatMessages();
     } finally {
         btn.disabled = false;
     }
 }
 
+function getChatList() {
+    if (!chatList) {
+        const container = document.getElementById('chat-messages');
+        chatList = new VirtualList(container, {
+            estimatedHeight: 96,
+            overscan: 6,
+            scroller: container,
+            renderItem: (index, isNew) => createChatMessage(state.chatMessages[index], isNew)
+        });
+    }
+    return chatList;
+}
+
 function renderChatMessages() {
-    const container = document.getElementById('chat-messages');
-    
     if (state.chatMessages.length === 0) {
         const initialMsg = state.results?.wrong.length > 0
             ? `I see you got ${state.results.wrong.length} question(s) incorrect. Would you like to discuss any of them?`
             : '🎉 Perfect score! Do you have any questions about the topic?';
         
         state.chatMessages.push({ role: 'assistant', content: initialMsg });
+        saveChatMessage(0);
     }
     
-    container.innerHTML = state.chatMessages.map(msg => {
-        const escapedContent = msg.content
-            .replace(/"/g, '&quot;')
-            .replace(/'/g, '&#39;');
-
-        return `
-            <div class="chat-message ${msg.role}">
-                ${msg.content}
-                ${msg.role === 'assistant' ? `
-                    <div style="margin-top: 0.5rem; display: flex; gap: 0.5rem;">
-                        <button class="action-btn copy-btn" data-message-content="${escapedContent}">
-                            <svg width="14" height="14" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" style="pointer-events: none;">
-                                <rect x="9" y="9" width="13" height="13" rx="2" ry="2"/>
-                                <path d="M5 15H4a2 2 0 0 1-2-2V4a2 2 0 0 1 2-2h9a2 2 0 0 1 2 2v1"/>
-                            </svg>
-                        </button>
-                    </div>
-                ` : ''}
-            </div>
-        `;
-    }).join('');
-    
-    container.scrollTop = container.scrollHeight;
+    // New messages are appended to what is already rendered; only a reset rebuilds
+    const list = getChatList();
+    if (list.count > 0 && state.chatMessages.length > list.count) {
+        list.append(state.chatMessages.length - list.count);
+    } else {
+        list.setCount(state.chatMessages.length);
+    }
+    list.scrollToEnd();
 }
 
 function copyMessage(text) {
@@ -938,7 +1003,7 @@ function handleKeyboardShortcut(e) {
         const currentQuestion = document.querySelector('.question-card');
         if (currentQuestion) {
             const nextQuestion = currentQuestion.nextElementSibling;
-            if (nextQuestion) {
+            if (nextQuestion && nextQuestion.matches('.question-card')) {
                 nextQuestion.scrollIntoView({ behavior: 'smooth', block: 'center' });
             }
         }
@@ -954,7 +1019,7 @@ function showHelp() {
 • Enter: Submit (when in chat)
 
 Features:
-• Auto-save every 30 seconds
+• Progress saved as you answer
 • Dark/Light theme toggle
 • Multi-language support
 • Session history tracking
@@ -986,6 +1051,7 @@ async function loadSessionResults(sessionId) {
         
         const results = await response.json();
         state.results = results;
+        state.conversationId = null;
         state.timer.elapsed = 0; 
         state.results.timeTaken = 0; 
         
@@ -1015,8 +1081,3 @@ async function deleteSession(sessionId) {
     }
 }
 
-setInterval(() => {
-    if (state.documentId) {
-        saveState();
-    }
-}, 30000);
@@ -0,0 +1,175 @@
+// Client-side persistence for script.js, one record per question, answer and
+// chat message instead of one JSON snapshot of the whole state.
+//
+// Writes are queued and committed together in a single IndexedDB transaction
+// after the current task, so picking an answer costs one small put off the
+// main thread rather than re-serializing every question and the chat log.
+// Where IndexedDB is unavailable (private windows in some browsers, file://
+// in others) the same records are kept in localStorage under
+// `<name>:<store>:<key>`, which is still per-record.
+//
+//   meta       scalar state (view, ids, settings, results, bookmarks, ...) by field name
+//   questions  generated questions by position
+//   answers    selected option by question id
+//   chat       chat messages by position
+
+const STUDY_STORES = ['meta', 'questions', 'answers', 'chat'];
+const STUDY_DB_VERSION = 1;
+
+function openStudyDatabase(name) {
+    return new Promise((resolve, reject) => {
+        if (typeof indexedDB === 'undefined') {
+            reject(new Error('IndexedDB is not available'));
+            return;
+        }
+        const request = indexedDB.open(name, STUDY_DB_VERSION);
+        request.onupgradeneeded = () => {
+            for (const store of STUDY_STORES) {
+                if (!request.result.objectStoreNames.contains(store)) {
+                    request.result.createObjectStore(store);
+                }
+            }
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+        request.onblocked = () => reject(new Error('IndexedDB upgrade blocked by another tab'));
+    });
+}
+
+class IndexedDBBackend {
+    constructor(db) {
+        this.db = db;
+    }
+
+    commit(ops) {
+        return new Promise((resolve, reject) => {
+            const stores = [...new Set(ops.map(op => op.store))];
+            const tx = this.db.transaction(stores, 'readwrite');
+            for (const op of ops) {
+                const store = tx.objectStore(op.store);
+                if (op.type === 'put') store.put(op.value, op.key);
+                else if (op.type === 'remove') store.delete(op.key);
+                else store.clear();
+            }
+            tx.oncomplete = () => resolve();
+            tx.onerror = () => reject(tx.error);
+            tx.onabort = () => reject(tx.error);
+        });
+    }
+
+    loadAll() {
+        return new Promise((resolve, reject) => {
+            const tx = this.db.transaction(STUDY_STORES, 'readonly');
+            const loaded = {};
+            for (const name of STUDY_STORES) {
+                const store = tx.objectStore(name);
+                const keys = store.getAllKeys();
+                const values = store.getAll();
+                values.onsuccess = () => {
+                    loaded[name] = keys.result.map((key, i) => [key, values.result[i]]);
+                };
+            }
+            tx.oncomplete = () => resolve(loaded);
+            tx.onerror = () => reject(tx.error);
+        });
+    }
+}
+
+class LocalStorageBackend {
+    constructor(name) {
+        this.prefix = `${name}:`;
+    }
+
+    commit(ops) {
+        for (const op of ops) {
+            if (op.type === 'put') {
+                localStorage.setItem(this.itemKey(op.store, op.key), JSON.stringify(op.value));
+            } else if (op.type === 'remove') {
+                localStorage.removeItem(this.itemKey(op.store, op.key));
+            } else {
+                const prefix = `${this.prefix}${op.store}:`;
+                Object.keys(localStorage)
+                    .filter(key => key.startsWith(prefix))
+                    .forEach(key => localStorage.removeItem(key));
+            }
+        }
+        return Promise.resolve();
+    }
+
+    loadAll() {
+        const loaded = Object.fromEntries(STUDY_STORES.map(store => [store, []]));
+        for (const itemKey of Object.keys(localStorage)) {
+            if (!itemKey.startsWith(this.prefix)) continue;
+            const [store, key] = this.splitKey(itemKey.slice(this.prefix.length));
+            if (!loaded[store]) continue;
+            try {
+                loaded[store].push([key, JSON.parse(localStorage.getItem(itemKey))]);
+            } catch (e) {
+                console.error('Skipping unreadable record:', itemKey, e);
+            }
+        }
+        for (const store of STUDY_STORES) {
+            loaded[store].sort((a, b) => (a[0] < b[0] ? -1 : a[0] > b[0] ? 1 : 0));
+        }
+        return Promise.resolve(loaded);
+    }
+
+    itemKey(store, key) {
+        // Numeric keys are tagged so positions come back as numbers and sort in order
+        return typeof key === 'number'
+            ? `${this.prefix}${store}:#${String(key).padStart(8, '0')}`
+            : `${this.prefix}${store}:${key}`;
+    }
+
+    splitKey(rest) {
+        const separator = rest.indexOf(':');
+        const store = rest.slice(0, separator);
+        const key = rest.slice(separator + 1);
+        return [store, key.startsWith('#') ? Number(key.slice(1)) : key];
+    }
+}
+
+function createStudyStore(name = 'studyai') {
+    let pending = [];
+    let scheduled = null;
+
+    const backend = openStudyDatabase(name)
+        .then(db => new IndexedDBBackend(db))
+        .catch(error => {
+            console.warn('Falling back to localStorage:', error);
+            return new LocalStorageBackend(name);
+        });
+
+    function enqueue(op) {
+        pending.push(op);
+        if (!scheduled) {
+            scheduled = new Promise(resolve => setTimeout(resolve, 0)).then(commit);
+        }
+        return scheduled;
+    }
+
+    async function commit() {
+        const ops = pending;
+        pending = [];
+        scheduled = null;
+        if (ops.length === 0) return;
+        try {
+            await (await backend).commit(ops);
+        } catch (e) {
+            console.error('Failed to save state:', e);
+        }
+    }
+
+    return {
+        put: (store, key, value) => enqueue({ type: 'put', store, key, value }),
+        remove: (store, key) => enqueue({ type: 'remove', store, key }),
+        clear: store => enqueue({ type: 'clear', store }),
+        flush: () => scheduled || Promise.resolve(),
+        async loadAll() {
+            // Records queued before the load are part of what it should see
+            await (scheduled || Promise.resolve());
+            return (await backend).loadAll();
+        },
+        backend
+    };
+}